@@ -106,6 +106,14 @@ MEDIA_ROOT = os.path.join(BASE_DIR, "media")
 
 SITE_URL = os.getenv("SITE_URL")
 
+# Квитки (PDF)
+TICKET_PDF_MODE = os.getenv("TICKET_PDF_MODE", "raster")  # raster | compact
+TICKET_QR_MODE = os.getenv("TICKET_QR_MODE", "raster")  # raster | vector
+TICKET_PDF_DPI = int(os.getenv("TICKET_PDF_DPI", 150))
+TICKET_PDF_JPEG_QUALITY = int(os.getenv("TICKET_PDF_JPEG_QUALITY", 85))
+TICKET_CACHE_DIR = os.getenv("TICKET_CACHE_DIR", os.path.join(MEDIA_ROOT, "ticket_cache"))
+TICKET_PDF_CACHE_MAX_BYTES = int(os.getenv("TICKET_PDF_CACHE_MAX_BYTES", 200 * 1024 * 1024))
+
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 # WayForPay налаштування
@@ -115,6 +123,18 @@ WAYFORPAY_SECRET_KEY = os.getenv("WAYFORPAY_SECRET_KEY")
 WAYFORPAY_DOMAIN = os.getenv("WAYFORPAY_DOMAIN")
 WAYFORPAY_RETURN_URL = os.getenv("WAYFORPAY_RETURN_URL")
 WAYFORPAY_SERVICE_URL = os.getenv("WAYFORPAY_SERVICE_URL")
+# Скільки STATUS-запитів regularApi sync_wayforpay_subscriptions тримає одночасно
+WAYFORPAY_SYNC_CONCURRENCY = int(os.getenv("WAYFORPAY_SYNC_CONCURRENCY", 8))
+# Розклад синхронізації підписок (Subscription.next_sync_at), години:
+# біля nextPaymentDate (± вікно) — часто, активні між списаннями — раз на IDLE,
+# suspended — рідко, removed/completed — раз на TERMINAL_DAYS днів (0 — ніколи)
+SUBSCRIPTION_SYNC_PAYMENT_WINDOW_HOURS = float(os.getenv("SUBSCRIPTION_SYNC_PAYMENT_WINDOW_HOURS", 24))
+SUBSCRIPTION_SYNC_NEAR_PAYMENT_HOURS = float(os.getenv("SUBSCRIPTION_SYNC_NEAR_PAYMENT_HOURS", 2))
+SUBSCRIPTION_SYNC_IDLE_HOURS = float(os.getenv("SUBSCRIPTION_SYNC_IDLE_HOURS", 72))
+SUBSCRIPTION_SYNC_DEFAULT_HOURS = float(os.getenv("SUBSCRIPTION_SYNC_DEFAULT_HOURS", 24))
+SUBSCRIPTION_SYNC_SUSPENDED_HOURS = float(os.getenv("SUBSCRIPTION_SYNC_SUSPENDED_HOURS", 72))
+SUBSCRIPTION_SYNC_TERMINAL_DAYS = int(os.getenv("SUBSCRIPTION_SYNC_TERMINAL_DAYS", 30))
+SUBSCRIPTION_SYNC_RETRY_MINUTES = int(os.getenv("SUBSCRIPTION_SYNC_RETRY_MINUTES", 60))
 
 INTERNAL_API_KEY = os.getenv("INTERNAL_API_KEY")
 
@@ -128,8 +148,54 @@ KEYCRM_PAID_STATUS_ID = int(os.getenv('KEYCRM_PAID_STATUS_ID'))
 KEYCRM_SUBSCRIPTION_PIPELINE_ID = int(os.getenv("KEYCRM_SUBSCRIPTION_PIPELINE_ID"))
 KEYCRM_SUBSCRIPTION_PAID_STATUS_ID = int(os.getenv('KEYCRM_SUBSCRIPTION_PAID_STATUS_ID'))
 
+# HTTP до KeyCRM: спільна сесія на процес з пулом keep-alive зʼєднань
+# (payments/services/keycrm_http.py), окремі таймаути зʼєднання і читання
+KEYCRM_API_URL = os.getenv("KEYCRM_API_URL", "https://openapi.keycrm.app/v1")
+KEYCRM_HTTP_POOL_SIZE = int(os.getenv("KEYCRM_HTTP_POOL_SIZE", 10))
+KEYCRM_CONNECT_TIMEOUT = float(os.getenv("KEYCRM_CONNECT_TIMEOUT", 5))
+KEYCRM_READ_TIMEOUT = float(os.getenv("KEYCRM_READ_TIMEOUT", 20))
+# Ліміт запитів до KeyCRM на процес (token bucket; 0 — вимкнено). Ліміт KeyCRM
+# діє на весь API-ключ, тож ділимо його на кількість процесів, що ходять у KeyCRM.
+# RESERVE — скільки токенів кожен нижчий пріоритет лишає вищому (оплати > інше > ліди)
+KEYCRM_RATE_LIMIT_PER_SECOND = float(os.getenv("KEYCRM_RATE_LIMIT_PER_SECOND", 1))
+KEYCRM_RATE_LIMIT_BURST = int(os.getenv("KEYCRM_RATE_LIMIT_BURST", 5))
+KEYCRM_RATE_LIMIT_RESERVE = int(os.getenv("KEYCRM_RATE_LIMIT_RESERVE", 1))
+KEYCRM_RATE_LIMIT_MAX_WAIT = float(os.getenv("KEYCRM_RATE_LIMIT_MAX_WAIT", 30))
+# Повтори на 429/5xx: Retry-After або експоненційна затримка з jitter
+KEYCRM_MAX_RETRIES = int(os.getenv("KEYCRM_MAX_RETRIES", 3))
+KEYCRM_RETRY_BASE_SECONDS = float(os.getenv("KEYCRM_RETRY_BASE_SECONDS", 0.5))
+KEYCRM_RETRY_MAX_SECONDS = float(os.getenv("KEYCRM_RETRY_MAX_SECONDS", 30))
+# Бюджет повторів на процес: +RATIO повтору на кожен виклик, +PER_SECOND щосекунди, не більше MAX
+KEYCRM_RETRY_BUDGET_RATIO = float(os.getenv("KEYCRM_RETRY_BUDGET_RATIO", 0.2))
+KEYCRM_RETRY_BUDGET_PER_SECOND = float(os.getenv("KEYCRM_RETRY_BUDGET_PER_SECOND", 0.2))
+KEYCRM_RETRY_BUDGET_MAX = float(os.getenv("KEYCRM_RETRY_BUDGET_MAX", 10))
+# Виклики KeyCRM у webhook WayForPay: скільки секунд чекати токен ліміту (без повторів)
+KEYCRM_CALLBACK_MAX_WAIT = float(os.getenv("KEYCRM_CALLBACK_MAX_WAIT", 2))
+
+# Звірка оплат з KeyCRM (reconcile_keycrm_payments)
+KEYCRM_RECONCILE_INTERVAL_SECONDS = int(os.getenv("KEYCRM_RECONCILE_INTERVAL_SECONDS", 60))
+KEYCRM_RECONCILE_DEADLINE_SECONDS = int(os.getenv("KEYCRM_RECONCILE_DEADLINE_SECONDS", 600))
+# Скільки сторінок нових зовнішніх транзакцій дочитувати перед пачкою звірки
+# (повну синхронізацію робить python manage.py sync_keycrm_transactions)
+KEYCRM_TRANSACTIONS_SYNC_PAGES = int(os.getenv("KEYCRM_TRANSACTIONS_SYNC_PAGES", 3))
+# Ліди KeyCRM з форм створює python manage.py create_keycrm_leads --loop;
+# скільки запитів до KeyCRM виконувати паралельно
+KEYCRM_LEAD_CONCURRENCY = int(os.getenv("KEYCRM_LEAD_CONCURRENCY", 4))
+
 # Email налаштування
-EMAIL_BACKEND = "django.core.mail.backends.smtp.EmailBackend"
+# Пул SMTP-зʼєднань на процес (payments/services/mailer.py)
+EMAIL_BACKEND = os.getenv("EMAIL_BACKEND", "payments.services.mailer.PooledSMTPBackend")
+EMAIL_POOL_SIZE = int(os.getenv("EMAIL_POOL_SIZE", 2))
+EMAIL_POOL_IDLE_SECONDS = int(os.getenv("EMAIL_POOL_IDLE_SECONDS", 60))
+EMAIL_TIMEOUT = int(os.getenv("EMAIL_TIMEOUT", 30))
+
+# Масові розсилки: розмір BCC-пачки (отримувачів в одному листі) та ліміт пачок на секунду —
+# отримувачів на секунду виходить BATCH_SIZE * BATCHES_PER_SECOND
+EMAIL_CAMPAIGN_BATCH_SIZE = int(os.getenv("EMAIL_CAMPAIGN_BATCH_SIZE", 100))
+EMAIL_CAMPAIGN_BATCHES_PER_SECOND = float(os.getenv("EMAIL_CAMPAIGN_BATCHES_PER_SECOND", 1))
+# Спроби надіслати пачку до позначення її отримувачів як failed, пауза між ними росте вдвічі
+EMAIL_CAMPAIGN_BATCH_ATTEMPTS = int(os.getenv("EMAIL_CAMPAIGN_BATCH_ATTEMPTS", 3))
+EMAIL_CAMPAIGN_RETRY_DELAY_SECONDS = float(os.getenv("EMAIL_CAMPAIGN_RETRY_DELAY_SECONDS", 5))
 EMAIL_HOST = os.getenv("EMAIL_HOST", "smtp.gmail.com")
 EMAIL_PORT = int(os.getenv("EMAIL_PORT", 587))
 EMAIL_USE_TLS = os.getenv("EMAIL_USE_TLS", "True") == "True"
@@ -137,6 +203,29 @@ EMAIL_HOST_USER = os.getenv("EMAIL_HOST_USER")
 EMAIL_HOST_PASSWORD = os.getenv("EMAIL_HOST_PASSWORD")
 DEFAULT_FROM_EMAIL = os.getenv("DEFAULT_FROM_EMAIL", EMAIL_HOST_USER)
 
+# Фонові завдання (outbox), воркер: python manage.py run_outbox_worker
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", 5))
+OUTBOX_RETRY_BASE_SECONDS = int(os.getenv("OUTBOX_RETRY_BASE_SECONDS", 30))
+OUTBOX_RETRY_MAX_SECONDS = int(os.getenv("OUTBOX_RETRY_MAX_SECONDS", 3600))
+OUTBOX_LOCK_TIMEOUT_SECONDS = int(os.getenv("OUTBOX_LOCK_TIMEOUT_SECONDS", 600))
+
+# Броні квитків: час броні за замовчуванням (якщо в події не задано),
+# прострочені броні звільняє python manage.py expire_reservations --loop
+TICKET_RESERVATION_TTL_MINUTES = int(os.getenv("TICKET_RESERVATION_TTL_MINUTES", 10))
+TICKET_RESERVATION_SWEEP_BATCH_SIZE = int(os.getenv("TICKET_RESERVATION_SWEEP_BATCH_SIZE", 500))
+# Де живуть броні: БД (лічильник події), памʼять процесу або Redis
+TICKET_RESERVATION_BACKEND = os.getenv(
+    "TICKET_RESERVATION_BACKEND", "payments.services.reservations.DatabaseReservationBackend"
+)
+TICKET_RESERVATION_REDIS_URL = os.getenv("TICKET_RESERVATION_REDIS_URL", "redis://localhost:6379/0")
+
+# Логування платежів: callback пише один підсумковий запис; повні payload-и —
+# лише з PAYMENTS_LOG_PAYLOADS=True на рівні DEBUG, детальна діагностика —
+# для частки запитів PAYMENTS_LOG_SAMPLE_RATE (0..1)
+PAYMENTS_LOG_LEVEL = os.getenv("PAYMENTS_LOG_LEVEL", "INFO")
+PAYMENTS_LOG_PAYLOADS = os.getenv("PAYMENTS_LOG_PAYLOADS", "False") == "True"
+PAYMENTS_LOG_SAMPLE_RATE = float(os.getenv("PAYMENTS_LOG_SAMPLE_RATE", 0.01))
+
 # Логування
 LOGGING = {
     'version': 1,
@@ -153,9 +242,13 @@ LOGGING = {
     'loggers': {
         'payments': {
             'handlers': ['console'],
-            'level': 'INFO',
+            'level': PAYMENTS_LOG_LEVEL,
             'propagate': False,
         },
+        # httpx пише INFO-рядок на кожен запит — для синхронізації підписок це тисячі рядків
+        'httpx': {
+            'level': 'WARNING',
+        },
     },
 }
 
@@ -1,14 +1,30 @@
-from django.contrib import admin
-from .models import TicketScanLog, SubscriptionOrder, Subscription, Event, TicketOrder
+from django.contrib import admin, messages
+from .models import (
+    TicketScanLog, SubscriptionOrder, Subscription, Event, TicketOrder, OutboxJob, EmailCampaign, WebhookInbox,
+    KeyCRMExternalTransaction,
+    KeyCRMTransactionSyncState,
+)
 from django.utils.html import format_html
+from .services.inventory import recount_reserved
+from .services.webhook_inbox import replay_webhook
 
 
 @admin.register(Event)
 class EventAdmin(admin.ModelAdmin):
-    list_display = ("title", "date", "location", "price", "max_tickets", "is_active")
+    list_display = (
+        "title", "date", "location", "price", "max_tickets", "tickets_reserved", "reservation_ttl_minutes", "is_active"
+    )
     list_editable = ("is_active",)
+    readonly_fields = ("tickets_reserved", "last_ticket_number")
     search_fields = ("title",)
     ordering = ("-date",)
+    actions = ["recount_tickets_reserved"]
+
+    @admin.action(description="Перерахувати зайняті місця")
+    def recount_tickets_reserved(self, request, queryset):
+        for event in queryset:
+            reserved = recount_reserved(event)
+            self.message_user(request, f"{event.title}: зайнято {reserved} з {event.max_tickets}", messages.INFO)
 
 
 @admin.register(TicketOrder)
@@ -63,7 +79,7 @@ class TicketOrderAdmin(admin.ModelAdmin):
         }),
     )
 
-    actions = ['verify_tickets', 'unverify_tickets']
+    actions = ['verify_tickets', 'unverify_tickets', 'download_ticket_pdf', 'resend_ticket_email']
 
     def is_verified_badge(self, obj):
         """Відображення статусу підтвердження"""
@@ -96,6 +112,34 @@ class TicketOrderAdmin(admin.ModelAdmin):
 
     unverify_tickets.short_description = '✗ Скасувати підтвердження'
 
+    def download_ticket_pdf(self, request, queryset):
+        """Завантаження PDF квитка (з кешу, якщо вже згенерований)"""
+        from django.http import HttpResponse
+        from .ticket_utils import get_ticket_pdf_bytes
+
+        if queryset.count() != 1:
+            self.message_user(request, 'Виберіть один квиток', level=messages.WARNING)
+            return None
+
+        order = queryset.select_related('event').first()
+        response = HttpResponse(get_ticket_pdf_bytes(order), content_type='application/pdf')
+        response['Content-Disposition'] = f'attachment; filename="ticket_{order.id}.pdf"'
+        return response
+
+    download_ticket_pdf.short_description = '⬇ Завантажити PDF квитка'
+
+    def resend_ticket_email(self, request, queryset):
+        """Повторна відправка квитка через чергу"""
+        from .services.outbox import enqueue
+
+        count = 0
+        for order in queryset.filter(payment_status='success'):
+            enqueue('ticket_paid', {'order_id': order.id, 'resend': True})
+            count += 1
+        self.message_user(request, f'Поставлено в чергу на повторну відправку: {count}')
+
+    resend_ticket_email.short_description = '✉ Надіслати квиток повторно'
+
     def get_readonly_fields(self, request, obj=None):
         if obj:  # editing an existing object
             return self.readonly_fields + ['name', 'email', 'phone', 'device_type']
@@ -197,14 +241,99 @@ class SubscriptionAdmin(admin.ModelAdmin):
         'last_payed_date',
         'created_at',
         'last_sync_at',
+        'next_sync_at',
     ]
     list_filter = ['status', 'mode', 'currency', 'last_sync_at']
     search_fields = ['email', 'phone', 'order_reference']
     readonly_fields = ['order_reference', 'created_at', 'updated_at', 'last_sync_at', 'last_sync_raw']
     ordering = ['-updated_at']
+    actions = ['sync_now']
+
+    def sync_now(self, request, queryset):
+        """Поставити вибрані підписки на найближчий запуск sync_wayforpay_subscriptions"""
+        from django.utils import timezone
+        count = queryset.update(next_sync_at=timezone.now())
+        self.message_user(request, f'Поставлено в чергу синхронізації: {count}')
+
+    sync_now.short_description = '↻ Синхронізувати з WayForPay'
 
     @admin.display(description="Оплата (Created)", ordering="source_order__created_at")
     def purchase_date(self, obj):
         if obj.source_order and obj.source_order.created_at:
             return obj.source_order.created_at
         return None
+
+
+@admin.register(OutboxJob)
+class OutboxJobAdmin(admin.ModelAdmin):
+    list_display = ['id', 'kind', 'status', 'attempts', 'max_attempts', 'run_after', 'created_at', 'updated_at']
+    list_filter = ['kind', 'status', 'created_at']
+    search_fields = ['id', 'payload']
+    readonly_fields = ['created_at', 'updated_at', 'locked_at', 'last_error']
+    ordering = ['-created_at']
+    actions = ['retry_jobs']
+
+    def retry_jobs(self, request, queryset):
+        """Повторний запуск вибраних завдань"""
+        from django.utils import timezone
+        count = queryset.exclude(status='running').update(
+            status='pending', attempts=0, run_after=timezone.now(), last_error=''
+        )
+        self.message_user(request, f'Поставлено в чергу повторно: {count}')
+
+    retry_jobs.short_description = '↻ Запустити повторно'
+
+
+@admin.register(EmailCampaign)
+class EmailCampaignAdmin(admin.ModelAdmin):
+    list_display = ['id', 'subject', 'status', 'total', 'sent', 'failed', 'created_at', 'finished_at']
+    list_filter = ['status', 'created_at']
+    search_fields = ['subject']
+    readonly_fields = ['status', 'recipients_loaded', 'total', 'sent', 'failed', 'created_at', 'started_at', 'finished_at']
+    ordering = ['-created_at']
+
+
+@admin.register(WebhookInbox)
+class WebhookInboxAdmin(admin.ModelAdmin):
+    list_display = [
+        'id', 'source', 'order_reference', 'transaction_status', 'status',
+        'attempts', 'duplicates', 'received_at', 'processed_at'
+    ]
+    list_filter = ['source', 'status', 'transaction_status', 'received_at']
+    search_fields = ['order_reference']
+    readonly_fields = [
+        'source', 'order_reference', 'transaction_status', 'processing_date', 'payload', 'status',
+        'attempts', 'duplicates', 'last_error', 'received_at', 'updated_at', 'processed_at'
+    ]
+    ordering = ['-received_at']
+    actions = ['replay_entries']
+
+    def replay_entries(self, request, queryset):
+        """Повторна обробка вибраних callback-ів"""
+        for entry in queryset:
+            response = replay_webhook(entry)
+            level = messages.SUCCESS if response.status_code == 200 else messages.WARNING
+            self.message_user(request, f'{entry}: HTTP {response.status_code}', level)
+
+    replay_entries.short_description = '↻ Обробити повторно'
+
+
+@admin.register(KeyCRMExternalTransaction)
+class KeyCRMExternalTransactionAdmin(admin.ModelAdmin):
+    list_display = [
+        'keycrm_id', 'amount', 'currency', 'order_reference', 'order_number', 'auth_code',
+        'attached_payment_id', 'keycrm_created_at', 'synced_at'
+    ]
+    list_filter = ['currency', 'keycrm_created_at']
+    search_fields = ['=keycrm_id', 'order_reference', '=auth_code', 'uuid', 'description']
+    readonly_fields = [
+        'keycrm_id', 'uuid', 'amount', 'currency', 'description', 'order_reference', 'order_number', 'auth_code',
+        'attached_payment_id', 'keycrm_created_at', 'payload', 'synced_at'
+    ]
+    ordering = ['-keycrm_id']
+
+
+@admin.register(KeyCRMTransactionSyncState)
+class KeyCRMTransactionSyncStateAdmin(admin.ModelAdmin):
+    list_display = ['id', 'high_water_id', 'pending_top_id', 'pending_low_id', 'pending_read', 'updated_at']
+    readonly_fields = ['updated_at']
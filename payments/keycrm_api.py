@@ -2,60 +2,85 @@ import requests
 import logging
 from django.conf import settings
 
+from .services.keycrm_http import PRIORITY_DEFAULT, PRIORITY_LEAD, PRIORITY_PAYMENT, get_keycrm_session
+
 logger = logging.getLogger(__name__)
 
 
 class KeyCRMAPI:
     """Клас для інтеграції з KeyCRM API"""
 
-    def __init__(self):
+    def __init__(self, max_retries=None, max_wait=None):
+        """
+        max_retries / max_wait — перевизначення повторів і очікування ліміту для
+        всіх викликів цього клієнта (None — налаштування сесії).
+        """
         self.api_token = settings.KEYCRM_API_TOKEN
-        self.base_url = "https://openapi.keycrm.app/v1"
+        self.base_url = getattr(settings, "KEYCRM_API_URL", "https://openapi.keycrm.app/v1")
         self.headers = {
             "Authorization": f"Bearer {self.api_token}",
             "Content-Type": "application/json"
         }
-
-    def create_pipeline_card(self, data):
-        """Створення картки (лід) у воронці KeyCRM."""
+        # Спільна сесія процесу: keep-alive пул, окремі таймаути зʼєднання/читання,
+        # ліміт запитів з пріоритетами і повтори на 429/5xx
+        self.http = get_keycrm_session()
+        self.request_options = {}
+        if max_retries is not None:
+            self.request_options["max_retries"] = max_retries
+        if max_wait is not None:
+            self.request_options["max_wait"] = max_wait
+
+    def _request(self, method, url, priority=PRIORITY_DEFAULT, **kwargs):
+        return self.http.request(
+            method, url, priority=priority, headers=self.headers, **self.request_options, **kwargs
+        )
+
+    def create_pipeline_card(self, data, raise_errors=False):
+        """
+        Створення картки (лід) у воронці KeyCRM.
+        raise_errors=True — помилку запиту прокинути далі (воркер вирішує, чи повторювати).
+        """
         url = f"{self.base_url}/pipelines/cards"
         try:
-            logger.info(f"➡️ Надсилаю запит на створення картки в KeyCRM: {data}")
-            response = requests.post(url, json=data, headers=self.headers, timeout=30)
+            logger.debug("➡️ Створення картки в KeyCRM: %s", data)
+            response = self._request("POST", url, priority=PRIORITY_LEAD, json=data)
             response.raise_for_status()
 
             result = response.json()
             card_id = result.get("id") or result.get("data", {}).get("id")
-            logger.info(f"✅ Лід створено успішно (ID: {card_id}) | Відповідь: {result}")
+            logger.info("✅ Лід створено успішно (ID: %s)", card_id)
+            logger.debug("Відповідь KeyCRM: %s", result)
 
             return {"id": card_id, "response": result}
 
         except requests.exceptions.RequestException as e:
-            logger.error(f"❌ Помилка при створенні картки в KeyCRM: {e}")
+            logger.error("❌ Помилка при створенні картки в KeyCRM: %s", e)
             if hasattr(e, "response") and e.response is not None:
-                logger.error(f"🔻 Відповідь сервера: {e.response.text}")
+                logger.error("🔻 Відповідь сервера: %s", e.response.text)
+            if raise_errors:
+                raise
             return None
 
     def get_pipelines(self):
         """Отримати список воронок"""
         url = f"{self.base_url}/pipelines"
         try:
-            response = requests.get(url, headers=self.headers, timeout=30)
+            response = self._request("GET", url)
             response.raise_for_status()
             return response.json()
         except requests.exceptions.RequestException as e:
-            logger.error(f"❌ Помилка при отриманні воронок: {e}")
+            logger.error("❌ Помилка при отриманні воронок: %s", e)
             return None
 
     def get_sources(self):
         """Отримати список джерел"""
         url = f"{self.base_url}/sources"
         try:
-            response = requests.get(url, headers=self.headers, timeout=30)
+            response = self._request("GET", url)
             response.raise_for_status()
             return response.json()
         except requests.exceptions.RequestException as e:
-            logger.error(f"❌ Помилка при отриманні джерел: {e}")
+            logger.error("❌ Помилка при отриманні джерел: %s", e)
             return None
 
     def update_lead_payment_status(self, lead_id, payment_id, status="paid", description=None):
@@ -75,24 +100,21 @@ class KeyCRMAPI:
             if description:
                 payload["description"] = description
 
-            logger.info(f"🔄 Оновлюємо платіж {payment_id} ліда {lead_id} на статус '{status}'")
-            logger.info(f"📤 URL: {url}")
-            logger.info(f"📤 Payload: {payload}")
+            logger.debug("📤 PUT %s %s", url, payload)
 
-            response = requests.put(url, headers=self.headers, json=payload, timeout=30)
+            response = self._request("PUT", url, priority=PRIORITY_PAYMENT, json=payload)
 
-            logger.info(f"📡 Статус відповіді: {response.status_code}")
-            logger.info(f"📡 Відповідь: {response.text}")
+            logger.debug("📡 HTTP %s: %s", response.status_code, response.text)
 
             response.raise_for_status()
             result = response.json()
-            logger.info(f"✅ Платіж {payment_id} ліда {lead_id} оновлено на статус '{status}'")
+            logger.info("✅ Платіж %s ліда %s оновлено на статус '%s'", payment_id, lead_id, status)
             return result
 
         except requests.exceptions.RequestException as e:
-            logger.error(f"❌ Помилка при оновленні платежу {payment_id} ліда {lead_id}: {e}")
+            logger.error("❌ Помилка при оновленні платежу %s ліда %s: %s", payment_id, lead_id, e)
             if hasattr(e, "response") and e.response is not None:
-                logger.error(f"🔻 Відповідь сервера: {e.response.text}")
+                logger.error("🔻 Відповідь сервера: %s", e.response.text)
             return None
 
     def get_external_transactions(self, description=None, limit=50, offset=0):
@@ -111,18 +133,18 @@ class KeyCRMAPI:
             if description:
                 params["description"] = description
 
-            logger.info(f"🔄 Отримуємо список зовнішніх транзакцій")
-            response = requests.get(url, headers=self.headers, params=params, timeout=30)
+            logger.debug("🔄 Отримуємо список зовнішніх транзакцій: %s", params)
+            response = self._request("GET", url, params=params)
             response.raise_for_status()
 
             result = response.json()
-            logger.info(f"✅ Отримано {len(result.get('data', []))} транзакцій")
+            logger.debug("✅ Отримано %s транзакцій", len(result.get('data', [])))
             return result
 
         except requests.exceptions.RequestException as e:
-            logger.error(f"❌ Помилка при отриманні зовнішніх транзакцій: {e}")
+            logger.error("❌ Помилка при отриманні зовнішніх транзакцій: %s", e)
             if hasattr(e, "response") and e.response is not None:
-                logger.error(f"🔻 Відповідь сервера: {e.response.text}")
+                logger.error("🔻 Відповідь сервера: %s", e.response.text)
             return None
 
     def attach_external_transaction_by_id(self, payment_id, transaction_id):
@@ -138,24 +160,21 @@ class KeyCRMAPI:
         try:
             payload = {"transaction_id": transaction_id}
 
-            logger.info(f"🔄 Прив'язуємо зовнішню транзакцію (ID: {transaction_id}) до платежу {payment_id}")
-            logger.info(f"📤 URL: {url}")
-            logger.info(f"📤 Payload: {payload}")
+            logger.debug("📤 POST %s %s", url, payload)
 
-            response = requests.post(url, headers=self.headers, json=payload, timeout=30)
+            response = self._request("POST", url, priority=PRIORITY_PAYMENT, json=payload)
 
-            logger.info(f"📡 Статус відповіді: {response.status_code}")
-            logger.info(f"📡 Відповідь: {response.text}")
+            logger.debug("📡 HTTP %s: %s", response.status_code, response.text)
 
             response.raise_for_status()
             result = response.json()
-            logger.info(f"✅ Зовнішню транзакцію {transaction_id} прив'язано до платежу {payment_id}")
+            logger.info("✅ Зовнішню транзакцію %s прив'язано до платежу %s", transaction_id, payment_id)
             return result
 
         except requests.exceptions.RequestException as e:
-            logger.error(f"❌ Помилка при прив'язці зовнішньої транзакції: {e}")
+            logger.error("❌ Помилка при прив'язці зовнішньої транзакції: %s", e)
             if hasattr(e, "response") and e.response is not None:
-                logger.error(f"🔻 Відповідь сервера: {e.response.text}")
+                logger.error("🔻 Відповідь сервера: %s", e.response.text)
             return None
 
     def attach_external_transaction_by_uuid(self, payment_id, transaction_uuid):
@@ -171,22 +190,19 @@ class KeyCRMAPI:
         try:
             payload = {"transaction_uuid": transaction_uuid}
 
-            logger.info(f"🔄 Прив'язуємо зовнішню транзакцію (UUID: {transaction_uuid}) до платежу {payment_id}")
-            logger.info(f"📤 URL: {url}")
-            logger.info(f"📤 Payload: {payload}")
+            logger.debug("📤 POST %s %s", url, payload)
 
-            response = requests.post(url, headers=self.headers, json=payload, timeout=30)
+            response = self._request("POST", url, priority=PRIORITY_PAYMENT, json=payload)
 
-            logger.info(f"📡 Статус відповіді: {response.status_code}")
-            logger.info(f"📡 Відповідь: {response.text}")
+            logger.debug("📡 HTTP %s: %s", response.status_code, response.text)
 
             response.raise_for_status()
             result = response.json()
-            logger.info(f"✅ Зовнішню транзакцію (UUID: {transaction_uuid}) прив'язано до платежу {payment_id}")
+            logger.info("✅ Зовнішню транзакцію (UUID: %s) прив'язано до платежу %s", transaction_uuid, payment_id)
             return result
 
         except requests.exceptions.RequestException as e:
-            logger.error(f"❌ Помилка при прив'язці зовнішньої транзакції за UUID: {e}")
+            logger.error("❌ Помилка при прив'язці зовнішньої транзакції за UUID: %s", e)
             if hasattr(e, "response") and e.response is not None:
-                logger.error(f"🔻 Відповідь сервера: {e.response.text}")
+                logger.error("🔻 Відповідь сервера: %s", e.response.text)
             return None
\ No newline at end of file
@@ -0,0 +1,47 @@
+from __future__ import annotations
+
+from django.core.management.base import BaseCommand
+
+from payments.models import SubscriptionOrder, normalize_email, phone_key
+
+
+class Command(BaseCommand):
+    help = "Backfill SubscriptionOrder.email_normalized / phone_key used by callback matching"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=2000, help="Rows per bulk update")
+        parser.add_argument("--apply", action="store_true", help="Persist changes (default: dry-run)")
+
+    def handle(self, *args, **options):
+        apply_changes = options["apply"]
+        batch_size = max(1, int(options["batch_size"]))
+        scanned = 0
+        updated = 0
+        batch = []
+
+        qs = SubscriptionOrder.objects.only("id", "email", "phone", "email_normalized", "phone_key").order_by("id")
+        for order in qs.iterator(chunk_size=batch_size):
+            scanned += 1
+            email_normalized = normalize_email(order.email)
+            key = phone_key(order.phone)
+            if order.email_normalized == email_normalized and order.phone_key == key:
+                continue
+
+            order.email_normalized = email_normalized
+            order.phone_key = key
+            batch.append(order)
+            updated += 1
+
+            if len(batch) >= batch_size:
+                if apply_changes:
+                    SubscriptionOrder.objects.bulk_update(batch, ["email_normalized", "phone_key"])
+                batch = []
+
+        if batch and apply_changes:
+            SubscriptionOrder.objects.bulk_update(batch, ["email_normalized", "phone_key"])
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Done. scanned={scanned} updated={updated} apply={apply_changes}"
+            )
+        )
@@ -0,0 +1,132 @@
+from __future__ import annotations
+
+import io
+import json
+import logging
+import statistics
+import time
+import uuid
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import RequestFactory
+from django.test.utils import override_settings
+
+from payments import views
+from payments.models import TicketOrder
+from payments.services.wayforpay_signing import callback_signature
+
+# рівень логера payments, PAYMENTS_LOG_PAYLOADS, PAYMENTS_LOG_SAMPLE_RATE
+MODES = {
+    "off": (logging.WARNING, False, 0.0),
+    "default": (logging.INFO, False, None),
+    "verbose": (logging.DEBUG, True, 1.0),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure wayforpay_callback latency with payments logging off, at the defaults and fully verbose. "
+        "Runs against a temporary order inside a transaction that is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--count", type=int, default=300, help="Callbacks per mode.")
+        parser.add_argument(
+            "--status",
+            choices=["Declined", "Approved"],
+            default="Declined",
+            help="transactionStatus of the replayed callback.",
+        )
+
+    def _callback_data(self, order: TicketOrder, status: str, secret: str) -> dict:
+        data = {
+            "merchantAccount": settings.WAYFORPAY_MERCHANT_ACCOUNT or "benchmark_merchant",
+            "orderReference": order.wayforpay_order_reference,
+            "amount": float(order.amount),
+            "currency": "UAH",
+            "authCode": "913434",
+            "cardPan": "41****8217",
+            "transactionStatus": status,
+            "reasonCode": 1100,
+            "processingDate": time.time_ns(),
+            "clientFirstName": order.name,
+            "clientEmail": order.email,
+            "clientPhone": order.phone,
+            "products": [{"name": "Квиток", "price": float(order.amount), "count": 1}] * 5,
+        }
+        data["merchantSignature"] = callback_signature(data, secret)
+        return data
+
+    def _run(self, order: TicketOrder, count: int, status: str, secret: str) -> list:
+        factory = RequestFactory()
+        timings = []
+        for _ in range(count):
+            TicketOrder.objects.filter(pk=order.pk).update(payment_status="pending", callback_processed=False)
+            request = factory.post(
+                "/payment/callback/",
+                data=json.dumps(self._callback_data(order, status, secret), ensure_ascii=False),
+                content_type="application/json",
+            )
+            started = time.perf_counter()
+            response = views.wayforpay_callback(request)
+            timings.append((time.perf_counter() - started) * 1000)
+            if response.status_code != 200:
+                raise RuntimeError(f"Callback returned HTTP {response.status_code}: {response.content[:200]!r}")
+        return timings
+
+    def handle(self, *args, **options):
+        count = max(1, int(options["count"]))
+        secret = settings.WAYFORPAY_SECRET_KEY or "benchmark-secret"
+
+        payments_logger = logging.getLogger("payments")
+        saved = (payments_logger.level, payments_logger.handlers[:], payments_logger.propagate)
+        # записи форматуються як у продакшені, але пишуться в памʼять, а не в консоль
+        sink = io.StringIO()
+        handler = logging.StreamHandler(sink)
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s %(message)s"))
+
+        try:
+            payments_logger.handlers = [handler]
+            payments_logger.propagate = False
+
+            with transaction.atomic():
+                order = TicketOrder.objects.create(
+                    name="Benchmark",
+                    email="benchmark@example.com",
+                    phone="+380000000000",
+                    amount=Decimal("1559.00"),
+                    payment_status="pending",
+                    wayforpay_order_reference=f"BENCH_{uuid.uuid4().hex[:12]}",
+                )
+
+                results = {}
+                for mode, (level, payloads, sample_rate) in MODES.items():
+                    payments_logger.setLevel(level)
+                    overrides = {"WAYFORPAY_SECRET_KEY": secret, "PAYMENTS_LOG_PAYLOADS": payloads}
+                    if sample_rate is not None:
+                        overrides["PAYMENTS_LOG_SAMPLE_RATE"] = sample_rate
+                    with override_settings(**overrides):
+                        self._run(order, min(count, 20), options["status"], secret)  # прогрів
+                        sink.seek(0)
+                        sink.truncate()
+                        timings = self._run(order, count, options["status"], secret)
+                    results[mode] = (timings, sink.tell())
+
+                transaction.set_rollback(True)
+        finally:
+            payments_logger.setLevel(saved[0])
+            payments_logger.handlers = saved[1]
+            payments_logger.propagate = saved[2]
+
+        baseline = statistics.mean(results["off"][0])
+        for mode, (timings, log_bytes) in results.items():
+            timings.sort()
+            mean = statistics.mean(timings)
+            p95 = timings[int(len(timings) * 0.95) - 1]
+            self.stdout.write(
+                f"{mode:<8} mean={mean:7.2f} ms p50={timings[len(timings) // 2]:7.2f} ms p95={p95:7.2f} ms "
+                f"x{mean / baseline:.2f} log={log_bytes / count:8.0f} B/callback"
+            )
@@ -0,0 +1,66 @@
+from __future__ import annotations
+
+import time
+from types import SimpleNamespace
+
+from django.core.management.base import BaseCommand
+from django.template.loader import render_to_string
+from django.test.utils import override_settings
+
+from payments.services.email_templates import (
+    SUBSCRIPTION_CONFIRMATION_HTML,
+    SUBSCRIPTION_CONFIRMATION_TXT,
+    TICKET_HTML,
+    clear_email_template_cache,
+)
+
+
+class Command(BaseCommand):
+    help = "Benchmark renders/second of transactional email templates: render_to_string vs precompiled."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--count",
+            type=int,
+            default=2000,
+            help="Number of renders per template and mode.",
+        )
+
+    @staticmethod
+    def _rate(func, count: int) -> float:
+        func(0)  # прогрів
+        started = time.perf_counter()
+        for i in range(count):
+            func(i)
+        return count / (time.perf_counter() - started)
+
+    def handle(self, *args, **options):
+        count = max(1, int(options["count"]))
+
+        def context(i):
+            subscription = SimpleNamespace(
+                name=f"Тест Користувач {i}",
+                email=f"user{i}@example.com",
+                phone=f"+380{i:09d}",
+            )
+            return {
+                "order": SimpleNamespace(id=i, event_name="Grand Opening Party"),
+                "subscription": subscription,
+                "bot_url": f"https://t.me/Pasue_club_bot?start={i:012x}",
+            }
+
+        cases = (
+            ("ticket.html", TICKET_HTML),
+            ("subscription_confirmation.txt", SUBSCRIPTION_CONFIRMATION_TXT),
+            ("subscription_confirmation.html", SUBSCRIPTION_CONFIRMATION_HTML),
+        )
+
+        with override_settings(DEBUG=False):
+            clear_email_template_cache()
+            for label, template in cases:
+                baseline = self._rate(lambda i: render_to_string(template.template_name, context(i)), count)
+                precompiled = self._rate(lambda i: template.render(context(i)), count)
+                self.stdout.write(
+                    f"{label:<32} render_to_string={baseline:>10.0f}/s "
+                    f"precompiled={precompiled:>10.0f}/s x{precompiled / baseline:.1f}"
+                )
@@ -0,0 +1,188 @@
+from __future__ import annotations
+
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+
+from payments.keycrm_api import KeyCRMAPI
+from payments.services.keycrm_http import reset_keycrm_session
+
+
+class StubKeyCRMHandler(BaseHTTPRequestHandler):
+    """
+    Локальна заглушка KeyCRM з keep-alive; затримка на нове зʼєднання імітує
+    TLS-рукостискання, кожен throttle_every-й запит отримує 429 з Retry-After.
+    Заголовки й тіло йдуть окремими send, тож без TCP_NODELAY повторно
+    використане зʼєднання чекало б на Nagle/delayed ACK (~40 мс на відповідь).
+    """
+
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    handshake_seconds = 0.0
+    throttle_every = 0
+    served = 0
+    lock = threading.Lock()
+
+    def setup(self):
+        super().setup()
+        time.sleep(self.handshake_seconds)
+
+    def _reply(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if length:
+            self.rfile.read(length)
+        with self.lock:
+            StubKeyCRMHandler.served += 1
+            throttled = self.throttle_every and StubKeyCRMHandler.served % self.throttle_every == 0
+
+        body = json.dumps({"id": 1, "data": [], "payments": [{"id": 1}]}).encode("utf-8")
+        self.send_response(429 if throttled else 200)
+        if throttled:
+            self.send_header("Retry-After", "1")
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_GET = do_POST = do_PUT = _reply
+
+    def log_message(self, format, *args):
+        pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare per-call latency of KeyCRMAPI against a local stub server: a new connection per call "
+        "(previous behaviour) vs the shared pooled session. Fails if the pooled session does not reuse connections. "
+        "With --rate-limit, also floods lead creation alongside payment updates through the limiter."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--count", type=int, default=300, help="Calls per mode.")
+        parser.add_argument("--threads", type=int, default=4, help="Concurrent callers.")
+        parser.add_argument(
+            "--handshake-ms",
+            type=float,
+            default=20.0,
+            help="Simulated TCP+TLS handshake cost per new connection on the stub server.",
+        )
+        parser.add_argument(
+            "--rate-limit",
+            type=float,
+            default=0.0,
+            help="Requests/second for the limiter scenario (0 skips it).",
+        )
+        parser.add_argument(
+            "--throttle-every",
+            type=int,
+            default=25,
+            help="In the limiter scenario, every Nth stub response is 429 with Retry-After: 1.",
+        )
+
+    @staticmethod
+    def _timed(calls: int, threads: int, func) -> list:
+        def one(_):
+            started = time.perf_counter()
+            func()
+            return (time.perf_counter() - started) * 1000
+
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            return sorted(pool.map(one, range(calls)))
+
+    def _report(self, label: str, timings: list) -> float:
+        mean = sum(timings) / len(timings)
+        p95 = timings[int(len(timings) * 0.95) - 1]
+        self.stdout.write(f"{label:<8} mean={mean:7.2f} ms p50={timings[len(timings) // 2]:7.2f} ms p95={p95:7.2f} ms")
+        return mean
+
+    def _limiter_scenario(self, count: int, threads: int) -> None:
+        """Потік лідів і рідші оновлення оплат одночасно: оплати не мають чекати за лідами"""
+        api = KeyCRMAPI()
+        payments = max(1, count // 10)
+        results = {}
+
+        def leads():
+            results["leads"] = self._timed(count, threads, lambda: api.create_pipeline_card({"title": "benchmark"}))
+
+        def payment_updates():
+            time.sleep(0.5)  # черга лідів уже стоїть
+            results["payments"] = self._timed(
+                payments, 1, lambda: api.update_lead_payment_status(lead_id=1, payment_id=1, status="paid")
+            )
+
+        workers = [threading.Thread(target=leads), threading.Thread(target=payment_updates)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        self.stdout.write("rate-limited:")
+        self._report("leads", results["leads"])
+        self._report("payments", results["payments"])
+        stats = api.http.stats()
+        self.stdout.write(
+            f"throttled={stats['throttled']} retried={stats['retried']} failed={stats['failed']} "
+            f"rate_limit_wait={stats['rate_limit_wait_seconds_total']:.1f}s"
+        )
+
+    def handle(self, *args, **options):
+        count = max(1, int(options["count"]))
+        threads = max(1, int(options["threads"]))
+        StubKeyCRMHandler.handshake_seconds = max(0.0, options["handshake_ms"]) / 1000
+
+        server = ThreadingHTTPServer(("127.0.0.1", 0), StubKeyCRMHandler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base_url = f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+        try:
+            url = f"{base_url}/payments/external-transactions"
+            fresh = self._timed(count, threads, lambda: requests.get(url, params={"limit": 50}, timeout=30).json())
+
+            with override_settings(KEYCRM_API_URL=base_url, KEYCRM_API_TOKEN="benchmark",
+                                   KEYCRM_HTTP_POOL_SIZE=threads, KEYCRM_RATE_LIMIT_PER_SECOND=0):
+                reset_keycrm_session()
+                try:
+                    api = KeyCRMAPI()
+                    pooled = self._timed(count, threads, lambda: api.get_external_transactions(limit=50))
+                    stats = api.http.stats()
+                finally:
+                    reset_keycrm_session()
+
+            if options["rate_limit"] > 0:
+                StubKeyCRMHandler.throttle_every = max(0, options["throttle_every"])
+                with override_settings(KEYCRM_API_URL=base_url, KEYCRM_API_TOKEN="benchmark",
+                                       KEYCRM_HTTP_POOL_SIZE=threads * 2,
+                                       KEYCRM_RATE_LIMIT_PER_SECOND=options["rate_limit"],
+                                       KEYCRM_RATE_LIMIT_MAX_WAIT=None):
+                    reset_keycrm_session()
+                    try:
+                        self._limiter_scenario(count, threads)
+                    finally:
+                        reset_keycrm_session()
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        fresh_mean = self._report("fresh", fresh)
+        pooled_mean = self._report("pooled", pooled)
+        self.stdout.write(
+            f"x{fresh_mean / pooled_mean:.2f} faster; connections opened={stats['connections_opened']} "
+            f"reused={stats['connections_reused']} reuse_ratio={stats['reuse_ratio']:.2%} failed={stats['failed']}"
+        )
+
+        if stats["failed"] or stats["connections_opened"] > threads:
+            raise CommandError(
+                f"Pooled session opened {stats['connections_opened']} connections for {threads} callers"
+            )
+        if pooled_mean >= fresh_mean:
+            raise CommandError(
+                f"Pooled session is not faster than fresh connections "
+                f"(pooled {pooled_mean:.2f} ms vs fresh {fresh_mean:.2f} ms)"
+            )
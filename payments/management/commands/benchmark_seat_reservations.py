@@ -0,0 +1,89 @@
+from __future__ import annotations
+
+import threading
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils.module_loading import import_string
+
+from payments.models import Event
+
+BACKENDS = {
+    "db": "payments.services.reservations.DatabaseReservationBackend",
+    "locmem": "payments.services.reservations.LocMemReservationBackend",
+    "redis": "payments.services.reservations.RedisReservationBackend",
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Load test seat reservations/second under contention. Creates a temporary inactive event, "
+        "so run it against a staging database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--backend",
+            default="db",
+            help=f"One of {', '.join(BACKENDS)} or a dotted path to a reservation backend.",
+        )
+        parser.add_argument("--seats", type=int, default=500, help="Event ticket limit.")
+        parser.add_argument("--threads", type=int, default=16, help="Concurrent buyers.")
+        parser.add_argument(
+            "--attempts",
+            type=int,
+            default=100,
+            help="Reservation attempts per thread (total above --seats means contention on sold out).",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            backend = import_string(BACKENDS.get(options["backend"], options["backend"]))()
+        except ImportError as e:
+            raise CommandError(f"Unknown reservation backend: {options['backend']}") from e
+
+        seats = max(1, int(options["seats"]))
+        threads = max(1, int(options["threads"]))
+        attempts = max(1, int(options["attempts"]))
+
+        event = Event.objects.create(
+            title="Seat reservation benchmark",
+            max_tickets=seats,
+            is_active=False,
+        )
+        reserved = []
+        reserved_lock = threading.Lock()
+        start = threading.Barrier(threads)
+
+        def buyer():
+            try:
+                start.wait()
+                for _ in range(attempts):
+                    hold = backend.reserve(event)
+                    if hold is not None:
+                        with reserved_lock:
+                            reserved.append(hold)
+            finally:
+                connection.close()
+
+        try:
+            workers = [threading.Thread(target=buyer) for _ in range(threads)]
+            started = time.perf_counter()
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+            elapsed = time.perf_counter() - started
+        finally:
+            backend.reset(event.pk)
+            event.delete()
+
+        total = threads * attempts
+        expected = min(seats, total)
+        self.stdout.write(
+            f"{options['backend']}: {total} attempts by {threads} threads in {elapsed:.3f}s "
+            f"({total / elapsed:.0f} reservations/s), reserved {len(reserved)} of {seats} seats"
+        )
+        if len(reserved) != expected:
+            raise CommandError(f"Expected {expected} reservations, got {len(reserved)} (oversold or lost seats)")
@@ -0,0 +1,90 @@
+from __future__ import annotations
+
+import os
+import shutil
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+
+from payments.models import TicketOrder
+from payments.ticket_utils import (
+    TICKET_PDF_RENDERERS,
+    clear_ticket_template_cache,
+    generate_ticket_pdf,
+    generate_ticket_qr,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Micro-benchmark of ticket PDF rendering (tickets/second): cold (template decoded and, in compact mode, "
+        "the JPEG page template re-encoded for every ticket in an empty cache dir) vs cached template."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--count",
+            type=int,
+            default=50,
+            help="Number of tickets to render per run.",
+        )
+        parser.add_argument(
+            "--order-id",
+            type=int,
+            default=1,
+            help="Order id encoded into the QR code (order is not read from DB).",
+        )
+        parser.add_argument(
+            "--mode",
+            choices=sorted(TICKET_PDF_RENDERERS),
+            default=None,
+            help="Ticket PDF mode (default: settings.TICKET_PDF_MODE).",
+        )
+        parser.add_argument(
+            "--qr-mode",
+            choices=("raster", "vector"),
+            default=None,
+            help="QR rendering backend (default: settings.TICKET_QR_MODE).",
+        )
+
+    def _run(self, count: int, order_id: int, cold: bool, mode: str | None, qr_mode: str | None) -> tuple[float, int]:
+        if not cold:
+            return self._render(count, order_id, False, mode, qr_mode)
+
+        # JPEG-шаблон compact-режиму лишається на диску між запусками — холодний прохід
+        # пише його в порожній тимчасовий каталог і видаляє перед кожним квитком
+        with tempfile.TemporaryDirectory() as cache_dir, override_settings(TICKET_CACHE_DIR=cache_dir):
+            return self._render(count, order_id, True, mode, qr_mode, os.path.join(cache_dir, "templates"))
+
+    def _render(self, count: int, order_id: int, cold: bool, mode: str | None, qr_mode: str | None,
+                template_dir: str | None = None) -> tuple[float, int]:
+        total_bytes = 0
+        started = time.perf_counter()
+        for i in range(count):
+            if cold:
+                # Так поводився код до кешу: шаблон декодується (і стискається) для кожного квитка
+                clear_ticket_template_cache()
+                shutil.rmtree(template_dir, ignore_errors=True)
+            order = TicketOrder(id=order_id + i)
+            pdf_buffer = generate_ticket_pdf(order, generate_ticket_qr(order, mode=qr_mode), mode=mode)
+            total_bytes += len(pdf_buffer.getvalue())
+        elapsed = time.perf_counter() - started
+        return elapsed, total_bytes
+
+    def handle(self, *args, **options):
+        count = max(1, int(options["count"]))
+        order_id = int(options["order_id"])
+        mode = options["mode"]
+        qr_mode = options["qr_mode"]
+
+        # прогрів (шрифти, імпорти reportlab)
+        self._run(1, order_id, cold=True, mode=mode, qr_mode=qr_mode)
+
+        for label, cold in (("cold (no cache)", True), ("cached template", False)):
+            elapsed, total_bytes = self._run(count, order_id, cold=cold, mode=mode, qr_mode=qr_mode)
+            self.stdout.write(
+                f"{label:<16} tickets={count} time={elapsed:.3f}s "
+                f"rate={count / elapsed:.1f} tickets/s avg_pdf={total_bytes // count} B"
+            )
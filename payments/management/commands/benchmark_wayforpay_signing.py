@@ -0,0 +1,130 @@
+from __future__ import annotations
+
+import hashlib
+import hmac
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from payments.services.wayforpay_signing import (
+    accept_response,
+    callback_signature,
+    purchase_signature,
+    verify_callback_signature,
+)
+
+# Тестовий секрет і мерчант з документації WayForPay
+SECRET = "flk3409refn54t54t*FNJRET"
+
+PURCHASE = {
+    "merchantAccount": "test_merch_n1",
+    "merchantDomainName": "www.market.ua",
+    "orderReference": "DH783023",
+    "orderDate": "1415379863",
+    "amount": "1547.36",
+    "currency": "UAH",
+    "productName[]": ["Процесор Intel Core i5-4670 3.4GHz", "Пам'ять Kingston DDR3-1600 4096MB PC3-12800"],
+    "productCount[]": ["1", "1"],
+    "productPrice[]": ["1000", "547.36"],
+}
+
+CALLBACK = {
+    "merchantAccount": "test_merch_n1",
+    "orderReference": "DH783023",
+    "amount": 1547.36,
+    "currency": "UAH",
+    "authCode": "913434",
+    "cardPan": "41****8217",
+    "transactionStatus": "Approved",
+    "reasonCode": 1100,
+}
+
+CALLBACK_WITHOUT_CARD = {
+    "merchantAccount": "test_merch_n1",
+    "orderReference": "DH783023",
+}
+
+VECTORS = (
+    ("purchase", lambda: purchase_signature(PURCHASE, SECRET), "ee828f71ed93441c07eb3eef67762a5c"),
+    ("callback", lambda: callback_signature(CALLBACK, SECRET), "2b58490556ec4d230fcef51c8184ea88"),
+    ("callback, missing fields", lambda: callback_signature(CALLBACK_WITHOUT_CARD, SECRET), "8f628bd98fc03312a0dcb3adb235f845"),
+    ("accept response", lambda: accept_response("DH783023", SECRET, ts=0)["signature"], "e666af9be55e75e90b14f5568441b2f5"),
+)
+
+
+def _legacy_callback_signature(data):
+    """Попередня реалізація з views: список полів, join і новий HMAC на кожен виклик"""
+    signature_fields = [
+        data.get("merchantAccount", ""),
+        data.get("orderReference", ""),
+        str(data.get("amount", "")),
+        data.get("currency", ""),
+        str(data.get("authCode", "")),
+        data.get("cardPan", ""),
+        str(data.get("transactionStatus", "")),
+        str(data.get("reasonCode", "")),
+    ]
+    signature_string = ";".join(signature_fields)
+    return hmac.new(SECRET.encode("utf-8"), signature_string.encode("utf-8"), hashlib.md5).hexdigest()
+
+
+class Command(BaseCommand):
+    help = "Check WayForPay signing against test vectors and benchmark signatures/second."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--count", type=int, default=100000, help="Signatures per benchmark case.")
+
+    @staticmethod
+    def _rates(funcs, count: int, rounds: int = 7) -> list:
+        """
+        Підписів/с для кожної функції: прогони чергуються (a, b, a, b, ...) і
+        береться найкращий, щоб дрейф частоти CPU і сусідні процеси не
+        викривлювали порівняння.
+        """
+        per_round = max(1, count // rounds)
+        best = [float("inf")] * len(funcs)
+        for func in funcs:
+            func()
+        for _ in range(rounds):
+            for index, func in enumerate(funcs):
+                started = time.perf_counter()
+                for _ in range(per_round):
+                    func()
+                best[index] = min(best[index], time.perf_counter() - started)
+        return [per_round / elapsed for elapsed in best]
+
+    def handle(self, *args, **options):
+        count = max(1, int(options["count"]))
+
+        failures = []
+        for label, compute, expected in VECTORS:
+            actual = compute()
+            ok = actual == expected
+            self.stdout.write(f"{'OK  ' if ok else 'FAIL'} {label}: {actual}")
+            if not ok:
+                failures.append(label)
+
+        if _legacy_callback_signature(CALLBACK) != callback_signature(CALLBACK, SECRET):
+            failures.append("parity with the previous implementation")
+
+        signed = dict(CALLBACK, merchantSignature="2b58490556ec4d230fcef51c8184ea88")
+        forged = dict(signed, amount=1.0)
+        if not verify_callback_signature(signed, SECRET) or verify_callback_signature(forged, SECRET):
+            failures.append("verify_callback_signature")
+
+        if failures:
+            raise CommandError(f"Signing checks failed: {', '.join(failures)}")
+
+        legacy, cached, verify, purchase = self._rates([
+            lambda: _legacy_callback_signature(CALLBACK),
+            lambda: callback_signature(CALLBACK, SECRET),
+            lambda: verify_callback_signature(signed, SECRET),
+            lambda: purchase_signature(PURCHASE, SECRET),
+        ], count)
+        self.stdout.write(
+            f"callback legacy={legacy:>10.0f}/s cached={cached:>10.0f}/s x{cached / legacy:.2f}\n"
+            f"verify          {verify:>10.0f}/s\n"
+            f"purchase        {purchase:>10.0f}/s"
+        )
+        if cached <= legacy:
+            raise CommandError(f"Cached signing is not faster than the previous implementation (x{cached / legacy:.2f})")
@@ -0,0 +1,170 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.core.management.base import BaseCommand, CommandError
+
+from payments.management.commands.sync_wayforpay_subscriptions import fetch_statuses
+from payments.services.wayforpay_client import WayForPayConfig, WayForPayRegularApiError
+
+STATUSES = ("Active", "Suspended", "Removed", "Completed")
+
+
+def canned_status(order_reference: str) -> dict:
+    """Відповідь STATUS, яку заглушка віддає для orderReference SUB_<n>"""
+    n = int(order_reference.rsplit("_", 1)[-1])
+    status = STATUSES[n % len(STATUSES)]
+    return {
+        "orderReference": order_reference,
+        "status": status,
+        "mode": "monthly",
+        "amount": 1559,
+        "currency": "UAH",
+        "dateBegin": 1735689600,
+        "dateEnd": 1798761600,
+        "nextPaymentDate": 1767225600 + n * 86400,
+        "lastPayedDate": 1764547200,
+        "lastPayedStatus": "Approved",
+        "reasonCode": 4100 if status in ("Active", "Suspended") else 4107,
+        "reason": "Ok",
+    }
+
+
+class StubRegularApiHandler(BaseHTTPRequestHandler):
+    """
+    Локальна заглушка WayForPay regularApi з keep-alive: відповідає canned STATUS
+    із затримкою, кожен fail_every-й orderReference отримує HTTP 500 без JSON.
+    Рахує відкриті зʼєднання і максимум одночасних запитів.
+    TCP_NODELAY — інакше keep-alive відповідь чекає на Nagle/delayed ACK.
+    """
+
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    latency_seconds = 0.0
+    fail_every = 0
+    connections = 0
+    in_flight = 0
+    max_in_flight = 0
+    lock = threading.Lock()
+
+    @classmethod
+    def reset(cls) -> None:
+        cls.connections = cls.in_flight = cls.max_in_flight = 0
+
+    def setup(self):
+        super().setup()
+        with self.lock:
+            StubRegularApiHandler.connections += 1
+
+    def do_POST(self):
+        with self.lock:
+            StubRegularApiHandler.in_flight += 1
+            StubRegularApiHandler.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)))
+            time.sleep(self.latency_seconds)
+
+            order_reference = payload.get("orderReference", "")
+            n = int(order_reference.rsplit("_", 1)[-1])
+            if payload.get("requestType") != "STATUS" or payload.get("merchantPassword") != "benchmark":
+                status_code, body = 400, json.dumps({"reasonCode": 1113, "reason": "Bad request"}).encode()
+            elif self.fail_every and n % self.fail_every == 0:
+                status_code, body = 500, b"Internal Server Error"
+            else:
+                status_code, body = 200, json.dumps(canned_status(order_reference)).encode()
+
+            self.send_response(status_code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        finally:
+            with self.lock:
+                StubRegularApiHandler.in_flight -= 1
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubRegularApiServer(ThreadingHTTPServer):
+    # стандартна черга accept (5) скидає зʼєднання при --concurrency > 5
+    request_queue_size = 1024
+    daemon_threads = True
+
+
+class Command(BaseCommand):
+    help = (
+        "Run the async WayForPay STATUS fetch used by sync_wayforpay_subscriptions against a local fake "
+        "regularApi: one request at a time vs --concurrency N. Fails if payloads differ from the canned ones, "
+        "errors are not isolated per orderReference, or the concurrency/connection bound is exceeded."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--count", type=int, default=200, help="Subscriptions (orderReferences) to fetch.")
+        parser.add_argument("--concurrency", type=int, default=8, help="Max STATUS requests in flight.")
+        parser.add_argument("--latency-ms", type=float, default=30.0, help="Simulated regularApi response time.")
+        parser.add_argument(
+            "--fail-every",
+            type=int,
+            default=17,
+            help="Every Nth orderReference gets HTTP 500 (0 disables).",
+        )
+
+    def _run(self, config: WayForPayConfig, refs: list, concurrency: int, fail_every: int) -> float:
+        StubRegularApiHandler.reset()
+        started = time.perf_counter()
+        results = asyncio.run(fetch_statuses(config, refs, concurrency))
+        elapsed = time.perf_counter() - started
+
+        for order_reference in refs:
+            result = results.get(order_reference)
+            n = int(order_reference.rsplit("_", 1)[-1])
+            if fail_every and n % fail_every == 0:
+                if not isinstance(result, WayForPayRegularApiError):
+                    raise CommandError(f"{order_reference}: expected WayForPayRegularApiError, got {result!r}")
+            elif result != canned_status(order_reference):
+                raise CommandError(f"{order_reference}: unexpected STATUS payload {result!r}")
+
+        if StubRegularApiHandler.max_in_flight > concurrency:
+            raise CommandError(
+                f"{StubRegularApiHandler.max_in_flight} requests in flight with --concurrency {concurrency}"
+            )
+        if StubRegularApiHandler.connections > concurrency:
+            raise CommandError(
+                f"{StubRegularApiHandler.connections} connections opened with --concurrency {concurrency}"
+            )
+
+        self.stdout.write(
+            f"concurrency={concurrency:<3} total={elapsed:6.2f} s per_sub={elapsed * 1000 / len(refs):7.2f} ms "
+            f"max_in_flight={StubRegularApiHandler.max_in_flight} connections={StubRegularApiHandler.connections}"
+        )
+        return elapsed
+
+    def handle(self, *args, **options):
+        count = max(1, int(options["count"]))
+        concurrency = max(1, int(options["concurrency"]))
+        fail_every = max(0, int(options["fail_every"]))
+        StubRegularApiHandler.latency_seconds = max(0.0, options["latency_ms"]) / 1000
+        StubRegularApiHandler.fail_every = fail_every
+
+        server = StubRegularApiServer(("127.0.0.1", 0), StubRegularApiHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        config = WayForPayConfig(
+            merchant_account="benchmark_merchant",
+            merchant_password="benchmark",
+            base_url=f"http://127.0.0.1:{server.server_address[1]}/regularApi",
+        )
+        refs = [f"SUB_{n}" for n in range(1, count + 1)]
+
+        try:
+            sequential = self._run(config, refs, 1, fail_every)
+            concurrent = self._run(config, refs, concurrency, fail_every)
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        self.stdout.write(self.style.SUCCESS(f"x{sequential / concurrent:.2f} faster with --concurrency {concurrency}"))
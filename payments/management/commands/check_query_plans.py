@@ -0,0 +1,244 @@
+from __future__ import annotations
+
+import random
+import re
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from payments.models import Event, KeyCRMExternalTransaction, Subscription, SubscriptionOrder, TicketOrder
+
+# Повний прохід таблиці: PostgreSQL "Seq Scan", SQLite "SCAN <table>" без індексу
+FULL_SCAN_RE = re.compile(r"\bSeq Scan\b|\bSCAN \S+(?! USING)\s*$", re.MULTILINE)
+
+
+class Command(BaseCommand):
+    help = (
+        "EXPLAIN the hot TicketOrder/SubscriptionOrder/Subscription/KeyCRM transaction lookups, "
+        "fail if a query does not use one of its expected indexes or scans a whole table, and report timings. "
+        "--seed N inserts N rows per table inside a transaction that is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--seed",
+            type=int,
+            default=0,
+            help="Rows per table to seed before checking (e.g. 1000000). Rolled back afterwards.",
+        )
+        parser.add_argument(
+            "--repeat",
+            type=int,
+            default=50,
+            help="Executions per query for timings.",
+        )
+        parser.add_argument(
+            "--verbose-plans",
+            action="store_true",
+            help="Print the full EXPLAIN output for each query.",
+        )
+
+    def _seed(self, rows: int) -> None:
+        event = Event.objects.create(title="Query plan check", max_tickets=rows, is_active=False)
+        now = timezone.now()
+        statuses = ["success"] * 90 + ["expired"] * 8 + ["failed", "pending"]
+        batch = 10000
+
+        started = time.perf_counter()
+        for offset in range(0, rows, batch):
+            size = min(batch, rows - offset)
+            TicketOrder.objects.bulk_create([
+                TicketOrder(
+                    name=f"Seed {i}",
+                    email=f"seed{i}@example.com",
+                    phone=f"+380{i:09d}",
+                    amount=Decimal("1559.00"),
+                    event=event,
+                    payment_status=random.choice(statuses),
+                    wayforpay_order_reference=f"SEED_ORDER_{i}",
+                )
+                for i in range(offset, offset + size)
+            ])
+            SubscriptionOrder.objects.bulk_create([
+                SubscriptionOrder(
+                    name=f"Seed {i}",
+                    email=f"seed{i % (rows // 3 or 1)}@example.com",
+                    email_normalized=f"seed{i % (rows // 3 or 1)}@example.com",
+                    phone=f"+380{i:09d}",
+                    phone_key=f"{i:09d}"[-9:],
+                    payment_status=random.choice(["success"] * 8 + ["failed", "pending"]),
+                    callback_processed=random.random() < 0.9,
+                    wayforpay_order_reference=f"SEED_SUB_{i}",
+                )
+                for i in range(offset, offset + size)
+            ])
+            KeyCRMExternalTransaction.objects.bulk_create([
+                KeyCRMExternalTransaction(
+                    keycrm_id=10**12 + i,
+                    uuid=f"seed-{i}",
+                    amount=Decimal(random.choice(["1559.00", "1299.00", "499.00"])),
+                    description=f"Оплата замовлення SEED_ORDER_{i}",
+                    order_reference=f"SEED_ORDER_{i}",
+                    order_number=i,
+                    auth_code=f"{i:06d}",
+                )
+                for i in range(offset, offset + size)
+            ])
+            # черга синхронізації: лише невелика частка підписок на черзі зараз
+            Subscription.objects.bulk_create([
+                Subscription(
+                    order_reference=f"SEED_SUB_{i}",
+                    status=random.choice(["active"] * 6 + ["suspended", "removed", "completed"]),
+                    next_sync_at=now + timedelta(hours=random.uniform(-1, 24 * 30)),
+                )
+                for i in range(offset, offset + size)
+            ])
+
+        # auto_now_add не дає задати дату при вставці — розкидаємо created_at за рік
+        TicketOrder.objects.filter(event=event).update(created_at=now - timedelta(days=365))
+        TicketOrder.objects.filter(event=event, payment_status="pending").update(created_at=now)
+
+        if connection.vendor in ("postgresql", "sqlite"):
+            with connection.cursor() as cursor:
+                cursor.execute("ANALYZE")
+        self.stdout.write(f"Seeded {rows} rows per table in {time.perf_counter() - started:.1f}s")
+
+    def _hot_queries(self):
+        now = timezone.now()
+        ticket_reference = (
+            TicketOrder.objects.exclude(wayforpay_order_reference=None)
+            .values_list("wayforpay_order_reference", flat=True).first() or "ORDER_0_0"
+        )
+        subscription = SubscriptionOrder.objects.order_by("-id").first()
+        subscription_reference = getattr(subscription, "wayforpay_order_reference", None) or "SUB_0"
+        subscription_email = getattr(subscription, "email_normalized", "") or "user@example.com"
+        subscription_phone_key = getattr(subscription, "phone_key", "") or "000000000"
+        event_id = Event.objects.order_by("-id").values_list("id", flat=True).first() or 0
+
+        return [
+            (
+                "wayforpay_callback: TicketOrder by orderReference",
+                TicketOrder.objects.filter(wayforpay_order_reference=ticket_reference),
+                # SQLite тримає UniqueConstraint як sqlite_autoindex_<table>_N
+                ("ticket_wfp_reference_uniq", "sqlite_autoindex_payments_ticketorder_"),
+            ),
+            (
+                "subscription callback: SubscriptionOrder by orderReference",
+                SubscriptionOrder.objects.filter(wayforpay_order_reference=subscription_reference),
+                ("sub_wfp_reference_idx",),
+            ),
+            (
+                "inventory: expired holds of an event",
+                TicketOrder.objects.filter(
+                    event_id=event_id,
+                    payment_status="pending",
+                    created_at__lt=now - timedelta(minutes=10),
+                ).order_by("created_at"),
+                ("ticket_event_pay_created_idx",),
+            ),
+            (
+                "sweeper: events with pending holds",
+                TicketOrder.objects.filter(payment_status="pending").values("event_id").distinct(),
+                ("ticket_status_created_idx",),
+            ),
+            (
+                "reconcile: KeyCRM transaction by amount + orderReference",
+                KeyCRMExternalTransaction.objects.filter(
+                    amount=Decimal("1559.00"),
+                    order_reference=ticket_reference,
+                ),
+                ("kc_tx_amount_ref_idx",),
+            ),
+            (
+                "reconcile: KeyCRM transaction by amount + #order id",
+                KeyCRMExternalTransaction.objects.filter(amount=Decimal("1559.00"), order_number=event_id),
+                ("kc_tx_amount_number_idx",),
+            ),
+            (
+                "reconcile: KeyCRM transaction by amount + authCode",
+                KeyCRMExternalTransaction.objects.filter(amount=Decimal("1559.00"), auth_code="913434"),
+                ("kc_tx_amount_auth_idx",),
+            ),
+            (
+                "sync_wayforpay_subscriptions: due subscriptions",
+                Subscription.objects.filter(next_sync_at__lte=now).order_by("next_sync_at"),
+                ("sub_next_sync_idx",),
+            ),
+            (
+                "find_subscription_by_callback: pending by email + phone",
+                SubscriptionOrder.objects.filter(
+                    email_normalized=subscription_email,
+                    phone_key=subscription_phone_key,
+                    payment_status="pending",
+                    callback_processed=False,
+                ).order_by("-created_at"),
+                # обидва індекси селективні — планувальник бере будь-який
+                ("sub_email_norm_status_idx", "sub_phone_key_status_idx"),
+            ),
+            (
+                "find_subscription_by_callback: recent pending by email or phone",
+                SubscriptionOrder.objects.filter(
+                    Q(email_normalized=subscription_email) | Q(phone_key=subscription_phone_key),
+                    payment_status="pending",
+                    callback_processed=False,
+                    created_at__gte=now - timedelta(minutes=5),
+                ).order_by("-created_at"),
+                # OR двох контактних індексів (BitmapOr / MULTI-INDEX OR) або вікно 5 хв за статусом
+                ("sub_email_norm_status_idx", "sub_phone_key_status_idx", "sub_status_created_idx"),
+            ),
+            (
+                "find_subscription_by_callback: recent pending",
+                SubscriptionOrder.objects.filter(
+                    payment_status="pending",
+                    callback_processed=False,
+                    created_at__gte=now - timedelta(minutes=5),
+                ).order_by("-created_at"),
+                ("sub_status_created_idx",),
+            ),
+        ]
+
+    @staticmethod
+    def _explain(queryset) -> str:
+        # QuerySet.explain() на SQLite обрізає план values()-запитів до першої колонки (id вузла)
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f"{connection.ops.explain_query_prefix()} {sql}", params)
+            return "\n".join(" ".join(str(col) for col in row) for row in cursor.fetchall())
+
+    def _check(self, repeat: int, verbose: bool) -> list:
+        failures = []
+        for label, queryset, index_names in self._hot_queries():
+            plan = self._explain(queryset)
+            used = next((name for name in index_names if name in plan), None)
+            uses_index = used is not None and not FULL_SCAN_RE.search(plan)
+
+            started = time.perf_counter()
+            for _ in range(repeat):
+                list(queryset[:20])
+            avg_ms = (time.perf_counter() - started) * 1000 / repeat
+
+            mark = "OK  " if uses_index else "FAIL"
+            self.stdout.write(f"{mark} {avg_ms:8.2f} ms  {label} [{used or ' | '.join(index_names)}]")
+            if verbose or not uses_index:
+                self.stdout.write(f"      {plan}".replace("\n", "\n      "))
+            if not uses_index:
+                failures.append(label)
+        return failures
+
+    def handle(self, *args, **options):
+        repeat = max(1, int(options["repeat"]))
+
+        with transaction.atomic():
+            if options["seed"]:
+                self._seed(int(options["seed"]))
+            failures = self._check(repeat, options["verbose_plans"])
+            # засіяні дані ніколи не потрапляють у БД
+            transaction.set_rollback(True)
+
+        if failures:
+            raise CommandError(f"{len(failures)} hot queries do not use their index: {', '.join(failures)}")
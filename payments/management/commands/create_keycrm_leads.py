@@ -0,0 +1,58 @@
+from __future__ import annotations
+
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from payments.services.outbox import claim_jobs, release_stale_jobs
+from payments.tasks import create_keycrm_leads
+
+
+class Command(BaseCommand):
+    help = "Create queued KeyCRM leads for ticket/subscription orders (batched, bounded concurrency, backoff)."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=20,
+            help="Max number of leads claimed per pass.",
+        )
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=None,
+            help="Parallel KeyCRM requests (default: KEYCRM_LEAD_CONCURRENCY).",
+        )
+        parser.add_argument(
+            "--loop",
+            action="store_true",
+            help="Keep running instead of exiting after one pass.",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=2.0,
+            help="Seconds to sleep when the queue is empty in --loop mode.",
+        )
+
+    def handle(self, *args, **options):
+        batch_size = max(1, int(options["batch_size"]))
+        concurrency = options["concurrency"] or getattr(settings, "KEYCRM_LEAD_CONCURRENCY", 4)
+
+        while True:
+            release_stale_jobs()
+            jobs = claim_jobs(batch_size=batch_size, kinds=["keycrm_lead"])
+            if jobs:
+                stats = create_keycrm_leads(jobs, concurrency=concurrency)
+                self.stdout.write(
+                    f"Leads {len(jobs)}: created={stats['created']} skipped={stats['skipped']} "
+                    f"throttled={stats['throttled']} retried={stats['retried']} failed={stats['failed']} "
+                    f"review={stats['review']}"
+                )
+
+            if not options["loop"]:
+                break
+            if len(jobs) < batch_size:
+                time.sleep(float(options["interval"]))
@@ -0,0 +1,51 @@
+from __future__ import annotations
+
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from payments.services.inventory import sweep_expired_reservations, sweep_stats
+
+
+class Command(BaseCommand):
+    help = "Expire unpaid ticket reservations in bounded batches and release their seats."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=settings.TICKET_RESERVATION_SWEEP_BATCH_SIZE,
+            help="Max number of reservations expired per event per pass.",
+        )
+        parser.add_argument(
+            "--loop",
+            action="store_true",
+            help="Keep running instead of exiting once nothing is left to expire.",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=15.0,
+            help="Seconds between passes in --loop mode.",
+        )
+
+    def handle(self, *args, **options):
+        batch_size = max(1, int(options["batch_size"]))
+
+        while True:
+            released = sweep_expired_reservations(batch_size=batch_size)
+            stats = sweep_stats()
+            if released:
+                per_event = " ".join(f"event={event_id}:{count}" for event_id, count in released.items())
+                self.stdout.write(
+                    f"Released {stats['last_released']} seats in {stats['last_sweep_seconds']:.3f}s "
+                    f"({per_event}), total={stats['released_total']}"
+                )
+
+            # повна пачка — одразу наступний прохід
+            if any(count >= batch_size for count in released.values()):
+                continue
+            if not options["loop"]:
+                break
+            time.sleep(float(options["interval"]))
@@ -0,0 +1,66 @@
+from __future__ import annotations
+
+from django.core.management.base import BaseCommand, CommandError
+
+from payments.models import Event
+from payments.services.ticket_issuance import issue_free_tickets, load_guests
+
+
+class Command(BaseCommand):
+    help = "Bulk-issue free guest tickets from a CSV (name,email,phone) or JSON file."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="CSV or JSON file with guests.")
+        parser.add_argument(
+            "--event",
+            type=int,
+            default=None,
+            help="Event id (default: the active event).",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=None,
+            help="Number of PDF render processes (default: CPU count).",
+        )
+        parser.add_argument(
+            "--no-email",
+            action="store_true",
+            help="Only create orders and render PDFs, do not enqueue emails.",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            guests = load_guests(options["path"])
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+
+        if not guests:
+            self.stdout.write("No guests in file.")
+            return
+
+        event = None
+        if options["event"]:
+            try:
+                event = Event.objects.get(pk=options["event"])
+            except Event.DoesNotExist:
+                raise CommandError(f"Event {options['event']} not found")
+
+        try:
+            report = issue_free_tickets(
+                guests,
+                event=event,
+                workers=options["workers"],
+                send_email=not options["no_email"],
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        for order_id, error in sorted(report.failures.items()):
+            self.stderr.write(f"[FAIL] order #{order_id}: {error}")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Done. issued={len(report.issued)} failed={len(report.failures)} "
+            f"render={report.render_seconds:.2f}s ({report.tickets_per_second:.1f} tickets/s) "
+            f"total={report.total_seconds:.2f}s"
+        ))
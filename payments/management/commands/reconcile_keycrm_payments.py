@@ -0,0 +1,49 @@
+from __future__ import annotations
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from payments.services.outbox import claim_jobs, release_stale_jobs
+from payments.tasks import reconcile_ticket_payments
+
+
+class Command(BaseCommand):
+    help = "Attach WayForPay transactions to KeyCRM payments for paid tickets (batched, scheduled retries)."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=100,
+            help="Max number of orders reconciled per KeyCRM transactions fetch.",
+        )
+        parser.add_argument(
+            "--loop",
+            action="store_true",
+            help="Keep running instead of exiting after one pass.",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=30.0,
+            help="Seconds between passes in --loop mode.",
+        )
+
+    def handle(self, *args, **options):
+        batch_size = max(1, int(options["batch_size"]))
+
+        while True:
+            release_stale_jobs()
+            jobs = claim_jobs(batch_size=batch_size, kinds=["ticket_keycrm_payment"])
+            if jobs:
+                stats = reconcile_ticket_payments(jobs)
+                self.stdout.write(
+                    f"Reconciled {len(jobs)}: attached={stats['attached']} manual={stats['manual']} "
+                    f"deferred={stats['deferred']} failed={stats['failed']}"
+                )
+
+            if not options["loop"]:
+                break
+            if len(jobs) < batch_size:
+                time.sleep(float(options["interval"]))
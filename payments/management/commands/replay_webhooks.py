@@ -0,0 +1,49 @@
+from __future__ import annotations
+
+from django.core.management.base import BaseCommand, CommandError
+
+from payments.models import WebhookInbox
+from payments.services.webhook_inbox import replay_webhook
+
+
+class Command(BaseCommand):
+    help = "Reprocess stored WayForPay callbacks from the webhook inbox (failed ones by default)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("ids", nargs="*", type=int, help="Inbox entry ids to replay (any status).")
+        parser.add_argument(
+            "--source",
+            choices=[choice for choice, _ in WebhookInbox.SOURCE_CHOICES],
+            help="Only callbacks of this source.",
+        )
+        parser.add_argument("--order-reference", help="Only callbacks with this orderReference.")
+        parser.add_argument("--limit", type=int, default=100, help="Max entries to replay.")
+        parser.add_argument("--dry-run", action="store_true", help="List entries without replaying.")
+
+    def handle(self, *args, **options):
+        if options["ids"]:
+            entries = WebhookInbox.objects.filter(id__in=options["ids"])
+        else:
+            entries = WebhookInbox.objects.filter(status="failed")
+        if options["source"]:
+            entries = entries.filter(source=options["source"])
+        if options["order_reference"]:
+            entries = entries.filter(order_reference=options["order_reference"])
+
+        entries = list(entries.order_by("received_at")[:max(1, int(options["limit"]))])
+        if not entries:
+            raise CommandError("No matching webhook inbox entries.")
+
+        replayed = failed = 0
+        for entry in entries:
+            if options["dry_run"]:
+                self.stdout.write(f"dry-run: #{entry.id} {entry} attempts={entry.attempts} error={entry.last_error[:80]}")
+                continue
+            response = replay_webhook(entry)
+            if response.status_code == 200:
+                replayed += 1
+            else:
+                failed += 1
+            self.stdout.write(f"#{entry.id} {entry.source}:{entry.order_reference} -> HTTP {response.status_code}")
+
+        self.stdout.write(self.style.SUCCESS(f"Done. replayed={replayed} failed={failed}"))
@@ -0,0 +1,65 @@
+from __future__ import annotations
+
+import time
+
+from django.core.management.base import BaseCommand
+
+import payments.tasks  # noqa: F401 — реєструє обробники завдань
+from payments.services.outbox import claim_jobs, registered_kinds, release_stale_jobs, run_job
+
+
+class Command(BaseCommand):
+    help = "Process background outbox jobs (ticket delivery, KeyCRM updates) with retries and backoff."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Process currently due jobs and exit.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=10,
+            help="Number of jobs claimed per iteration.",
+        )
+        parser.add_argument(
+            "--sleep",
+            type=float,
+            default=2.0,
+            help="Seconds to sleep when the queue is empty.",
+        )
+        parser.add_argument(
+            "--kind",
+            action="append",
+            dest="kinds",
+            default=None,
+            help="Only process jobs of this kind (can be repeated).",
+        )
+
+    def handle(self, *args, **options):
+        batch_size = max(1, int(options["batch_size"]))
+        sleep_seconds = float(options["sleep"])
+        # ticket_keycrm_payment і keycrm_lead обробляють пачками
+        # reconcile_keycrm_payments і create_keycrm_leads
+        kinds = options["kinds"] or registered_kinds()
+
+        done = 0
+        failed = 0
+
+        while True:
+            release_stale_jobs()
+            jobs = claim_jobs(batch_size=batch_size, kinds=kinds)
+
+            for job in jobs:
+                if run_job(job):
+                    done += 1
+                else:
+                    failed += 1
+
+            if options["once"] and not jobs:
+                break
+            if not jobs:
+                time.sleep(sleep_seconds)
+
+        self.stdout.write(self.style.SUCCESS(f"Done. processed={done} failed={failed}"))
@@ -0,0 +1,45 @@
+from __future__ import annotations
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from payments.services.keycrm_transactions import sync_external_transactions
+
+
+class Command(BaseCommand):
+    help = "Mirror KeyCRM external transactions into the local table (incremental down to the last completed pass)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--page-size", type=int, default=100, help="Transactions per KeyCRM request.")
+        parser.add_argument("--max-pages", type=int, default=None, help="Stop after this many pages per pass.")
+        parser.add_argument(
+            "--full",
+            action="store_true",
+            help="Re-read all transactions instead of stopping at the newest stored one (initial backfill).",
+        )
+        parser.add_argument(
+            "--loop",
+            action="store_true",
+            help="Keep running instead of exiting after one pass.",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=30.0,
+            help="Seconds between passes in --loop mode.",
+        )
+
+    def handle(self, *args, **options):
+        page_size = max(1, int(options["page_size"]))
+        full = options["full"]
+
+        while True:
+            stats = sync_external_transactions(page_size=page_size, max_pages=options["max_pages"], full=full)
+            self.stdout.write(f"Synced pages={stats['pages']} stored={stats['stored']} errors={stats['errors']}")
+            # повне перечитування — лише на першому проході
+            full = False
+
+            if not options["loop"]:
+                break
+            time.sleep(float(options["interval"]))
@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import asyncio
 from dataclasses import dataclass
 from datetime import datetime
 from typing import Optional, Any
@@ -9,7 +10,17 @@ from django.core.management.base import BaseCommand
 from django.utils import timezone as dj_timezone
 
 from payments.models import Subscription, SubscriptionOrder
-from payments.services.wayforpay_client import WayForPayRegularClient, WayForPayConfig
+from payments.services.subscription_sync import (
+    compute_next_sync_at,
+    due_order_references,
+    latest_orders,
+    schedule_failed,
+    subscription_orders,
+)
+from payments.services.wayforpay_client import AsyncWayForPayRegularClient, WayForPayConfig
+
+# Скільки orderReference запитуємо за один прохід event loop перед записом у БД
+FETCH_CHUNK_SIZE = 500
 
 
 def _dt_from_unix(ts: Any) -> Optional[datetime]:
@@ -110,8 +121,98 @@ def _safe_decimal_amount(v: Any):
         return None
 
 
+def apply_status(order: Optional[SubscriptionOrder], order_ref: str, data: dict) -> Subscription:
+    """Записує відповідь STATUS у Subscription (створює її за потреби) і планує наступну синхронізацію"""
+    reason_code = data.get("reasonCode")
+    reason = (data.get("reason") or data.get("message") or "").strip()
+
+    # ✅ створюємо/дістаємо Subscription завжди (щоб "усі підписки відображались")
+    sub, _ = Subscription.objects.get_or_create(
+        order_reference=order_ref,
+        defaults={
+            "source_order": order,
+            "name": getattr(order, "name", "") or "",
+            "email": getattr(order, "email", "") or "",
+            "phone": getattr(order, "phone", "") or "",
+            "currency": "",
+            "status": "unknown",
+        },
+    )
+
+    # ✅ завжди оновимо контакти/посилання на source_order
+    if order is not None:
+        if not sub.source_order:
+            sub.source_order = order
+        sub.name = order.name or sub.name
+        sub.email = order.email or sub.email
+        sub.phone = order.phone or sub.phone
+
+    # ✅ якщо payload містить статусні поля — оновлюємо їх навіть при reasonCode != 4100
+    if _has_meaningful_status_payload(data):
+        wfp_status = _pick_status_field(data)
+        sub.status = _normalize_status(wfp_status)
+
+        sub.mode = (data.get("mode") or data.get("regularMode") or sub.mode or "").strip()
+        sub.currency = (data.get("currency") or data.get("regularCurrency") or sub.currency or "").strip()
+
+        amt = data.get("regularAmount") if data.get("regularAmount") is not None else data.get("amount")
+        amt_norm = _safe_decimal_amount(amt)
+        if amt_norm is not None:
+            try:
+                sub.amount = amt_norm
+            except Exception:
+                pass
+
+        sub.date_begin = _dt_from_unix(data.get("dateBegin") or data.get("regularDateBegin"))
+        sub.date_end = _dt_from_unix(data.get("dateEnd") or data.get("regularDateEnd"))
+
+        # nextPaymentDate інколи є навіть для Removed — це може плутати в UI.
+        next_dt = _dt_from_unix(data.get("nextPaymentDate"))
+        if sub.status in ("removed", "completed"):
+            sub.next_payment_date = None
+        else:
+            sub.next_payment_date = next_dt
+
+    else:
+        # payload не містить корисних статусних полів — лишимо unknown
+        sub.status = sub.status or "unknown"
+
+    # ✅ оновлюємо lastPayed* навіть якщо немає інших полів
+    if data.get("lastPayedDate") not in (None, "", 0):
+        sub.last_payed_date = _dt_from_unix(data.get("lastPayedDate"))
+    if data.get("lastPayedStatus") not in (None, ""):
+        sub.last_payed_status = (data.get("lastPayedStatus") or "").strip()
+
+    # ✅ завжди зберігаємо reason/reasonCode/raw + sync time
+    sub.last_reason_code = reason_code
+    sub.last_reason = reason
+    sub.last_sync_raw = data
+    sub.last_sync_at = dj_timezone.now()
+    sub.next_sync_at = compute_next_sync_at(sub, sub.last_sync_at)
+
+    # ✅ збережемо все одним save
+    sub.save(update_fields=[
+        "source_order", "name", "email", "phone",
+        "status", "mode", "amount", "currency",
+        "date_begin", "date_end", "last_payed_date", "last_payed_status", "next_payment_date",
+        "last_reason", "last_reason_code", "last_sync_at", "last_sync_raw", "next_sync_at",
+        "updated_at",
+    ])
+    return sub
+
+
+async def fetch_statuses(config: WayForPayConfig, order_refs: list[str], concurrency: int,
+                         transport=None) -> dict:
+    """STATUS для пачки orderReference паралельно (не більше concurrency запитів одночасно)"""
+    async with AsyncWayForPayRegularClient(config, concurrency=concurrency, transport=transport) as client:
+        return {order_ref: result async for order_ref, result in client.status_many(order_refs)}
+
+
 class Command(BaseCommand):
-    help = "Sync subscriptions status from WayForPay regularApi (STATUS) into payments.Subscription"
+    help = (
+        "Sync subscriptions status from WayForPay regularApi (STATUS) into payments.Subscription. "
+        "By default only new subscriptions and those whose next_sync_at is due; --full syncs every order."
+    )
 
     def add_arguments(self, parser):
         parser.add_argument(
@@ -126,6 +227,18 @@ class Command(BaseCommand):
             default=False,
             help="Include orders with any payment_status (by default only success)",
         )
+        parser.add_argument(
+            "--full",
+            action="store_true",
+            default=False,
+            help="Ignore next_sync_at and sync every orderReference (previous behaviour)",
+        )
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=getattr(settings, "WAYFORPAY_SYNC_CONCURRENCY", 8),
+            help="Max STATUS requests in flight (1 = one at a time)",
+        )
 
     def handle(self, *args, **options):
         merchant_account = getattr(settings, "WAYFORPAY_MERCHANT_ACCOUNT", None)
@@ -136,135 +249,58 @@ class Command(BaseCommand):
                 "WAYFORPAY_MERCHANT_ACCOUNT / WAYFORPAY_MERCHANT_PASSWORD are not set in settings/env"
             )
 
-        client = WayForPayRegularClient(
-            WayForPayConfig(
-                merchant_account=merchant_account,
-                merchant_password=merchant_password,
-            )
+        config = WayForPayConfig(
+            merchant_account=merchant_account,
+            merchant_password=merchant_password,
         )
-
-        qs = SubscriptionOrder.objects.exclude(
-            wayforpay_order_reference__isnull=True
-        ).exclude(
-            wayforpay_order_reference__exact=""
-        )
-
-        if not options.get("all"):
-            qs = qs.filter(payment_status="success")
-
-        qs = qs.order_by("-created_at")
+        concurrency = max(1, int(options.get("concurrency") or 1))
 
         limit = int(options.get("limit") or 0)
 
-        total = 0
         updated = 0
         skipped = 0
         failed = 0
-
-        seen_refs: set[str] = set()
-
-        for order in qs:
-            order_ref = (order.wayforpay_order_reference or "").strip()
-            if not order_ref:
-                skipped += 1
-                continue
-
-            # ✅ дедуп по orderReference
-            if order_ref in seen_refs:
-                skipped += 1
-                continue
-            seen_refs.add(order_ref)
-
-            total += 1
-            if limit > 0 and total > limit:
-                break
-
-            try:
-                data = client.status(order_ref)
-            except Exception as e:
-                failed += 1
-                self.stderr.write(f"[FAIL] {order_ref}: {e}")
-                continue
-
-            reason_code = data.get("reasonCode")
-            reason = (data.get("reason") or data.get("message") or "").strip()
-
-            # ✅ створюємо/дістаємо Subscription завжди (щоб "усі підписки відображались")
-            sub, _ = Subscription.objects.get_or_create(
-                order_reference=order_ref,
-                defaults={
-                    "source_order": order,
-                    "name": order.name or "",
-                    "email": order.email or "",
-                    "phone": order.phone or "",
-                    "currency": "",
-                    "status": "unknown",
-                },
-            )
-
-            # ✅ завжди оновимо контакти/посилання на source_order
-            if not sub.source_order:
-                sub.source_order = order
-            sub.name = order.name or sub.name
-            sub.email = order.email or sub.email
-            sub.phone = order.phone or sub.phone
-
-            # ✅ якщо payload містить статусні поля — оновлюємо їх навіть при reasonCode != 4100
-            if _has_meaningful_status_payload(data):
-                wfp_status = _pick_status_field(data)
-                sub.status = _normalize_status(wfp_status)
-
-                sub.mode = (data.get("mode") or data.get("regularMode") or sub.mode or "").strip()
-                sub.currency = (data.get("currency") or data.get("regularCurrency") or sub.currency or "").strip()
-
-                amt = data.get("regularAmount") if data.get("regularAmount") is not None else data.get("amount")
-                amt_norm = _safe_decimal_amount(amt)
-                if amt_norm is not None:
-                    try:
-                        sub.amount = amt_norm
-                    except Exception:
-                        pass
-
-                sub.date_begin = _dt_from_unix(data.get("dateBegin") or data.get("regularDateBegin"))
-                sub.date_end = _dt_from_unix(data.get("dateEnd") or data.get("regularDateEnd"))
-
-                # nextPaymentDate інколи є навіть для Removed — це може плутати в UI.
-                next_dt = _dt_from_unix(data.get("nextPaymentDate"))
-                if sub.status in ("removed", "completed"):
-                    sub.next_payment_date = None
-                else:
-                    sub.next_payment_date = next_dt
-
-            else:
-                # payload не містить корисних статусних полів — лишимо unknown
-                sub.status = sub.status or "unknown"
-
-            # ✅ оновлюємо lastPayed* навіть якщо немає інших полів
-            if data.get("lastPayedDate") not in (None, "", 0):
-                sub.last_payed_date = _dt_from_unix(data.get("lastPayedDate"))
-            if data.get("lastPayedStatus") not in (None, ""):
-                sub.last_payed_status = (data.get("lastPayedStatus") or "").strip()
-
-            # ✅ завжди зберігаємо reason/reasonCode/raw + sync time
-            sub.last_reason_code = reason_code
-            sub.last_reason = reason
-            sub.last_sync_raw = data
-            sub.last_sync_at = dj_timezone.now()
-
-            # ✅ збережемо все одним save
-            sub.save(update_fields=[
-                "source_order", "name", "email", "phone",
-                "status", "mode", "amount", "currency",
-                "date_begin", "date_end", "last_payed_date", "last_payed_status", "next_payment_date",
-                "last_reason", "last_reason_code", "last_sync_at", "last_sync_raw",
-                "updated_at",
-            ])
-
-            updated += 1
-            self.stdout.write(
-                f"[OK] {order_ref}: status={sub.status} reasonCode={reason_code} next={sub.next_payment_date}"
-            )
+        not_due = 0
+
+        if options.get("full"):
+            # ✅ дедуп по orderReference (найновіше замовлення виграє)
+            orders_by_ref: dict[str, SubscriptionOrder] = {}
+            for order in subscription_orders(options.get("all")).order_by("-created_at").iterator():
+                order_ref = (order.wayforpay_order_reference or "").strip()
+                if not order_ref or order_ref in orders_by_ref:
+                    skipped += 1
+                    continue
+                if limit > 0 and len(orders_by_ref) >= limit:
+                    break
+                orders_by_ref[order_ref] = order
+            order_refs = list(orders_by_ref)
+        else:
+            order_refs, not_due = due_order_references(limit=limit, include_all=options.get("all"))
+            orders_by_ref = latest_orders(order_refs)
+
+        total = len(order_refs)
+
+        for start in range(0, total, FETCH_CHUNK_SIZE):
+            chunk = order_refs[start:start + FETCH_CHUNK_SIZE]
+            results = asyncio.run(fetch_statuses(config, chunk, concurrency))
+
+            failed_refs = []
+            for order_ref in chunk:
+                data = results[order_ref]
+                if isinstance(data, Exception):
+                    failed += 1
+                    failed_refs.append(order_ref)
+                    self.stderr.write(f"[FAIL] {order_ref}: {data}")
+                    continue
+
+                sub = apply_status(orders_by_ref.get(order_ref), order_ref, data)
+                updated += 1
+                self.stdout.write(
+                    f"[OK] {order_ref}: status={sub.status} reasonCode={sub.last_reason_code} "
+                    f"next={sub.next_payment_date} next_sync={sub.next_sync_at}"
+                )
+            schedule_failed(failed_refs)
 
         self.stdout.write(self.style.SUCCESS(
-            f"Done. total={total} updated={updated} failed={failed} skipped={skipped}"
+            f"Done. total={total} updated={updated} failed={failed} skipped={skipped} not_due={not_due}"
         ))
@@ -0,0 +1,20 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("payments", "0029_subscriptionorder_wayforpay_contact"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="event",
+            name="ticket_template",
+            field=models.ImageField(
+                blank=True,
+                help_text="Постер для PDF-квитка. Якщо порожньо — стандартний шаблон",
+                upload_to="ticket_templates/",
+                verbose_name="Шаблон квитка",
+            ),
+        ),
+    ]
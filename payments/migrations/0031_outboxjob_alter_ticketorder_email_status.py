@@ -0,0 +1,39 @@
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0030_event_ticket_template'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='ticketorder',
+            name='email_status',
+            field=models.CharField(choices=[('not_sent', 'Не надіслано'), ('queued', 'В черзі на відправку'), ('sent', 'Надіслано'), ('failed', 'Помилка відправки')], default='not_sent', max_length=20),
+        ),
+        migrations.CreateModel(
+            name='OutboxJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('ticket_paid', 'Квиток оплачено: PDF + email'), ('ticket_keycrm_payment', 'Квиток оплачено: оплата в KeyCRM')], max_length=50, verbose_name='Тип')),
+                ('payload', models.JSONField(blank=True, default=dict, verbose_name='Дані')),
+                ('status', models.CharField(choices=[('pending', 'В черзі'), ('running', 'Виконується'), ('done', 'Виконано'), ('failed', 'Помилка')], default='pending', max_length=20, verbose_name='Статус')),
+                ('attempts', models.PositiveIntegerField(default=0, verbose_name='Спроб')),
+                ('max_attempts', models.PositiveIntegerField(default=5, verbose_name='Максимум спроб')),
+                ('run_after', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Виконати після')),
+                ('locked_at', models.DateTimeField(blank=True, null=True, verbose_name='Взято в роботу')),
+                ('last_error', models.TextField(blank=True, default='', verbose_name='Остання помилка')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Фонове завдання',
+                'verbose_name_plural': 'Фонові завдання',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['status', 'run_after'], name='outbox_status_run_after_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,57 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0031_outboxjob_alter_ticketorder_email_status'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='outboxjob',
+            name='kind',
+            field=models.CharField(choices=[('ticket_paid', 'Квиток оплачено: PDF + email'), ('ticket_keycrm_payment', 'Квиток оплачено: оплата в KeyCRM'), ('email_campaign', 'Масова розсилка')], max_length=50, verbose_name='Тип'),
+        ),
+        migrations.CreateModel(
+            name='EmailCampaign',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('subject', models.CharField(max_length=255, verbose_name='Тема')),
+                ('template', models.CharField(blank=True, default='', max_length=255, verbose_name='Шаблон')),
+                ('text_body', models.TextField(verbose_name='Текст листа')),
+                ('html_body', models.TextField(blank=True, default='', verbose_name='HTML листа')),
+                ('status', models.CharField(choices=[('queued', 'В черзі'), ('running', 'Надсилається'), ('done', 'Завершено'), ('failed', 'Помилка')], default='queued', max_length=20, verbose_name='Статус')),
+                ('recipients_loaded', models.BooleanField(default=False, verbose_name='Отримувачів завантажено')),
+                ('total', models.PositiveIntegerField(default=0, verbose_name='Всього')),
+                ('sent', models.PositiveIntegerField(default=0, verbose_name='Надіслано')),
+                ('failed', models.PositiveIntegerField(default=0, verbose_name='Помилок')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True, verbose_name='Початок')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='Завершення')),
+            ],
+            options={
+                'verbose_name': 'Розсилка',
+                'verbose_name_plural': 'Розсилки',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='EmailCampaignRecipient',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('email', models.EmailField(max_length=254)),
+                ('status', models.CharField(choices=[('pending', 'В черзі'), ('sent', 'Надіслано'), ('failed', 'Помилка')], default='pending', max_length=20)),
+                ('error', models.TextField(blank=True, default='')),
+                ('sent_at', models.DateTimeField(blank=True, null=True)),
+                ('campaign', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recipients', to='payments.emailcampaign')),
+            ],
+            options={
+                'verbose_name': 'Отримувач розсилки',
+                'verbose_name_plural': 'Отримувачі розсилки',
+                'constraints': [models.UniqueConstraint(fields=('campaign', 'email'), name='unique_campaign_recipient')],
+                'indexes': [models.Index(fields=['campaign', 'status', 'id'], name='campaign_recipient_status_idx')],
+            },
+        ),
+    ]
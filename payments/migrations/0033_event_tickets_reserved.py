@@ -0,0 +1,40 @@
+from datetime import timedelta
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def fill_tickets_reserved(apps, schema_editor):
+    Event = apps.get_model("payments", "Event")
+    TicketOrder = apps.get_model("payments", "TicketOrder")
+
+    TicketOrder.objects.filter(
+        payment_status="pending",
+        created_at__lt=timezone.now() - timedelta(minutes=10),
+    ).update(payment_status="expired")
+
+    for event in Event.objects.all():
+        reserved = TicketOrder.objects.filter(
+            event=event,
+            payment_status__in=["success", "pending"],
+        ).count()
+        Event.objects.filter(pk=event.pk).update(tickets_reserved=reserved)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("payments", "0032_emailcampaign_emailcampaignrecipient_and_more"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="event",
+            name="tickets_reserved",
+            field=models.PositiveIntegerField(
+                default=0,
+                help_text="Оплачені квитки + активні броні. Оновлюється атомарно при бронюванні",
+                verbose_name="Зайнято місць",
+            ),
+        ),
+        migrations.RunPython(fill_tickets_reserved, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,20 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0033_event_tickets_reserved'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='event',
+            name='reservation_ttl_minutes',
+            field=models.PositiveIntegerField(default=10, help_text='Скільки хвилин неоплачене замовлення тримає місце', verbose_name='Час броні (хв)'),
+        ),
+        migrations.AddIndex(
+            model_name='ticketorder',
+            index=models.Index(fields=['payment_status', 'created_at'], name='ticket_status_created_idx'),
+        ),
+    ]
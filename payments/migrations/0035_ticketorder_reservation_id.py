@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0034_event_reservation_ttl_minutes_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ticketorder',
+            name='reservation_id',
+            field=models.CharField(blank=True, default='', help_text='ID броні місця в сховищі броней (порожньо для броні в БД)', max_length=64),
+        ),
+    ]
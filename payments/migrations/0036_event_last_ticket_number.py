@@ -0,0 +1,27 @@
+from django.db import migrations, models
+from django.db.models import Max
+
+
+def fill_last_ticket_number(apps, schema_editor):
+    Event = apps.get_model("payments", "Event")
+    TicketOrder = apps.get_model("payments", "TicketOrder")
+
+    for event in Event.objects.all():
+        last = TicketOrder.objects.filter(event=event).aggregate(last=Max("ticket_number"))["last"] or 0
+        Event.objects.filter(pk=event.pk).update(last_ticket_number=last)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0035_ticketorder_reservation_id'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='event',
+            name='last_ticket_number',
+            field=models.PositiveIntegerField(default=0, help_text='Лічильник номерів проданих квитків події', verbose_name='Останній номер квитка'),
+        ),
+        migrations.RunPython(fill_last_ticket_number, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,66 @@
+from django.db import migrations, models
+
+
+def blank_references_to_null(apps, schema_editor):
+    TicketOrder = apps.get_model("payments", "TicketOrder")
+    TicketOrder.objects.filter(wayforpay_order_reference="").update(wayforpay_order_reference=None)
+
+
+def resolve_duplicate_references(apps, schema_editor):
+    """
+    Перед ticket_wfp_reference_uniq: orderReference лишається за одним замовленням
+    (оплаченим, інакше найновішим), решта отримує суфікс __dup<id> — дані не
+    губляться, а callback-и для таких замовлень і так падали на MultipleObjectsReturned.
+    """
+    TicketOrder = apps.get_model("payments", "TicketOrder")
+    duplicates = (
+        TicketOrder.objects.exclude(wayforpay_order_reference=None)
+        .values("wayforpay_order_reference")
+        .annotate(rows=models.Count("id"))
+        .filter(rows__gt=1)
+        .values_list("wayforpay_order_reference", flat=True)
+    )
+    for reference in list(duplicates):
+        orders = list(
+            TicketOrder.objects.filter(wayforpay_order_reference=reference)
+            .order_by(
+                models.Case(models.When(payment_status="success", then=0), default=1),
+                "-id",
+            )
+            .values_list("id", flat=True)
+        )
+        kept, renamed = orders[0], orders[1:]
+        for order_id in renamed:
+            suffix = f"__dup{order_id}"
+            TicketOrder.objects.filter(id=order_id).update(
+                wayforpay_order_reference=reference[:100 - len(suffix)] + suffix
+            )
+        print(f"\n  ⚠️ orderReference {reference!r}: лишився за #{kept}, перейменовано у {renamed}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0036_event_last_ticket_number'),
+    ]
+
+    operations = [
+        migrations.RunPython(blank_references_to_null, migrations.RunPython.noop),
+        migrations.RunPython(resolve_duplicate_references, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='ticketorder',
+            index=models.Index(fields=['event', 'payment_status', 'created_at'], name='ticket_event_pay_created_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='ticketorder',
+            constraint=models.UniqueConstraint(fields=('wayforpay_order_reference',), name='ticket_wfp_reference_uniq'),
+        ),
+        migrations.AddIndex(
+            model_name='subscriptionorder',
+            index=models.Index(fields=['wayforpay_order_reference'], name='sub_wfp_reference_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='subscriptionorder',
+            index=models.Index(fields=['payment_status', 'callback_processed', 'created_at'], name='sub_status_created_idx'),
+        ),
+    ]
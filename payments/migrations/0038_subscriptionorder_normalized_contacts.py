@@ -0,0 +1,29 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0037_ticketorder_subscriptionorder_lookup_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='subscriptionorder',
+            name='email_normalized',
+            field=models.CharField(blank=True, default='', editable=False, help_text='Email у нижньому регістрі (для пошуку)', max_length=254),
+        ),
+        migrations.AddField(
+            model_name='subscriptionorder',
+            name='phone_key',
+            field=models.CharField(blank=True, default='', editable=False, help_text='Останні 9 цифр телефону (для пошуку)', max_length=9),
+        ),
+        migrations.AddIndex(
+            model_name='subscriptionorder',
+            index=models.Index(fields=['email_normalized', 'payment_status', 'callback_processed', 'created_at'], name='sub_email_norm_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='subscriptionorder',
+            index=models.Index(fields=['phone_key', 'payment_status', 'callback_processed', 'created_at'], name='sub_phone_key_status_idx'),
+        ),
+    ]
@@ -0,0 +1,39 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0038_subscriptionorder_normalized_contacts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WebhookInbox',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(choices=[('ticket', 'Квиток'), ('subscription', 'Підписка')], max_length=20, verbose_name='Джерело')),
+                ('order_reference', models.CharField(max_length=100, verbose_name='orderReference')),
+                ('transaction_status', models.CharField(blank=True, default='', max_length=50, verbose_name='transactionStatus')),
+                ('processing_date', models.CharField(blank=True, default='', max_length=32, verbose_name='processingDate')),
+                ('payload', models.JSONField(default=dict, verbose_name='Payload')),
+                ('status', models.CharField(choices=[('processing', 'Обробляється'), ('processed', 'Оброблено'), ('failed', 'Помилка')], default='processing', max_length=20, verbose_name='Статус')),
+                ('attempts', models.PositiveIntegerField(default=1, verbose_name='Спроб обробки')),
+                ('duplicates', models.PositiveIntegerField(default=0, verbose_name='Повторів')),
+                ('last_error', models.TextField(blank=True, default='', verbose_name='Остання помилка')),
+                ('received_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('processed_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Вхідний callback',
+                'verbose_name_plural': 'Вхідні callback-и',
+                'ordering': ['-received_at'],
+                'indexes': [models.Index(fields=['status', 'updated_at'], name='webhook_status_updated_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='webhookinbox',
+            constraint=models.UniqueConstraint(fields=('source', 'order_reference', 'transaction_status', 'processing_date'), name='webhook_inbox_key_uniq'),
+        ),
+    ]
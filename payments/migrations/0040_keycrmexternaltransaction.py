@@ -0,0 +1,38 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0039_webhookinbox'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='KeyCRMExternalTransaction',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('keycrm_id', models.BigIntegerField(unique=True, verbose_name='ID у KeyCRM')),
+                ('uuid', models.CharField(blank=True, default='', max_length=255, verbose_name='UUID')),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=12, verbose_name='Сума')),
+                ('currency', models.CharField(blank=True, default='', max_length=8, verbose_name='Валюта')),
+                ('description', models.TextField(blank=True, default='', verbose_name='Опис')),
+                ('order_reference', models.CharField(blank=True, default='', max_length=100, verbose_name='orderReference')),
+                ('order_number', models.PositiveIntegerField(blank=True, null=True, verbose_name='Номер замовлення (#id)')),
+                ('attached_payment_id', models.BigIntegerField(blank=True, null=True, verbose_name='Привʼязано до платежу')),
+                ('keycrm_created_at', models.DateTimeField(blank=True, null=True, verbose_name='Створено в KeyCRM')),
+                ('payload', models.JSONField(default=dict, verbose_name='Дані KeyCRM')),
+                ('synced_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Транзакція KeyCRM',
+                'verbose_name_plural': 'Транзакції KeyCRM',
+                'ordering': ['-keycrm_id'],
+                'indexes': [
+                    models.Index(fields=['amount', 'order_reference'], name='kc_tx_amount_ref_idx'),
+                    models.Index(fields=['amount', 'order_number'], name='kc_tx_amount_number_idx'),
+                    models.Index(fields=['uuid'], name='kc_tx_uuid_idx'),
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def schedule_existing(apps, schema_editor):
+    # перший запуск після деплою синхронізує всі підписки й розкладе їх за статусом
+    Subscription = apps.get_model("payments", "Subscription")
+    Subscription.objects.update(next_sync_at=timezone.now())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0040_keycrmexternaltransaction'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='subscription',
+            name='next_sync_at',
+            field=models.DateTimeField(blank=True, help_text='Коли sync_wayforpay_subscriptions знову запитає STATUS (порожньо — не запитувати)', null=True, verbose_name='Наступна синхронізація'),
+        ),
+        migrations.AddIndex(
+            model_name='subscription',
+            index=models.Index(fields=['next_sync_at'], name='sub_next_sync_idx'),
+        ),
+        migrations.RunPython(schedule_existing, migrations.RunPython.noop),
+    ]
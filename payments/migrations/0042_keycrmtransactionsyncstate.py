@@ -0,0 +1,26 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0041_subscription_next_sync_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='KeyCRMTransactionSyncState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('high_water_id', models.BigIntegerField(blank=True, null=True, verbose_name='Синхронізовано до id')),
+                ('pending_top_id', models.BigIntegerField(blank=True, null=True, verbose_name='Незавершений прохід: перший id')),
+                ('pending_low_id', models.BigIntegerField(blank=True, null=True, verbose_name='Незавершений прохід: найменший id')),
+                ('pending_read', models.PositiveIntegerField(default=0, verbose_name='Незавершений прохід: прочитано')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Стан синхронізації транзакцій KeyCRM',
+                'verbose_name_plural': 'Стан синхронізації транзакцій KeyCRM',
+            },
+        ),
+    ]
@@ -0,0 +1,47 @@
+import re
+
+from django.db import migrations, models
+
+# копія payments.services.keycrm_transactions на момент міграції
+AUTH_CODE_RE = re.compile(r"(?:auth\s*code|код\s+авторизації)\W*([A-Za-z0-9]{4,32})", re.IGNORECASE)
+AUTH_CODE_FALLBACK_RE = re.compile(r"(?<![#\w])(\d{6})(?!\w)")
+
+
+def fill_auth_code(apps, schema_editor):
+    KeyCRMExternalTransaction = apps.get_model("payments", "KeyCRMExternalTransaction")
+
+    batch = []
+    for trans in KeyCRMExternalTransaction.objects.only("id", "description", "payload").iterator():
+        payload = trans.payload if isinstance(trans.payload, dict) else {}
+        code = payload.get("auth_code") or payload.get("authCode")
+        if not code:
+            match = AUTH_CODE_RE.search(trans.description) or AUTH_CODE_FALLBACK_RE.search(trans.description)
+            code = match.group(1) if match else ""
+        if code:
+            trans.auth_code = str(code)[:32]
+            batch.append(trans)
+        if len(batch) >= 1000:
+            KeyCRMExternalTransaction.objects.bulk_update(batch, ["auth_code"])
+            batch = []
+    if batch:
+        KeyCRMExternalTransaction.objects.bulk_update(batch, ["auth_code"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0042_keycrmtransactionsyncstate'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='keycrmexternaltransaction',
+            name='auth_code',
+            field=models.CharField(blank=True, default='', max_length=32, verbose_name='authCode'),
+        ),
+        migrations.AddIndex(
+            model_name='keycrmexternaltransaction',
+            index=models.Index(fields=['amount', 'auth_code'], name='kc_tx_amount_auth_idx'),
+        ),
+        migrations.RunPython(fill_auth_code, migrations.RunPython.noop),
+    ]
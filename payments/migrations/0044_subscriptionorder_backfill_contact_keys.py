@@ -0,0 +1,42 @@
+from django.db import migrations
+
+
+# копія payments.models.normalize_email / phone_key на момент міграції
+def normalize_email(value):
+    return (value or "").strip().lower()
+
+
+def phone_key(value):
+    return "".join(filter(str.isdigit, value or ""))[-9:]
+
+
+def fill_contact_keys(apps, schema_editor):
+    # 0038 додала колонки без даних — старі замовлення не знаходились у callback-ах
+    SubscriptionOrder = apps.get_model("payments", "SubscriptionOrder")
+
+    batch = []
+    qs = SubscriptionOrder.objects.only("id", "email", "phone", "email_normalized", "phone_key").order_by("id")
+    for order in qs.iterator(chunk_size=2000):
+        email_normalized = normalize_email(order.email)
+        key = phone_key(order.phone)
+        if order.email_normalized == email_normalized and order.phone_key == key:
+            continue
+        order.email_normalized = email_normalized
+        order.phone_key = key
+        batch.append(order)
+        if len(batch) >= 2000:
+            SubscriptionOrder.objects.bulk_update(batch, ["email_normalized", "phone_key"])
+            batch = []
+    if batch:
+        SubscriptionOrder.objects.bulk_update(batch, ["email_normalized", "phone_key"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0043_keycrmexternaltransaction_auth_code'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_contact_keys, migrations.RunPython.noop),
+    ]
@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 import uuid
 
 
@@ -34,11 +35,32 @@ class Event(models.Model):
         default=50,
         verbose_name="Ліміт квитків"
     )
+    tickets_reserved = models.PositiveIntegerField(
+        default=0,
+        verbose_name="Зайнято місць",
+        help_text="Оплачені квитки + активні броні. Оновлюється атомарно при бронюванні"
+    )
+    last_ticket_number = models.PositiveIntegerField(
+        default=0,
+        verbose_name="Останній номер квитка",
+        help_text="Лічильник номерів проданих квитків події"
+    )
+    reservation_ttl_minutes = models.PositiveIntegerField(
+        default=10,
+        verbose_name="Час броні (хв)",
+        help_text="Скільки хвилин неоплачене замовлення тримає місце"
+    )
     is_active = models.BooleanField(
         default=True,
         verbose_name="Активна подія",
         help_text="Позначити поточну подію як активну"
     )
+    ticket_template = models.ImageField(
+        upload_to="ticket_templates/",
+        blank=True,
+        verbose_name="Шаблон квитка",
+        help_text="Постер для PDF-квитка. Якщо порожньо — стандартний шаблон"
+    )
 
     def __str__(self):
         return f"{self.title} ({self.date})"
@@ -54,6 +76,7 @@ class TicketOrder(models.Model):
 
     EMAIL_STATUS_CHOICES = [
         ('not_sent', 'Не надіслано'),
+        ('queued', 'В черзі на відправку'),
         ('sent', 'Надіслано'),
         ('failed', 'Помилка відправки'),
     ]
@@ -114,6 +137,12 @@ class TicketOrder(models.Model):
         blank=True,
         null=True
     )
+    reservation_id = models.CharField(
+        max_length=64,
+        blank=True,
+        default="",
+        help_text="ID броні місця в сховищі броней (порожньо для броні в БД)"
+    )
 
     keycrm_lead_id = models.IntegerField(
         blank=True,
@@ -196,6 +225,14 @@ class TicketOrder(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=["payment_status", "created_at"], name="ticket_status_created_idx"),
+            models.Index(fields=["event", "payment_status", "created_at"], name="ticket_event_pay_created_idx"),
+        ]
+        constraints = [
+            # NULL (ще не відправлено в WayForPay) може повторюватись
+            models.UniqueConstraint(fields=["wayforpay_order_reference"], name="ticket_wfp_reference_uniq"),
+        ]
 
 
 class TicketScanLog(models.Model):
@@ -226,6 +263,15 @@ class TicketScanLog(models.Model):
         return f"Сканування #{self.ticket.id} - {self.scanned_at}"
 
 
+def normalize_email(value):
+    return (value or "").strip().lower()
+
+
+def phone_key(value):
+    """Останні 9 цифр телефону (без коду країни) — ключ для зіставлення"""
+    return "".join(filter(str.isdigit, value or ""))[-9:]
+
+
 class SubscriptionOrder(models.Model):
     PAYMENT_STATUS_CHOICES = [
         ('pending', 'В очікуванні'),
@@ -293,6 +339,20 @@ class SubscriptionOrder(models.Model):
         default='',
         verbose_name="Імʼя (WayForPay)"
     )
+    email_normalized = models.CharField(
+        max_length=254,
+        blank=True,
+        default='',
+        editable=False,
+        help_text="Email у нижньому регістрі (для пошуку)"
+    )
+    phone_key = models.CharField(
+        max_length=9,
+        blank=True,
+        default='',
+        editable=False,
+        help_text="Останні 9 цифр телефону (для пошуку)"
+    )
 
     # ✅ UTM мітки
     utm_source = models.CharField(
@@ -338,6 +398,30 @@ class SubscriptionOrder(models.Model):
         verbose_name = "Замовлення підписки"
         verbose_name_plural = "Замовлення підписок"
         ordering = ['-created_at']
+        indexes = [
+            # не unique: той самий orderReference може прийти для кількох замовлень (регулярні платежі)
+            models.Index(fields=["wayforpay_order_reference"], name="sub_wfp_reference_idx"),
+            models.Index(
+                fields=["email_normalized", "payment_status", "callback_processed", "created_at"],
+                name="sub_email_norm_status_idx",
+            ),
+            models.Index(
+                fields=["phone_key", "payment_status", "callback_processed", "created_at"],
+                name="sub_phone_key_status_idx",
+            ),
+            models.Index(
+                fields=["payment_status", "callback_processed", "created_at"],
+                name="sub_status_created_idx",
+            ),
+        ]
+
+    def save(self, *args, **kwargs):
+        self.email_normalized = normalize_email(self.email)
+        self.phone_key = phone_key(self.phone)
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and {"email", "phone"} & set(update_fields):
+            kwargs["update_fields"] = set(update_fields) | {"email_normalized", "phone_key"}
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return f"Підписка #{self.id} - {self.name} ({self.email})"
@@ -429,6 +513,12 @@ class Subscription(models.Model):
 
     last_sync_at = models.DateTimeField(null=True, blank=True, verbose_name="Остання синхронізація")
     last_sync_raw = models.JSONField(null=True, blank=True, verbose_name="Остання відповідь WayForPay (raw)")
+    next_sync_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        help_text="Коли sync_wayforpay_subscriptions знову запитає STATUS (порожньо — не запитувати)",
+        verbose_name="Наступна синхронізація",
+    )
 
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -437,7 +527,223 @@ class Subscription(models.Model):
         verbose_name = "Підписка"
         verbose_name_plural = "Підписки"
         ordering = ['-updated_at']
+        indexes = [
+            # черга sync_wayforpay_subscriptions: next_sync_at <= now по зростанню
+            models.Index(fields=['next_sync_at'], name='sub_next_sync_idx'),
+        ]
 
     def __str__(self):
         label = self.email or self.phone or self.order_reference
         return f"{label} — {self.get_status_display()}"
+
+
+class OutboxJob(models.Model):
+    """Фонове завдання (outbox), яке виконує воркер run_outbox_worker"""
+
+    KIND_CHOICES = [
+        ('ticket_paid', 'Квиток оплачено: PDF + email'),
+        ('ticket_keycrm_payment', 'Квиток оплачено: оплата в KeyCRM'),
+        ('email_campaign', 'Масова розсилка'),
+    ]
+
+    STATUS_CHOICES = [
+        ('pending', 'В черзі'),
+        ('running', 'Виконується'),
+        ('done', 'Виконано'),
+        ('failed', 'Помилка'),
+    ]
+
+    kind = models.CharField(max_length=50, choices=KIND_CHOICES, verbose_name="Тип")
+    payload = models.JSONField(default=dict, blank=True, verbose_name="Дані")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending', verbose_name="Статус")
+    attempts = models.PositiveIntegerField(default=0, verbose_name="Спроб")
+    max_attempts = models.PositiveIntegerField(default=5, verbose_name="Максимум спроб")
+    run_after = models.DateTimeField(default=timezone.now, verbose_name="Виконати після")
+    locked_at = models.DateTimeField(null=True, blank=True, verbose_name="Взято в роботу")
+    last_error = models.TextField(blank=True, default='', verbose_name="Остання помилка")
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Фонове завдання"
+        verbose_name_plural = "Фонові завдання"
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'run_after'], name='outbox_status_run_after_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_kind_display()} #{self.id} ({self.status})"
+
+
+class EmailCampaign(models.Model):
+    """Масова розсилка активним підписникам (виконує воркер)"""
+
+    STATUS_CHOICES = [
+        ('queued', 'В черзі'),
+        ('running', 'Надсилається'),
+        ('done', 'Завершено'),
+        ('failed', 'Помилка'),
+    ]
+
+    subject = models.CharField(max_length=255, verbose_name="Тема")
+    template = models.CharField(max_length=255, blank=True, default='', verbose_name="Шаблон")
+    text_body = models.TextField(verbose_name="Текст листа")
+    html_body = models.TextField(blank=True, default='', verbose_name="HTML листа")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='queued', verbose_name="Статус")
+    recipients_loaded = models.BooleanField(default=False, verbose_name="Отримувачів завантажено")
+    total = models.PositiveIntegerField(default=0, verbose_name="Всього")
+    sent = models.PositiveIntegerField(default=0, verbose_name="Надіслано")
+    failed = models.PositiveIntegerField(default=0, verbose_name="Помилок")
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True, verbose_name="Початок")
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name="Завершення")
+
+    class Meta:
+        verbose_name = "Розсилка"
+        verbose_name_plural = "Розсилки"
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.subject} ({self.sent}/{self.total})"
+
+
+class EmailCampaignRecipient(models.Model):
+    STATUS_CHOICES = [
+        ('pending', 'В черзі'),
+        ('sent', 'Надіслано'),
+        ('failed', 'Помилка'),
+    ]
+
+    campaign = models.ForeignKey(
+        EmailCampaign,
+        on_delete=models.CASCADE,
+        related_name='recipients',
+    )
+    email = models.EmailField()
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    error = models.TextField(blank=True, default='')
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Отримувач розсилки"
+        verbose_name_plural = "Отримувачі розсилки"
+        constraints = [
+            models.UniqueConstraint(fields=['campaign', 'email'], name='unique_campaign_recipient'),
+        ]
+        indexes = [
+            models.Index(fields=['campaign', 'status', 'id'], name='campaign_recipient_status_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.email} ({self.status})"
+
+
+class WebhookInbox(models.Model):
+    """
+    Вхідні callback-и WayForPay. Ключ (джерело, orderReference,
+    transactionStatus, processingDate) унікальний — повтори відсікаються
+    вставкою, а payload зберігається для повторної обробки (replay_webhooks).
+    """
+
+    SOURCE_CHOICES = [
+        ('ticket', 'Квиток'),
+        ('subscription', 'Підписка'),
+    ]
+
+    STATUS_CHOICES = [
+        ('processing', 'Обробляється'),
+        ('processed', 'Оброблено'),
+        ('failed', 'Помилка'),
+    ]
+
+    source = models.CharField(max_length=20, choices=SOURCE_CHOICES, verbose_name="Джерело")
+    order_reference = models.CharField(max_length=100, verbose_name="orderReference")
+    transaction_status = models.CharField(max_length=50, blank=True, default='', verbose_name="transactionStatus")
+    processing_date = models.CharField(max_length=32, blank=True, default='', verbose_name="processingDate")
+    payload = models.JSONField(default=dict, verbose_name="Payload")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='processing', verbose_name="Статус")
+    attempts = models.PositiveIntegerField(default=1, verbose_name="Спроб обробки")
+    duplicates = models.PositiveIntegerField(default=0, verbose_name="Повторів")
+    last_error = models.TextField(blank=True, default='', verbose_name="Остання помилка")
+
+    received_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Вхідний callback"
+        verbose_name_plural = "Вхідні callback-и"
+        ordering = ['-received_at']
+        constraints = [
+            models.UniqueConstraint(
+                fields=["source", "order_reference", "transaction_status", "processing_date"],
+                name="webhook_inbox_key_uniq",
+            ),
+        ]
+        indexes = [
+            models.Index(fields=["status", "updated_at"], name="webhook_status_updated_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.source}:{self.order_reference} {self.transaction_status} ({self.get_status_display()})"
+
+
+class KeyCRMExternalTransaction(models.Model):
+    """
+    Локальна копія зовнішніх транзакцій KeyCRM (sync_keycrm_transactions).
+    orderReference, authCode і #номер замовлення витягуються з опису/uuid при синхронізації,
+    тож пошук транзакції для оплати — один індексний запит замість перебору списку.
+    """
+
+    keycrm_id = models.BigIntegerField(unique=True, verbose_name="ID у KeyCRM")
+    uuid = models.CharField(max_length=255, blank=True, default='', verbose_name="UUID")
+    amount = models.DecimalField(max_digits=12, decimal_places=2, verbose_name="Сума")
+    currency = models.CharField(max_length=8, blank=True, default='', verbose_name="Валюта")
+    description = models.TextField(blank=True, default='', verbose_name="Опис")
+    order_reference = models.CharField(max_length=100, blank=True, default='', verbose_name="orderReference")
+    order_number = models.PositiveIntegerField(null=True, blank=True, verbose_name="Номер замовлення (#id)")
+    auth_code = models.CharField(max_length=32, blank=True, default='', verbose_name="authCode")
+    attached_payment_id = models.BigIntegerField(null=True, blank=True, verbose_name="Привʼязано до платежу")
+    keycrm_created_at = models.DateTimeField(null=True, blank=True, verbose_name="Створено в KeyCRM")
+    payload = models.JSONField(default=dict, verbose_name="Дані KeyCRM")
+    synced_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Транзакція KeyCRM"
+        verbose_name_plural = "Транзакції KeyCRM"
+        ordering = ['-keycrm_id']
+        indexes = [
+            models.Index(fields=["amount", "order_reference"], name="kc_tx_amount_ref_idx"),
+            models.Index(fields=["amount", "order_number"], name="kc_tx_amount_number_idx"),
+            models.Index(fields=["amount", "auth_code"], name="kc_tx_amount_auth_idx"),
+            models.Index(fields=["uuid"], name="kc_tx_uuid_idx"),
+        ]
+
+    def __str__(self):
+        return f"#{self.keycrm_id} {self.amount} {self.order_reference or self.uuid}"
+
+
+class KeyCRMTransactionSyncState(models.Model):
+    """
+    Стан інкрементальної синхронізації транзакцій KeyCRM (один рядок).
+    high_water_id — усі транзакції з id <= нього вже в локальній копії; зсувається
+    лише тоді, коли прохід дочитав до попереднього значення. Незавершений прохід
+    (помилка, ліміт сторінок) запамʼятовує, звідки почав, до якого id дійшов і скільки прочитав,
+    щоб наступний продовжив з того місця, а не з найновіших транзакцій.
+    """
+
+    high_water_id = models.BigIntegerField(null=True, blank=True, verbose_name="Синхронізовано до id")
+    pending_top_id = models.BigIntegerField(null=True, blank=True, verbose_name="Незавершений прохід: перший id")
+    pending_low_id = models.BigIntegerField(null=True, blank=True, verbose_name="Незавершений прохід: найменший id")
+    pending_read = models.PositiveIntegerField(default=0, verbose_name="Незавершений прохід: прочитано")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Стан синхронізації транзакцій KeyCRM"
+        verbose_name_plural = "Стан синхронізації транзакцій KeyCRM"
+
+    def __str__(self):
+        return f"high_water_id={self.high_water_id} pending_top_id={self.pending_top_id}"
@@ -0,0 +1,144 @@
+import logging
+import threading
+from types import SimpleNamespace
+from typing import Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.template.base import TextNode, VariableNode
+from django.template.loader import get_template, render_to_string
+from django.utils.html import conditional_escape
+
+logger = logging.getLogger(__name__)
+
+_MARKER = "\x00field{}\x00"
+
+# Вузли, які можна відрендерити наперед: текст і прості {{ поле }}
+_STATIC_NODE_TYPES = (TextNode, VariableNode)
+
+
+class TransactionalEmailTemplate:
+    """
+    Шаблон транзакційного листа, відрендерений один раз на процес.
+
+    Шаблон рендериться з маркерами замість полів отримувача і розбивається
+    на статичні фрагменти; для кожного листа лише підставляються
+    екрановані значення полів. Якщо шаблон використовує щось, крім простих
+    {{ поле }} (теги, фільтри, невідомі змінні) — рендеримо звичайним шляхом.
+    """
+
+    def __init__(self, template_name: str, fields: Tuple[str, ...]):
+        self.template_name = template_name
+        self.fields = fields
+        self._parts: Optional[List[str]] = None
+        self._order: Optional[List[int]] = None
+        self._fallback = False
+        self._lock = threading.Lock()
+
+    def _marker_context(self) -> Dict[str, object]:
+        context: Dict[str, object] = {}
+        for index, field in enumerate(self.fields):
+            head, _, attr = field.partition(".")
+            marker = _MARKER.format(index)
+            if attr:
+                namespace = context.setdefault(head, SimpleNamespace())
+                setattr(namespace, attr, marker)
+            else:
+                context[head] = marker
+        return context
+
+    def _is_precompilable(self, template) -> bool:
+        nodelist = template.template.nodelist
+        for node in nodelist:
+            if not isinstance(node, _STATIC_NODE_TYPES):
+                return False
+            if isinstance(node, VariableNode):
+                expression = node.filter_expression
+                if expression.filters or str(expression.var) not in self.fields:
+                    return False
+        return True
+
+    def _compile(self) -> None:
+        template = get_template(self.template_name)
+        if not self._is_precompilable(template):
+            logger.info(f"ℹ️ Шаблон {self.template_name} рендериться повністю (містить теги/фільтри)")
+            self._fallback = True
+            return
+
+        rendered = template.render(self._marker_context())
+        parts: List[str] = []
+        order: List[int] = []
+        markers = [_MARKER.format(i) for i in range(len(self.fields))]
+        rest = rendered
+        while True:
+            positions = [(rest.find(marker), i) for i, marker in enumerate(markers) if marker in rest]
+            if not positions:
+                parts.append(rest)
+                break
+            position, index = min(positions)
+            parts.append(rest[:position])
+            order.append(index)
+            rest = rest[position + len(markers[index]):]
+
+        self._order = order
+        self._parts = parts
+
+    def _context_values(self, context: Dict[str, object]) -> List[str]:
+        values = []
+        for field in self.fields:
+            head, _, attr = field.partition(".")
+            value = context.get(head, "")
+            if attr:
+                value = getattr(value, attr, "")
+            values.append(str(conditional_escape("" if value is None else value)))
+        return values
+
+    def render(self, context: Dict[str, object]) -> str:
+        if settings.DEBUG:
+            # у розробці шаблони змінюються — без кешу
+            return render_to_string(self.template_name, context)
+
+        if self._parts is None and not self._fallback:
+            with self._lock:
+                if self._parts is None and not self._fallback:
+                    self._compile()
+
+        if self._fallback:
+            return render_to_string(self.template_name, context)
+
+        values = self._context_values(context)
+        chunks = [self._parts[0]]
+        for index, part in zip(self._order, self._parts[1:]):
+            chunks.append(values[index])
+            chunks.append(part)
+        return "".join(chunks)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._parts = None
+            self._order = None
+            self._fallback = False
+
+
+TICKET_HTML = TransactionalEmailTemplate(
+    "emails/ticket.html",
+    fields=("bot_url",),
+)
+SUBSCRIPTION_CONFIRMATION_TXT = TransactionalEmailTemplate(
+    "emails/subscription_confirmation.txt",
+    fields=("subscription.name", "subscription.email", "subscription.phone", "bot_url"),
+)
+SUBSCRIPTION_CONFIRMATION_HTML = TransactionalEmailTemplate(
+    "emails/subscription_confirmation.html",
+    fields=("bot_url",),
+)
+
+TRANSACTIONAL_TEMPLATES = (
+    TICKET_HTML,
+    SUBSCRIPTION_CONFIRMATION_TXT,
+    SUBSCRIPTION_CONFIRMATION_HTML,
+)
+
+
+def clear_email_template_cache() -> None:
+    for template in TRANSACTIONAL_TEMPLATES:
+        template.reset()
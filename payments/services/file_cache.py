@@ -0,0 +1,97 @@
+import logging
+import os
+import threading
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class ContentAddressedFileCache:
+    """
+    Дисковий кеш байтів за ключем (хеш вхідних даних).
+    Файли розкладені по підкаталогах за першими символами ключа;
+    при перевищенні max_bytes видаляються найдавніше використані.
+    """
+
+    def __init__(self, directory: str, max_bytes: int, suffix: str = "", evict_every: int = 50):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.suffix = suffix
+        self.evict_every = evict_every
+        self._writes = 0
+        self._lock = threading.Lock()
+
+    def path_for(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], f"{key}{self.suffix}")
+
+    def get(self, key: str) -> Optional[bytes]:
+        path = self.path_for(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        try:
+            # mtime = час останнього використання (для витіснення)
+            os.utime(path)
+        except OSError:
+            pass
+        return data
+
+    def set(self, key: str, data: bytes) -> None:
+        path = self.path_for(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            self._writes += 1
+            should_evict = self._writes >= self.evict_every
+            if should_evict:
+                self._writes = 0
+        if should_evict:
+            self.evict()
+
+    def get_or_set(self, key: str, render: Callable[[], bytes]) -> bytes:
+        data = self.get(key)
+        if data is not None:
+            return data
+        data = render()
+        self.set(key, data)
+        return data
+
+    def evict(self) -> int:
+        """Видаляє найдавніше використані файли, поки кеш не стане меншим за 90% ліміту"""
+        entries = []
+        total = 0
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if name.endswith(".tmp"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+                total += stat.st_size
+
+        if total <= self.max_bytes:
+            return 0
+
+        target = int(self.max_bytes * 0.9)
+        removed = 0
+        for _, size, path in sorted(entries):
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                continue
+            total -= size
+            removed += 1
+
+        logger.info(f"🧹 Кеш {self.directory}: видалено {removed} файлів, розмір {total} B")
+        return removed
@@ -0,0 +1,119 @@
+import logging
+import time
+from typing import Dict, List, Optional
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from payments.models import Event, TicketOrder
+from payments.services.reservations import SeatHold, get_reservation_backend, reservation_ttl
+
+logger = logging.getLogger(__name__)
+
+
+def add_seats(event: Event, count: int = 1) -> int:
+    """Займає місця без перевірки ліміту (безкоштовні квитки). Повертає кількість зайнятих місць"""
+    return get_reservation_backend().add_sold(event, count)
+
+
+def release_hold(event_id: Optional[int], hold: SeatHold) -> None:
+    """Скасовує бронь, для якої не вдалося створити замовлення"""
+    get_reservation_backend().release(event_id, hold.hold_id)
+
+
+def on_payment_status_change(order: TicketOrder, old_status: str, new_status: str) -> None:
+    """Синхронізує облік місць при зміні статусу оплати (callback, ручні зміни)"""
+    get_reservation_backend().on_status_change(order, old_status, new_status)
+
+
+def expire_reservations(event: Optional[Event] = None, limit: Optional[int] = None) -> int:
+    """
+    Переводить прострочені броні події (або замовлення без події, якщо event=None)
+    у 'expired' і звільняє їхні місця. Повертає кількість звільнених місць.
+    """
+    queryset = TicketOrder.objects.filter(
+        payment_status="pending",
+        event=event,
+        created_at__lt=timezone.now() - reservation_ttl(event),
+    ).order_by("created_at").values_list("id", flat=True)
+    if limit:
+        queryset = queryset[:limit]
+
+    order_ids = list(queryset)
+    if not order_ids:
+        return 0
+
+    with transaction.atomic():
+        # умова на статус: паралельний прохід або callback не звільнить місце двічі
+        expired = TicketOrder.objects.filter(
+            id__in=order_ids,
+            payment_status="pending",
+        ).update(payment_status="expired")
+        get_reservation_backend().release_expired(getattr(event, "pk", None), expired)
+    return expired
+
+
+_sweep_stats = {
+    "sweeps": 0,
+    "released_total": 0,
+    "last_released": 0,
+    "last_sweep_seconds": 0.0,
+}
+
+
+def sweep_expired_reservations(batch_size: Optional[int] = None) -> Dict[Optional[int], int]:
+    """
+    Один прохід фонового звільнення броней: не більше batch_size замовлень
+    на подію. Повертає {event_id: звільнено місць} для подій, де щось звільнено.
+    """
+    batch_size = batch_size or settings.TICKET_RESERVATION_SWEEP_BATCH_SIZE
+    started = time.monotonic()
+
+    pending_event_ids = TicketOrder.objects.filter(payment_status="pending").values("event_id")
+    events: List[Optional[Event]] = list(
+        Event.objects.filter(id__in=pending_event_ids).only("id", "reservation_ttl_minutes")
+    )
+    events.append(None)
+
+    released: Dict[Optional[int], int] = {}
+    for event in events:
+        count = expire_reservations(event=event, limit=batch_size)
+        if count:
+            released[getattr(event, "pk", None)] = count
+
+    total = sum(released.values())
+    elapsed = time.monotonic() - started
+    _sweep_stats["sweeps"] += 1
+    _sweep_stats["released_total"] += total
+    _sweep_stats["last_released"] = total
+    _sweep_stats["last_sweep_seconds"] = elapsed
+
+    if total:
+        logger.info(f"🕓 Звільнено {total} місць з прострочених броней за {elapsed:.3f}s: {released}")
+    return released
+
+
+def sweep_stats() -> Dict[str, float]:
+    """Лічильники фонового звільнення броней для поточного процесу"""
+    return dict(_sweep_stats)
+
+
+def reserve_seat(event: Event, expire_batch: int = 100) -> Optional[SeatHold]:
+    """
+    Бронює місце для нового замовлення. Броні в БД звільняє фоновий
+    expire_reservations; якщо він відстав і лічильник показує sold out —
+    звільняємо прострочені броні лише цієї події і пробуємо ще раз.
+    TTL-сховища (locmem, Redis) прибирають прострочені броні самі.
+    """
+    backend = get_reservation_backend()
+    hold = backend.reserve(event)
+    if hold is None and backend.persistent_holds and expire_reservations(event=event, limit=expire_batch):
+        hold = backend.reserve(event)
+    return hold
+
+
+def recount_reserved(event: Event) -> int:
+    """Перераховує облік місць з таблиці замовлень (ручна звірка)"""
+    expire_reservations(event=event)
+    return get_reservation_backend().recount(event)
@@ -0,0 +1,367 @@
+import logging
+import os
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional, Tuple
+
+import requests
+from django.conf import settings
+from django.utils import timezone
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+# Пріоритети викликів KeyCRM: менше число — вищий пріоритет.
+# Оновлення оплат не чекають за масовим створенням лідів.
+PRIORITY_PAYMENT = 0
+PRIORITY_DEFAULT = 1
+PRIORITY_LEAD = 2
+PRIORITIES = (PRIORITY_PAYMENT, PRIORITY_DEFAULT, PRIORITY_LEAD)
+
+# Відповіді, після яких запит має сенс повторити
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+# POST (створення ліда, привʼязка транзакції) після 500/502/504 міг уже виконатись —
+# повторюємо лише відмови, після яких KeyCRM точно нічого не зробив
+NON_IDEMPOTENT_RETRY_STATUSES = frozenset({429, 503})
+IDEMPOTENT_METHODS = frozenset({"GET", "HEAD", "OPTIONS", "PUT", "DELETE"})
+
+_DEFAULT = object()
+
+
+class KeyCRMRateLimited(requests.RequestException):
+    """Токен ліміту запитів не отримано за KEYCRM_RATE_LIMIT_MAX_WAIT"""
+
+
+def retry_after_seconds(response) -> Optional[float]:
+    """Retry-After у секундах (число або HTTP-дата); None, якщо заголовка немає"""
+    value = (getattr(response, "headers", None) or {}).get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max((parsedate_to_datetime(value) - timezone.now()).total_seconds(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """
+    Token bucket на процес, спільний для всіх потоків.
+    Виклик пріоритету p бере токен лише тоді, коли немає тих, хто чекає з
+    вищим пріоритетом, і в кошику лишається reserve * p токенів для них.
+    """
+
+    def __init__(self, rate: float, burst: int, reserve: int = 1):
+        self.rate = max(rate, 0.001)
+        self.burst = max(burst, 1)
+        self.reserve = max(reserve, 0)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._waiting = {priority: 0 for priority in PRIORITIES}
+        self._cond = threading.Condition()
+
+    def _refill(self, now: float) -> None:
+        start = max(self._updated, self._paused_until)
+        if now > start:
+            self._tokens = min(self.burst, self._tokens + (now - start) * self.rate)
+        self._updated = max(now, self._updated)
+
+    def _floor(self, priority: int) -> float:
+        return min(self.reserve * priority, self.burst - 1)
+
+    def acquire(self, priority: int = PRIORITY_DEFAULT, timeout: Optional[float] = None) -> float:
+        """Чекає на токен; повертає час очікування або кидає KeyCRMRateLimited"""
+        started = time.monotonic()
+        deadline = None if timeout is None else started + timeout
+        with self._cond:
+            self._waiting[priority] += 1
+            try:
+                while True:
+                    now = time.monotonic()
+                    self._refill(now)
+                    higher_waiting = any(self._waiting[p] for p in PRIORITIES if p < priority)
+                    needed = 1 + self._floor(priority)
+                    if not higher_waiting and now >= self._paused_until and self._tokens >= needed:
+                        self._tokens -= 1
+                        return now - started
+
+                    wait = max(self._paused_until - now, (needed - self._tokens) / self.rate, 0.01)
+                    if deadline is not None:
+                        if now >= deadline:
+                            raise KeyCRMRateLimited(f"KeyCRM rate limit: no token within {timeout:.1f}s")
+                        wait = min(wait, deadline - now)
+                    self._cond.wait(wait)
+            finally:
+                self._waiting[priority] -= 1
+                self._cond.notify_all()
+
+    def pause(self, seconds: float) -> None:
+        """KeyCRM відповів 429 з Retry-After — зупиняємо всі виклики процесу"""
+        with self._cond:
+            self._tokens = 0.0
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._cond.notify_all()
+
+    def snapshot(self) -> Dict[str, float]:
+        with self._cond:
+            self._refill(time.monotonic())
+            return {
+                "tokens": round(self._tokens, 2),
+                "waiting": sum(self._waiting.values()),
+                "paused_seconds": round(max(self._paused_until - time.monotonic(), 0.0), 2),
+            }
+
+
+class RetryBudget:
+    """
+    Бюджет повторів на процес: кожен виклик додає ratio повтору, кожен повтор
+    забирає один, плюс min_per_second на випадок малого трафіку (не більше cap).
+    Коли KeyCRM лежить, повтори не множать навантаження — виклики швидко падають.
+    """
+
+    def __init__(self, ratio: float = 0.2, min_per_second: float = 0.2, cap: float = 10.0):
+        self.ratio = max(ratio, 0.0)
+        self.min_per_second = max(min_per_second, 0.0)
+        self.cap = max(cap, 1.0)
+        self._balance = self.cap
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._balance = min(self.cap, self._balance + (now - self._updated) * self.min_per_second)
+        self._updated = now
+
+    def deposit(self) -> None:
+        with self._lock:
+            self._refill()
+            self._balance = min(self.cap, self._balance + self.ratio)
+
+    def withdraw(self) -> bool:
+        with self._lock:
+            self._refill()
+            if self._balance < 1:
+                return False
+            self._balance -= 1
+            return True
+
+    def snapshot(self) -> Dict[str, float]:
+        with self._lock:
+            self._refill()
+            return {"balance": round(self._balance, 2)}
+
+
+class KeyCRMSession:
+    """
+    Спільна на процес requests.Session з пулом keep-alive зʼєднань до KeyCRM.
+    Виклики KeyCRMAPI перевикористовують відкриті TCP+TLS-зʼєднання замість
+    нового рукостискання на кожен запит, проходять через ліміт запитів і
+    повторюються з backoff на 429/5xx (POST — лише на 429/503) в межах
+    спільного бюджету повторів.
+    """
+
+    def __init__(self, pool_size: int = 10, connect_timeout: float = 5.0, read_timeout: float = 20.0,
+                 limiter: Optional[TokenBucket] = None, max_retries: int = 3,
+                 retry_base: float = 0.5, retry_max: float = 30.0, max_wait: Optional[float] = 30.0,
+                 retry_budget: Optional[RetryBudget] = None):
+        self.pool_size = pool_size
+        self.timeout: Tuple[float, float] = (connect_timeout, read_timeout)
+        self.adapter = HTTPAdapter(pool_connections=2, pool_maxsize=pool_size, pool_block=False)
+        self.session = requests.Session()
+        self.session.mount("https://", self.adapter)
+        self.session.mount("http://", self.adapter)
+        self.limiter = limiter
+        self.max_retries = max(max_retries, 0)
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self.max_wait = max_wait
+        self.retry_budget = retry_budget
+        self._lock = threading.Lock()
+        self._stats = {
+            "calls": 0,
+            "requests": 0,
+            "throttled": 0,
+            "retried": 0,
+            "failed": 0,
+            "retry_budget_exhausted": 0,
+            "rate_limit_timeouts": 0,
+            "rate_limit_wait_seconds_total": 0.0,
+            "request_seconds_total": 0.0,
+            "request_seconds_max": 0.0,
+        }
+
+    def _count(self, key: str, value=1) -> None:
+        with self._lock:
+            self._stats[key] += value
+
+    def _backoff(self, attempt: int, retry_after: Optional[float]) -> float:
+        """Retry-After, якщо KeyCRM його дав, інакше експоненційна затримка з повним jitter"""
+        if retry_after is not None:
+            return min(retry_after, self.retry_max)
+        return random.uniform(0, min(self.retry_base * (2 ** attempt), self.retry_max))
+
+    def _send(self, method: str, url: str, **kwargs) -> requests.Response:
+        started = time.monotonic()
+        try:
+            return self.session.request(method, url, **kwargs)
+        finally:
+            elapsed = time.monotonic() - started
+            with self._lock:
+                self._stats["requests"] += 1
+                self._stats["request_seconds_total"] += elapsed
+                self._stats["request_seconds_max"] = max(self._stats["request_seconds_max"], elapsed)
+
+    def _may_retry(self, attempt: int, max_retries: int) -> bool:
+        if attempt >= max_retries:
+            return False
+        if self.retry_budget is not None and not self.retry_budget.withdraw():
+            self._count("retry_budget_exhausted")
+            return False
+        return True
+
+    def request(self, method: str, url: str, priority: int = PRIORITY_DEFAULT, max_retries: Optional[int] = None,
+                max_wait=_DEFAULT, **kwargs) -> requests.Response:
+        """
+        max_retries / max_wait — перевизначення для окремого виклику (наприклад,
+        у webhook, де відповідь WayForPay не може чекати десятки секунд).
+        """
+        kwargs.setdefault("timeout", self.timeout)
+        max_retries = self.max_retries if max_retries is None else max(max_retries, 0)
+        max_wait = self.max_wait if max_wait is _DEFAULT else max_wait
+        idempotent = method.upper() in IDEMPOTENT_METHODS
+        retry_statuses = RETRY_STATUSES if idempotent else NON_IDEMPOTENT_RETRY_STATUSES
+        self._count("calls")
+        if self.retry_budget is not None:
+            self.retry_budget.deposit()
+
+        attempt = 0
+        while True:
+            if self.limiter is not None:
+                try:
+                    self._count("rate_limit_wait_seconds_total", self.limiter.acquire(priority, max_wait))
+                except KeyCRMRateLimited:
+                    self._count("rate_limit_timeouts")
+                    self._count("failed")
+                    raise
+
+            try:
+                response = self._send(method, url, **kwargs)
+            except requests.ConnectionError as e:
+                # неідемпотентний запит повторюємо, лише якщо зʼєднання не встановилось (запит точно не дійшов)
+                retryable = idempotent or isinstance(e, requests.exceptions.ConnectTimeout)
+                if not retryable or not self._may_retry(attempt, max_retries):
+                    self._count("failed")
+                    raise
+                delay = self._backoff(attempt, None)
+            except requests.RequestException:
+                self._count("failed")
+                raise
+            else:
+                if response.status_code not in RETRY_STATUSES:
+                    return response
+                retry_after = retry_after_seconds(response)
+                if response.status_code == 429:
+                    self._count("throttled")
+                    if self.limiter is not None:
+                        self.limiter.pause(retry_after if retry_after is not None else self._backoff(attempt, None))
+                if response.status_code not in retry_statuses or not self._may_retry(attempt, max_retries):
+                    self._count("failed")
+                    return response
+                delay = self._backoff(attempt, retry_after)
+
+            attempt += 1
+            self._count("retried")
+            logger.warning("♻️ KeyCRM %s %s: повтор %s/%s через %.1f с", method, url, attempt, max_retries, delay)
+            time.sleep(delay)
+
+    def _connection_counts(self) -> Tuple[int, int]:
+        """(відкрито зʼєднань, запитів через них) за лічильниками пулів urllib3"""
+        opened = served = 0
+        pools = self.adapter.poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            opened += pool.num_connections
+            served += pool.num_requests
+        return opened, served
+
+    def close(self) -> None:
+        self.session.close()
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            stats = dict(self._stats)
+        opened, served = self._connection_counts()
+        stats["connections_opened"] = opened
+        stats["connections_reused"] = max(served - opened, 0)
+        stats["reuse_ratio"] = stats["connections_reused"] / served if served else 0.0
+        stats["request_seconds_avg"] = stats["request_seconds_total"] / stats["requests"] if stats["requests"] else 0.0
+        stats["pool_size"] = self.pool_size
+        if self.limiter is not None:
+            stats.update({f"rate_limit_{key}": value for key, value in self.limiter.snapshot().items()})
+        if self.retry_budget is not None:
+            stats.update({f"retry_budget_{key}": value for key, value in self.retry_budget.snapshot().items()})
+        return stats
+
+
+_session: Optional[KeyCRMSession] = None
+_session_pid: Optional[int] = None
+_session_lock = threading.Lock()
+
+
+def _build_session() -> KeyCRMSession:
+    rate = getattr(settings, "KEYCRM_RATE_LIMIT_PER_SECOND", 1.0)
+    limiter = TokenBucket(
+        rate=rate,
+        burst=getattr(settings, "KEYCRM_RATE_LIMIT_BURST", 5),
+        reserve=getattr(settings, "KEYCRM_RATE_LIMIT_RESERVE", 1),
+    ) if rate > 0 else None
+    return KeyCRMSession(
+        pool_size=getattr(settings, "KEYCRM_HTTP_POOL_SIZE", 10),
+        connect_timeout=getattr(settings, "KEYCRM_CONNECT_TIMEOUT", 5),
+        read_timeout=getattr(settings, "KEYCRM_READ_TIMEOUT", 20),
+        limiter=limiter,
+        max_retries=getattr(settings, "KEYCRM_MAX_RETRIES", 3),
+        retry_base=getattr(settings, "KEYCRM_RETRY_BASE_SECONDS", 0.5),
+        retry_max=getattr(settings, "KEYCRM_RETRY_MAX_SECONDS", 30),
+        max_wait=getattr(settings, "KEYCRM_RATE_LIMIT_MAX_WAIT", 30),
+        retry_budget=RetryBudget(
+            ratio=getattr(settings, "KEYCRM_RETRY_BUDGET_RATIO", 0.2),
+            min_per_second=getattr(settings, "KEYCRM_RETRY_BUDGET_PER_SECOND", 0.2),
+            cap=getattr(settings, "KEYCRM_RETRY_BUDGET_MAX", 10),
+        ),
+    )
+
+
+def get_keycrm_session() -> KeyCRMSession:
+    """Сесія на процес (після fork у gunicorn створюється нова)"""
+    global _session, _session_pid
+    pid = os.getpid()
+    if _session is None or _session_pid != pid:
+        with _session_lock:
+            if _session is None or _session_pid != pid:
+                _session = _build_session()
+                _session_pid = pid
+    return _session
+
+
+def reset_keycrm_session() -> None:
+    """Закриває сесію процесу; наступний виклик створить нову з поточними налаштуваннями"""
+    global _session, _session_pid
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+        _session = None
+        _session_pid = None
+
+
+def keycrm_http_stats() -> Dict[str, float]:
+    """Лічильники запитів, ліміту, повторів і перевикористання зʼєднань для поточного процесу"""
+    return get_keycrm_session().stats()
@@ -0,0 +1,205 @@
+import logging
+import re
+from decimal import Decimal, InvalidOperation
+from typing import Any, Dict, List, Optional
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+from payments.models import KeyCRMExternalTransaction, KeyCRMTransactionSyncState, TicketOrder
+
+logger = logging.getLogger(__name__)
+
+# orderReference квитків: ORDER_<id>_<timestamp> (views.generate_wayforpay_params)
+ORDER_REFERENCE_RE = re.compile(r"ORDER_\d+_\d+")
+ORDER_NUMBER_RE = re.compile(r"#(\d+)\b")
+# authCode WayForPay: з підписом ("AuthCode: 913434"), інакше окреме шестизначне число
+AUTH_CODE_RE = re.compile(r"(?:auth\s*code|код\s+авторизації)\W*([A-Za-z0-9]{4,32})", re.IGNORECASE)
+AUTH_CODE_FALLBACK_RE = re.compile(r"(?<![#\w])(\d{6})(?!\w)")
+
+_UPDATE_FIELDS = [
+    "uuid", "amount", "currency", "description", "order_reference", "order_number", "auth_code",
+    "keycrm_created_at", "payload",
+]
+
+
+def transaction_list(transactions_result) -> List[Dict[str, Any]]:
+    """Список транзакцій з відповіді KeyCRM ({"data": [...]} або просто список)"""
+    if not transactions_result:
+        return []
+    items = transactions_result.get("data", transactions_result) if isinstance(
+        transactions_result, dict) else transactions_result
+    return items if isinstance(items, list) else []
+
+
+def _amount(value) -> Decimal:
+    try:
+        return Decimal(str(value or 0)).quantize(Decimal("0.01"))
+    except InvalidOperation:
+        return Decimal("0.00")
+
+
+def extract_auth_code(trans: Dict[str, Any]) -> str:
+    """authCode транзакції: поле payload, підписаний код в описі або шестизначне число"""
+    code = trans.get("auth_code") or trans.get("authCode")
+    if code:
+        return str(code)[:32]
+    description = trans.get("description") or ""
+    match = AUTH_CODE_RE.search(description) or AUTH_CODE_FALLBACK_RE.search(description)
+    return match.group(1)[:32] if match else ""
+
+
+def _to_row(trans: Dict[str, Any]) -> KeyCRMExternalTransaction:
+    description = trans.get("description") or ""
+    trans_uuid = str(trans.get("uuid") or "")
+    reference = ORDER_REFERENCE_RE.search(f"{description} {trans_uuid}")
+    number = ORDER_NUMBER_RE.search(description)
+    created_at = trans.get("created_at")
+    return KeyCRMExternalTransaction(
+        keycrm_id=int(trans["id"]),
+        uuid=trans_uuid[:255],
+        amount=_amount(trans.get("amount")),
+        currency=str(trans.get("currency") or "")[:8],
+        description=description,
+        order_reference=reference.group(0)[:100] if reference else "",
+        order_number=int(number.group(1)) if number else None,
+        auth_code=extract_auth_code(trans),
+        keycrm_created_at=parse_datetime(created_at) if isinstance(created_at, str) else None,
+        payload=trans,
+    )
+
+
+def store_transactions(items: List[Dict[str, Any]]) -> int:
+    """Upsert сторінки транзакцій за keycrm_id"""
+    rows = [_to_row(trans) for trans in items if trans.get("id") is not None]
+    if rows:
+        KeyCRMExternalTransaction.objects.bulk_create(
+            rows,
+            update_conflicts=True,
+            unique_fields=["keycrm_id"],
+            update_fields=_UPDATE_FIELDS,
+        )
+    return len(rows)
+
+
+def _sync_state() -> KeyCRMTransactionSyncState:
+    state, _ = KeyCRMTransactionSyncState.objects.get_or_create(pk=1)
+    return state
+
+
+def sync_external_transactions(keycrm=None, page_size: int = 100, max_pages: Optional[int] = None,
+                               full: bool = False) -> Dict[str, int]:
+    """
+    Інкрементальна синхронізація: KeyCRM віддає транзакції від нових до старих
+    (лише offset-пагінація), тож сторінки читаються, доки не трапиться транзакція
+    з id <= high_water_id. Лише такий прохід (або дочитаний до кінця списку)
+    зсуває high_water_id на найновішу прочитану транзакцію.
+
+    Прохід, що зупинився раніше (помилка, max_pages), зберігає свій перший і
+    найменший id та кількість прочитаних транзакцій. Наступний прохід, дійшовши
+    до першого id, перескакує вже прочитаний відрізок і продовжує від найменшого
+    id вниз; якщо сторінка після стрибка починається нижче за нього (у KeyCRM
+    щось видалили і список зсунувся) — відступає на сторінку назад.
+    full=True перечитує все.
+    """
+    if keycrm is None:
+        from payments.keycrm_api import KeyCRMAPI
+        keycrm = KeyCRMAPI()
+
+    state = _sync_state()
+    high_water = None if full else state.high_water_id
+    resume_top = None if full else state.pending_top_id
+    stats = {"pages": 0, "stored": 0, "errors": 0, "complete": 0}
+
+    pass_top = pass_low = None
+    read_until = 0
+    offset = 0
+    jump_floor = verify_low = None
+    while max_pages is None or stats["pages"] < max_pages:
+        result = keycrm.get_external_transactions(limit=page_size, offset=offset)
+        if result is None:
+            stats["errors"] += 1
+            break
+        items = transaction_list(result)
+        stats["pages"] += 1
+        stats["stored"] += store_transactions(items)
+
+        ids = [int(trans["id"]) for trans in items if trans.get("id") is not None]
+        if verify_low is not None and offset > jump_floor and (not ids or ids[0] < verify_low):
+            # між стрибком і найменшим прочитаним id могли лишитись транзакції
+            offset = max(offset - page_size, jump_floor)
+            continue
+        verify_low = None
+
+        read_until = offset + len(items)
+        if ids:
+            pass_top = ids[0] if pass_top is None else pass_top
+            pass_low = ids[-1] if pass_low is None else min(pass_low, ids[-1])
+
+        if (high_water is not None and any(i <= high_water for i in ids)) or len(items) < page_size:
+            stats["complete"] = 1
+            break
+
+        next_offset = offset + page_size
+        if resume_top is not None:
+            position = next((index for index, i in enumerate(ids) if i <= resume_top), None)
+            if position is not None:
+                # відрізок попереднього незавершеного проходу вже в локальній копії
+                jump_floor = next_offset
+                # з перекриттям в одну транзакцію: перша на сторінці має бути pending_low_id
+                next_offset = max(offset + position + state.pending_read - 1, next_offset)
+                verify_low = state.pending_low_id
+                resume_top = None
+        offset = next_offset
+
+    with transaction.atomic():
+        state = KeyCRMTransactionSyncState.objects.select_for_update().get(pk=state.pk)
+        if stats["complete"]:
+            if pass_top is not None:
+                state.high_water_id = max(pass_top, state.high_water_id or pass_top)
+            state.pending_top_id = state.pending_low_id = None
+            state.pending_read = 0
+        elif pass_top is not None:
+            state.pending_top_id = pass_top
+            state.pending_low_id = pass_low
+            state.pending_read = read_until
+        state.save()
+
+    logger.info(
+        "🔄 Синхронізація транзакцій KeyCRM: сторінок=%s, збережено=%s, до id=%s, завершено=%s",
+        stats["pages"], stats["stored"], state.high_water_id, bool(stats["complete"]),
+    )
+    return stats
+
+
+def find_matching_transaction(order: TicketOrder, callback_amount, callback_auth_code: str = ""
+                              ) -> Optional[KeyCRMExternalTransaction]:
+    """
+    Шукає зовнішню транзакцію для замовлення в локальній копії.
+    Точна відповідність: сума + orderReference (опис/uuid) або authCode.
+    Менш надійна: сума + #order.id в описі.
+    Транзакції, вже привʼязані до іншого платежу, пропускаються.
+    """
+    candidates = KeyCRMExternalTransaction.objects.filter(
+        Q(attached_payment_id__isnull=True) | Q(attached_payment_id=order.keycrm_payment_id),
+        amount=_amount(callback_amount),
+    ).order_by("-keycrm_id")
+
+    exact = Q(order_reference=order.wayforpay_order_reference) | Q(uuid=order.wayforpay_order_reference)
+    if callback_auth_code:
+        exact |= Q(auth_code=str(callback_auth_code)[:32])
+
+    match = candidates.filter(exact).first()
+    if match:
+        logger.info("✅ Знайдено відповідну транзакцію %s для замовлення #%s", match.keycrm_id, order.id)
+        return match
+
+    match = candidates.filter(order_number=order.id).first()
+    if match:
+        logger.info("⚠️ Знайдено можливу відповідність по order.id (менш надійно): %s", match.keycrm_id)
+    return match
+
+
+def mark_transaction_attached(trans: KeyCRMExternalTransaction, payment_id) -> None:
+    KeyCRMExternalTransaction.objects.filter(pk=trans.pk).update(attached_payment_id=payment_id)
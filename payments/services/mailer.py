@@ -0,0 +1,175 @@
+import logging
+import os
+import smtplib
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.core.mail.backends.base import BaseEmailBackend
+from django.core.mail.backends.smtp import EmailBackend as SMTPBackend
+
+logger = logging.getLogger(__name__)
+
+# Помилки, після яких зʼєднання вважаємо мертвим і пробуємо ще раз з новим
+CONNECTION_ERRORS = (
+    smtplib.SMTPServerDisconnected,
+    smtplib.SMTPConnectError,
+    ConnectionError,
+    TimeoutError,
+)
+
+
+class SMTPConnectionPool:
+    """
+    Пул автентифікованих SMTP-зʼєднань на процес.
+    Зʼєднання повертаються в пул після відправки і перевикористовуються,
+    тож лист не платить за TLS-рукостискання та AUTH.
+    """
+
+    def __init__(self, size: int = 2, idle_timeout: float = 60.0):
+        self.size = size
+        self.idle_timeout = idle_timeout
+        self._idle: List[Tuple[SMTPBackend, float]] = []
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(size)
+        self._stats = {
+            "sent": 0,
+            "failed": 0,
+            "connections_opened": 0,
+            "reconnects": 0,
+            "send_seconds_total": 0.0,
+            "send_seconds_max": 0.0,
+        }
+
+    def _open(self) -> SMTPBackend:
+        connection = SMTPBackend(fail_silently=False)
+        connection.open()
+        with self._lock:
+            self._stats["connections_opened"] += 1
+        return connection
+
+    @staticmethod
+    def _close(connection: SMTPBackend) -> None:
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    @contextmanager
+    def connection(self):
+        """Бере зʼєднання з пулу (або відкриває нове); зламані зʼєднання закриває"""
+        self._slots.acquire()
+        connection = None
+        try:
+            now = time.monotonic()
+            with self._lock:
+                while self._idle:
+                    candidate, last_used = self._idle.pop()
+                    if now - last_used <= self.idle_timeout:
+                        connection = candidate
+                        break
+                    self._close(candidate)
+            if connection is None:
+                connection = self._open()
+
+            try:
+                yield connection
+            except BaseException:
+                self._close(connection)
+                raise
+            else:
+                with self._lock:
+                    self._idle.append((connection, time.monotonic()))
+        finally:
+            self._slots.release()
+
+    def send_message(self, message) -> bool:
+        """Надсилає один лист; при обриві зʼєднання — одна повторна спроба з новим"""
+        started = time.monotonic()
+        try:
+            for attempt in (1, 2):
+                try:
+                    with self.connection() as connection:
+                        sent = connection.send_messages([message])
+                    break
+                except CONNECTION_ERRORS as e:
+                    if attempt == 2:
+                        raise
+                    with self._lock:
+                        self._stats["reconnects"] += 1
+                    logger.warning(f"♻️ SMTP-зʼєднання розірвано ({e}), перепідключаємось")
+        except Exception:
+            with self._lock:
+                self._stats["failed"] += 1
+            raise
+
+        elapsed = time.monotonic() - started
+        with self._lock:
+            self._stats["sent"] += sent
+            self._stats["send_seconds_total"] += elapsed
+            self._stats["send_seconds_max"] = max(self._stats["send_seconds_max"], elapsed)
+        return bool(sent)
+
+    def close_all(self) -> None:
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for connection, _ in idle:
+            self._close(connection)
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["idle_connections"] = len(self._idle)
+        attempts = stats["sent"] + stats["failed"]
+        stats["send_seconds_avg"] = stats["send_seconds_total"] / attempts if attempts else 0.0
+        stats["pool_size"] = self.size
+        return stats
+
+
+_pool: Optional[SMTPConnectionPool] = None
+_pool_pid: Optional[int] = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> SMTPConnectionPool:
+    """Пул на процес (після fork у gunicorn створюється новий)"""
+    global _pool, _pool_pid
+    pid = os.getpid()
+    if _pool is None or _pool_pid != pid:
+        with _pool_lock:
+            if _pool is None or _pool_pid != pid:
+                _pool = SMTPConnectionPool(
+                    size=getattr(settings, "EMAIL_POOL_SIZE", 2),
+                    idle_timeout=getattr(settings, "EMAIL_POOL_IDLE_SECONDS", 60),
+                )
+                _pool_pid = pid
+    return _pool
+
+
+def mail_stats() -> Dict[str, float]:
+    """Лічильники відправки та латентність для поточного процесу"""
+    return get_pool().stats()
+
+
+class PooledSMTPBackend(BaseEmailBackend):
+    """
+    EMAIL_BACKEND, що відправляє листи через спільний пул SMTP-зʼєднань.
+    Усі виклики EmailMessage.send() у проєкті автоматично йдуть через пул.
+    """
+
+    def send_messages(self, email_messages):
+        if not email_messages:
+            return 0
+
+        pool = get_pool()
+        sent = 0
+        for message in email_messages:
+            try:
+                if pool.send_message(message):
+                    sent += 1
+            except Exception:
+                if not self.fail_silently:
+                    raise
+        return sent
@@ -0,0 +1,162 @@
+import logging
+import traceback
+from datetime import timedelta
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from payments.models import OutboxJob
+
+logger = logging.getLogger(__name__)
+
+JobHandler = Callable[[OutboxJob], None]
+
+_handlers: Dict[str, JobHandler] = {}
+_failure_hooks: Dict[str, JobHandler] = {}
+
+
+def register_handler(kind: str, on_failed: Optional[JobHandler] = None) -> Callable[[JobHandler], JobHandler]:
+    """
+    Декоратор: реєструє обробник для типу завдання.
+    on_failed викликається, коли завдання вичерпало всі спроби.
+    """
+    def decorator(func: JobHandler) -> JobHandler:
+        _handlers[kind] = func
+        if on_failed is not None:
+            _failure_hooks[kind] = on_failed
+        return func
+    return decorator
+
+
+def get_handler(kind: str) -> Optional[JobHandler]:
+    return _handlers.get(kind)
+
+
+def enqueue(kind: str, payload: Dict[str, Any], run_after=None, max_attempts: Optional[int] = None) -> OutboxJob:
+    """Ставить завдання в чергу. Викликати всередині транзакції, що змінює замовлення."""
+    job = OutboxJob.objects.create(
+        kind=kind,
+        payload=payload,
+        run_after=run_after or timezone.now(),
+        max_attempts=max_attempts or getattr(settings, "OUTBOX_MAX_ATTEMPTS", 5),
+    )
+    logger.info(f"📥 Завдання {kind} #{job.id} поставлено в чергу: {payload}")
+    return job
+
+
+def retry_delay(attempts: int) -> timedelta:
+    """Експоненційна затримка між спробами: base * 2^(n-1), але не більше max"""
+    base = getattr(settings, "OUTBOX_RETRY_BASE_SECONDS", 30)
+    cap = getattr(settings, "OUTBOX_RETRY_MAX_SECONDS", 3600)
+    return timedelta(seconds=min(base * (2 ** max(attempts - 1, 0)), cap))
+
+
+def release_stale_jobs() -> int:
+    """Повертає в чергу завдання, що «зависли» в running (наприклад, воркер впав)"""
+    lock_timeout = getattr(settings, "OUTBOX_LOCK_TIMEOUT_SECONDS", 600)
+    threshold = timezone.now() - timedelta(seconds=lock_timeout)
+    released = OutboxJob.objects.filter(
+        status="running",
+        locked_at__lt=threshold,
+    ).update(status="pending", locked_at=None)
+    if released:
+        logger.warning(f"♻️ Повернуто в чергу {released} завислих завдань")
+    return released
+
+
+def claim_jobs(batch_size: int = 10, kinds: Optional[Iterable[str]] = None) -> List[OutboxJob]:
+    """Забирає готові до виконання завдання, не блокуючи інших воркерів"""
+    now = timezone.now()
+    with transaction.atomic():
+        qs = OutboxJob.objects.select_for_update(skip_locked=True).filter(
+            status="pending",
+            run_after__lte=now,
+        )
+        if kinds:
+            qs = qs.filter(kind__in=list(kinds))
+        jobs = list(qs.order_by("run_after")[:batch_size])
+        if not jobs:
+            return []
+
+        OutboxJob.objects.filter(id__in=[job.id for job in jobs]).update(
+            status="running",
+            locked_at=now,
+            attempts=F("attempts") + 1,
+        )
+
+    for job in jobs:
+        job.status = "running"
+        job.locked_at = now
+        job.attempts += 1
+    return jobs
+
+
+def registered_kinds() -> List[str]:
+    return list(_handlers)
+
+
+def touch_job(job: OutboxJob) -> None:
+    """Heartbeat для довгих завдань, щоб release_stale_jobs не повернув їх у чергу"""
+    job.locked_at = timezone.now()
+    OutboxJob.objects.filter(id=job.id).update(locked_at=job.locked_at)
+
+
+def complete_job(job: OutboxJob) -> None:
+    job.status = "done"
+    job.locked_at = None
+    job.last_error = ""
+    job.save(update_fields=["status", "locked_at", "last_error", "updated_at"])
+    logger.info(f"✅ Завдання {job.kind} #{job.id} виконано")
+
+
+def reschedule_job(job: OutboxJob, delay: timedelta, reason: str = "") -> None:
+    """Відкладає завдання без зарахування спроби (очікуваний стан, а не помилка)"""
+    job.status = "pending"
+    job.locked_at = None
+    job.attempts = max(job.attempts - 1, 0)
+    job.run_after = timezone.now() + delay
+    job.last_error = reason
+    job.save(update_fields=["status", "locked_at", "attempts", "run_after", "last_error", "updated_at"])
+
+
+def fail_job_attempt(job: OutboxJob, error: Exception) -> None:
+    """Фіксує невдалу спробу: повтор з backoff або остаточна помилка"""
+    # format_exc() поза except дає "NoneType: None" — а reconcile/lead передають щойно створений виняток
+    job.last_error = f"{error}\n{''.join(traceback.format_exception(error))}"
+    job.locked_at = None
+    if job.attempts >= job.max_attempts:
+        job.status = "failed"
+        logger.error(f"❌ Завдання {job.kind} #{job.id} остаточно провалено після {job.attempts} спроб: {error}")
+    else:
+        job.status = "pending"
+        job.run_after = timezone.now() + retry_delay(job.attempts)
+        logger.warning(
+            f"⚠️ Завдання {job.kind} #{job.id} (спроба {job.attempts}/{job.max_attempts}) "
+            f"не виконано: {error}. Повтор після {job.run_after}"
+        )
+    job.save(update_fields=["status", "run_after", "locked_at", "last_error", "updated_at"])
+    if job.status == "failed" and job.kind in _failure_hooks:
+        _failure_hooks[job.kind](job)
+
+
+def run_job(job: OutboxJob) -> bool:
+    """Виконує завдання. Повертає True, якщо успішно."""
+    handler = get_handler(job.kind)
+    if handler is None:
+        job.status = "failed"
+        job.last_error = f"No handler registered for kind '{job.kind}'"
+        job.save(update_fields=["status", "last_error", "updated_at"])
+        logger.error(f"❌ Немає обробника для завдання {job.kind} #{job.id}")
+        return False
+
+    try:
+        handler(job)
+    except Exception as e:
+        fail_job_attempt(job, e)
+        return False
+
+    complete_job(job)
+    return True
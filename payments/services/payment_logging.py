@@ -0,0 +1,88 @@
+import json
+import logging
+import random
+import time
+from functools import wraps
+from typing import Any, Dict
+
+from django.conf import settings
+
+logger = logging.getLogger("payments.callbacks")
+
+
+class LazyJSON:
+    """Серіалізує дані лише тоді, коли запис справді форматується обробником"""
+
+    __slots__ = ("data",)
+
+    def __init__(self, data: Any):
+        self.data = data
+
+    def __str__(self) -> str:
+        return json.dumps(self.data, ensure_ascii=False, default=str)
+
+
+def should_sample() -> bool:
+    """Чи писати детальну діагностику для цього запиту (PAYMENTS_LOG_SAMPLE_RATE)"""
+    rate = getattr(settings, "PAYMENTS_LOG_SAMPLE_RATE", 0.0)
+    return rate >= 1 or (rate > 0 and random.random() < rate)
+
+
+def log_payload(log: logging.Logger, label: str, data: Any) -> None:
+    """Повний payload — лише на DEBUG і лише з PAYMENTS_LOG_PAYLOADS=True"""
+    if getattr(settings, "PAYMENTS_LOG_PAYLOADS", False) and log.isEnabledFor(logging.DEBUG):
+        log.debug("%s payload: %s", label, LazyJSON(data))
+
+
+class CallbackEvent:
+    """
+    Підсумковий запис про один callback: view доповнює поля по ходу обробки,
+    а log_callback пише їх одним рядком разом з HTTP-статусом і тривалістю.
+    """
+
+    __slots__ = ("source", "fields", "started")
+
+    def __init__(self, source: str):
+        self.source = source
+        self.fields: Dict[str, Any] = {}
+        self.started = time.perf_counter()
+
+    def update(self, **fields: Any) -> None:
+        # поля, яких немає в payload (None), не пишемо: у рядку буде "-", а не "None"
+        self.fields.update((name, value) for name, value in fields.items() if value is not None)
+
+    def emit(self, status_code: int) -> float:
+        duration_ms = (time.perf_counter() - self.started) * 1000
+        level = logging.INFO if status_code < 400 else logging.WARNING
+        if logger.isEnabledFor(level):
+            fields = self.fields
+            logger.log(
+                level,
+                "callback source=%s ref=%s status=%s outcome=%s order=%s http=%s duration_ms=%.1f",
+                self.source,
+                fields.get("order_reference", "-"),
+                fields.get("transaction_status", "-"),
+                fields.get("outcome", "-"),
+                fields.get("order_id", "-"),
+                status_code,
+                duration_ms,
+                extra={"callback": dict(fields, source=self.source, http_status=status_code, duration_ms=duration_ms)},
+            )
+        return duration_ms
+
+
+def log_callback(source: str):
+    """Декоратор callback-view: створює request.callback_event і пише його після відповіді"""
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            event = CallbackEvent(source)
+            request.callback_event = event
+            response = view(request, *args, **kwargs)
+            event.emit(response.status_code)
+            return response
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,306 @@
+import logging
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from datetime import timedelta
+from typing import Dict, Optional
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.utils.module_loading import import_string
+
+from payments.models import Event, TicketOrder
+
+logger = logging.getLogger(__name__)
+
+# Статуси замовлень, які займають місце на події
+HELD_STATUSES = ("pending", "success")
+
+
+@dataclass(frozen=True)
+class SeatHold:
+    hold_id: str
+    # скільки місць зайнято разом з цією бронею
+    seat: int
+
+
+def reservation_ttl(event: Optional[Event]) -> timedelta:
+    minutes = getattr(event, "reservation_ttl_minutes", None) or settings.TICKET_RESERVATION_TTL_MINUTES
+    return timedelta(minutes=minutes)
+
+
+class BaseReservationBackend:
+    """
+    Облік місць на події: броні, продані квитки, звільнення.
+    persistent_holds=True — бронею є pending-рядок TicketOrder
+    (його треба прострочувати у БД); інакше броні живуть у TTL-сховищі.
+    """
+
+    persistent_holds = False
+
+    def reserve(self, event: Event) -> Optional[SeatHold]:
+        raise NotImplementedError
+
+    def release(self, event_id: Optional[int], hold_id: str) -> None:
+        """Скасовує бронь (замовлення не створилось або оплата відхилена)"""
+        raise NotImplementedError
+
+    def add_sold(self, event: Event, count: int = 1) -> int:
+        """Продані місця поза лімітом (безкоштовні квитки). Повертає кількість зайнятих місць"""
+        raise NotImplementedError
+
+    def on_status_change(self, order: TicketOrder, old_status: str, new_status: str) -> None:
+        raise NotImplementedError
+
+    def release_expired(self, event_id: Optional[int], count: int) -> None:
+        """Викликається після прострочення count pending-замовлень події"""
+
+    def recount(self, event: Event) -> int:
+        raise NotImplementedError
+
+    def reset(self, event_id: int) -> None:
+        """Видаляє стан події зі сховища (тести, бенчмарк)"""
+
+
+class DatabaseReservationBackend(BaseReservationBackend):
+    """Лічильник Event.tickets_reserved: оплачені квитки + pending-замовлення"""
+
+    persistent_holds = True
+
+    def reserve(self, event: Event) -> Optional[SeatHold]:
+        # Одне умовне UPDATE без блокування події і COUNT
+        with transaction.atomic():
+            claimed = Event.objects.filter(
+                pk=event.pk,
+                tickets_reserved__lt=F("max_tickets"),
+            ).update(tickets_reserved=F("tickets_reserved") + 1)
+            if not claimed:
+                return None
+            # рядок події заблокований нашим UPDATE до коміту — значення саме наше
+            seat = Event.objects.filter(pk=event.pk).values_list("tickets_reserved", flat=True).get()
+        return SeatHold(hold_id="", seat=seat)
+
+    def _release_seats(self, event_id: Optional[int], count: int) -> None:
+        if not event_id or count <= 0:
+            return
+        Event.objects.filter(pk=event_id).update(
+            tickets_reserved=Greatest(F("tickets_reserved") - count, 0)
+        )
+
+    def release(self, event_id: Optional[int], hold_id: str) -> None:
+        self._release_seats(event_id, 1)
+
+    def add_sold(self, event: Event, count: int = 1) -> int:
+        with transaction.atomic():
+            Event.objects.filter(pk=event.pk).update(tickets_reserved=F("tickets_reserved") + count)
+            return Event.objects.filter(pk=event.pk).values_list("tickets_reserved", flat=True).get()
+
+    def on_status_change(self, order: TicketOrder, old_status: str, new_status: str) -> None:
+        delta = (new_status in HELD_STATUSES) - (old_status in HELD_STATUSES)
+        if not order.event_id or not delta:
+            return
+        if delta > 0:
+            # оплата простроченої броні: місце вже продане, ліміт не перевіряємо
+            self.add_sold(order.event, delta)
+        else:
+            self._release_seats(order.event_id, -delta)
+
+    def release_expired(self, event_id: Optional[int], count: int) -> None:
+        self._release_seats(event_id, count)
+
+    def recount(self, event: Event) -> int:
+        with transaction.atomic():
+            event = Event.objects.select_for_update().get(pk=event.pk)
+            reserved = TicketOrder.objects.filter(
+                event=event,
+                payment_status__in=HELD_STATUSES,
+            ).count()
+            Event.objects.filter(pk=event.pk).update(tickets_reserved=reserved)
+        return reserved
+
+
+def _paid_seats(event_id: int, exclude_pk: Optional[int] = None) -> int:
+    queryset = TicketOrder.objects.filter(event_id=event_id, payment_status="success")
+    if exclude_pk is not None:
+        queryset = queryset.exclude(pk=exclude_pk)
+    return queryset.count()
+
+
+class LocMemReservationBackend(BaseReservationBackend):
+    """
+    Броні в памʼяті процесу. Для тестів і одного процесу:
+    у gunicorn з кількома воркерами кожен має власні броні.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._holds: Dict[int, Dict[str, float]] = {}
+        self._sold: Dict[int, int] = {}
+
+    def _sold_for(self, event_id: int) -> int:
+        if event_id not in self._sold:
+            self._sold[event_id] = _paid_seats(event_id)
+        return self._sold[event_id]
+
+    def _live_holds(self, event_id: int, now: float) -> Dict[str, float]:
+        holds = self._holds.setdefault(event_id, {})
+        for hold_id in [h for h, expires_at in holds.items() if expires_at <= now]:
+            del holds[hold_id]
+        return holds
+
+    def reserve(self, event: Event) -> Optional[SeatHold]:
+        now = time.time()
+        hold_id = uuid.uuid4().hex
+        with self._lock:
+            sold = self._sold_for(event.pk)
+            holds = self._live_holds(event.pk, now)
+            if sold + len(holds) >= event.max_tickets:
+                return None
+            holds[hold_id] = now + reservation_ttl(event).total_seconds()
+            return SeatHold(hold_id=hold_id, seat=sold + len(holds))
+
+    def release(self, event_id: Optional[int], hold_id: str) -> None:
+        if not event_id:
+            return
+        with self._lock:
+            self._holds.get(event_id, {}).pop(hold_id, None)
+
+    def add_sold(self, event: Event, count: int = 1) -> int:
+        with self._lock:
+            self._sold[event.pk] = self._sold_for(event.pk) + count
+            return self._sold[event.pk] + len(self._live_holds(event.pk, time.time()))
+
+    def on_status_change(self, order: TicketOrder, old_status: str, new_status: str) -> None:
+        if not order.event_id or old_status == new_status:
+            return
+        with self._lock:
+            self._holds.get(order.event_id, {}).pop(order.reservation_id, None)
+            if order.event_id not in self._sold:
+                # замовлення вже збережене з new_status — рахуємо стан до зміни, інакше квиток врахується двічі
+                self._sold[order.event_id] = (
+                    _paid_seats(order.event_id, exclude_pk=order.pk) + (old_status == "success")
+                )
+            sold = self._sold[order.event_id]
+            if new_status == "success":
+                self._sold[order.event_id] = sold + 1
+            elif old_status == "success":
+                self._sold[order.event_id] = max(sold - 1, 0)
+
+    def recount(self, event: Event) -> int:
+        sold = _paid_seats(event.pk)
+        with self._lock:
+            self._sold[event.pk] = sold
+            return sold + len(self._live_holds(event.pk, time.time()))
+
+    def reset(self, event_id: int) -> None:
+        with self._lock:
+            self._holds.pop(event_id, None)
+            self._sold.pop(event_id, None)
+
+
+# KEYS: броні (ZSET hold_id -> expires_at), продані (лічильник)
+# ARGV: now, expires_at, hold_id, max_tickets
+_RESERVE_SCRIPT = """
+if redis.call('EXISTS', KEYS[2]) == 0 then
+    return -2
+end
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', ARGV[1])
+local taken = tonumber(redis.call('GET', KEYS[2])) + redis.call('ZCARD', KEYS[1])
+if taken >= tonumber(ARGV[4]) then
+    return -1
+end
+redis.call('ZADD', KEYS[1], ARGV[2], ARGV[3])
+return taken + 1
+"""
+
+# ARGV: hold_id, зміна кількості проданих (-1, 0, 1)
+_STATUS_SCRIPT = """
+redis.call('ZREM', KEYS[1], ARGV[1])
+local delta = tonumber(ARGV[2])
+if delta ~= 0 and redis.call('EXISTS', KEYS[2]) == 1 then
+    local sold = redis.call('INCRBY', KEYS[2], delta)
+    if sold < 0 then
+        redis.call('SET', KEYS[2], 0)
+    end
+end
+return 1
+"""
+
+
+class RedisReservationBackend(BaseReservationBackend):
+    """
+    Броні в Redis (або сумісному сервері): перевірка ліміту і бронь —
+    один Lua-скрипт, прострочені броні прибираються тим самим скриптом.
+    Лічильник проданих ініціалізується з БД при першому зверненні.
+    """
+
+    def __init__(self, url: Optional[str] = None, prefix: str = "seats"):
+        try:
+            import redis
+        except ImportError as e:
+            raise ImproperlyConfigured("RedisReservationBackend requires the 'redis' package") from e
+
+        self.client = redis.Redis.from_url(url or settings.TICKET_RESERVATION_REDIS_URL)
+        self.prefix = prefix
+        self._reserve = self.client.register_script(_RESERVE_SCRIPT)
+        self._status = self.client.register_script(_STATUS_SCRIPT)
+
+    def _keys(self, event_id: int):
+        return [f"{self.prefix}:{event_id}:holds", f"{self.prefix}:{event_id}:sold"]
+
+    def _seed_sold(self, event_id: int) -> None:
+        self.client.set(self._keys(event_id)[1], _paid_seats(event_id), nx=True)
+
+    def reserve(self, event: Event) -> Optional[SeatHold]:
+        now = time.time()
+        hold_id = uuid.uuid4().hex
+        args = [now, now + reservation_ttl(event).total_seconds(), hold_id, event.max_tickets]
+        seat = self._reserve(keys=self._keys(event.pk), args=args)
+        if seat == -2:
+            self._seed_sold(event.pk)
+            seat = self._reserve(keys=self._keys(event.pk), args=args)
+        if seat < 0:
+            return None
+        return SeatHold(hold_id=hold_id, seat=int(seat))
+
+    def release(self, event_id: Optional[int], hold_id: str) -> None:
+        if event_id:
+            self._status(keys=self._keys(event_id), args=[hold_id, 0])
+
+    def add_sold(self, event: Event, count: int = 1) -> int:
+        holds_key, sold_key = self._keys(event.pk)
+        self._seed_sold(event.pk)
+        sold = self.client.incrby(sold_key, count)
+        return sold + self.client.zcount(holds_key, time.time(), "+inf")
+
+    def on_status_change(self, order: TicketOrder, old_status: str, new_status: str) -> None:
+        if not order.event_id or old_status == new_status:
+            return
+        delta = (new_status == "success") - (old_status == "success")
+        self._status(keys=self._keys(order.event_id), args=[order.reservation_id, delta])
+
+    def recount(self, event: Event) -> int:
+        holds_key, sold_key = self._keys(event.pk)
+        sold = _paid_seats(event.pk)
+        self.client.set(sold_key, sold)
+        return sold + self.client.zcount(holds_key, time.time(), "+inf")
+
+    def reset(self, event_id: int) -> None:
+        self.client.delete(*self._keys(event_id))
+
+
+_backend: Optional[BaseReservationBackend] = None
+_backend_lock = threading.Lock()
+
+
+def get_reservation_backend() -> BaseReservationBackend:
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = import_string(settings.TICKET_RESERVATION_BACKEND)()
+    return _backend
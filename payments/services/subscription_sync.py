@@ -0,0 +1,111 @@
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from payments.models import Subscription, SubscriptionOrder
+
+# Статуси, з яких регулярка в WayForPay вже не повертається
+TERMINAL_STATUSES = ("removed", "completed")
+
+
+def _hours(name: str, default: float) -> timedelta:
+    return timedelta(hours=getattr(settings, name, default))
+
+
+def compute_next_sync_at(sub: Subscription, now: Optional[datetime] = None) -> Optional[datetime]:
+    """
+    Коли підписку знову варто запитати у WayForPay (None — ніколи):
+    - біля nextPaymentDate (± вікно) — часто, щоб швидко побачити результат списання;
+    - активна далеко до списання — не частіше за IDLE, але не пізніше за початок вікна;
+    - suspended — рідко; removed/completed — раз на TERMINAL_DAYS або ніколи.
+    """
+    now = now or timezone.now()
+
+    if sub.status in TERMINAL_STATUSES:
+        days = getattr(settings, "SUBSCRIPTION_SYNC_TERMINAL_DAYS", 30)
+        return now + timedelta(days=days) if days > 0 else None
+
+    if sub.status == "suspended":
+        return now + _hours("SUBSCRIPTION_SYNC_SUSPENDED_HOURS", 72)
+
+    default = now + _hours("SUBSCRIPTION_SYNC_DEFAULT_HOURS", 24)
+    if sub.status != "active" or sub.next_payment_date is None:
+        return default
+
+    window = _hours("SUBSCRIPTION_SYNC_PAYMENT_WINDOW_HOURS", 24)
+    window_start = sub.next_payment_date - window
+    if now < window_start:
+        return min(window_start, now + _hours("SUBSCRIPTION_SYNC_IDLE_HOURS", 72))
+    if now <= sub.next_payment_date + window:
+        return now + _hours("SUBSCRIPTION_SYNC_NEAR_PAYMENT_HOURS", 2)
+    # списання мало відбутись, але WayForPay ще не зсунув nextPaymentDate
+    return default
+
+
+def retry_at(now: Optional[datetime] = None) -> datetime:
+    """Коли повторити STATUS після помилки запиту"""
+    return (now or timezone.now()) + timedelta(minutes=getattr(settings, "SUBSCRIPTION_SYNC_RETRY_MINUTES", 60))
+
+
+def subscription_orders(include_all: bool = False):
+    """Замовлення підписок з orderReference (за замовчуванням лише оплачені)"""
+    qs = SubscriptionOrder.objects.exclude(
+        wayforpay_order_reference__isnull=True
+    ).exclude(
+        wayforpay_order_reference__exact=""
+    )
+    if not include_all:
+        qs = qs.filter(payment_status="success")
+    return qs
+
+
+def due_order_references(limit: int = 0, include_all: bool = False,
+                         now: Optional[datetime] = None) -> Tuple[List[str], int]:
+    """
+    Черга на синхронізацію: спершу orderReference, для яких ще немає Subscription,
+    далі підписки з next_sync_at <= now, від найбільш прострочених.
+    Повертає (orderReference до синхронізації, скільки підписок ще не на черзі).
+    """
+    now = now or timezone.now()
+
+    new_refs = list(
+        subscription_orders(include_all)
+        .exclude(wayforpay_order_reference__in=Subscription.objects.values("order_reference"))
+        .order_by("-created_at")
+        .values_list("wayforpay_order_reference", flat=True)
+    )
+    refs = list(dict.fromkeys(ref.strip() for ref in new_refs if ref and ref.strip()))
+    if limit > 0:
+        refs = refs[:limit]
+
+    due = Subscription.objects.filter(next_sync_at__lte=now).order_by("next_sync_at")
+    if limit > 0:
+        due = due[:max(limit - len(refs), 0)]
+    refs.extend(due.values_list("order_reference", flat=True))
+
+    not_due = Subscription.objects.filter(Q(next_sync_at__gt=now) | Q(next_sync_at__isnull=True)).count()
+    return refs, not_due
+
+
+def latest_orders(order_refs: List[str], include_all: bool = True) -> dict:
+    """Найновіше замовлення для кожного orderReference (контакти для Subscription)"""
+    orders = {}
+    qs = subscription_orders(include_all).filter(wayforpay_order_reference__in=order_refs).order_by("created_at")
+    for order in qs:
+        orders[order.wayforpay_order_reference.strip()] = order
+    return orders
+
+
+def schedule_failed(order_refs: List[str], now: Optional[datetime] = None) -> int:
+    """Після помилки STATUS відкладаємо підписку на retry_at замість повтору на кожному запуску"""
+    if not order_refs:
+        return 0
+    return Subscription.objects.filter(order_reference__in=order_refs).update(next_sync_at=retry_at(now))
+
+
+def mark_sync_due(order_reference: str) -> int:
+    """Подія від WayForPay по підписці — синхронізуємо її на найближчому запуску"""
+    return Subscription.objects.filter(order_reference=order_reference).update(next_sync_at=timezone.now())
@@ -0,0 +1,146 @@
+import csv
+import json
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional
+
+from django.db import connection, connections, transaction
+
+from payments.models import Event, TicketOrder
+from payments.services.inventory import add_seats
+from payments.services.outbox import enqueue
+from payments.services.ticket_numbers import allocate_ticket_numbers
+from payments.ticket_utils import get_ticket_pdf_bytes
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Guest:
+    name: str
+    email: str
+    phone: str = ""
+
+
+@dataclass
+class IssuanceReport:
+    issued: List[int] = field(default_factory=list)
+    failures: Dict[int, str] = field(default_factory=dict)
+    render_seconds: float = 0.0
+    total_seconds: float = 0.0
+
+    @property
+    def tickets_per_second(self) -> float:
+        return len(self.issued) / self.render_seconds if self.render_seconds else 0.0
+
+
+def load_guests(path: str) -> List[Guest]:
+    """Читає гостей з CSV (name,email,phone) або JSON (список обʼєктів)"""
+    with open(path, encoding="utf-8-sig") as f:
+        if path.lower().endswith(".json"):
+            rows: Iterable[Dict[str, Any]] = json.load(f)
+        else:
+            rows = list(csv.DictReader(f))
+
+    guests = []
+    for row in rows:
+        name = (row.get("name") or "").strip()
+        email = (row.get("email") or "").strip()
+        if not name or not email:
+            raise ValueError(f"Guest row must have name and email: {row}")
+        guests.append(Guest(name=name, email=email, phone=(row.get("phone") or "").strip()))
+    return guests
+
+
+def _create_orders(event: Event, guests: List[Guest], send_email: bool = True) -> List[TicketOrder]:
+    """
+    Створює замовлення, видає номери квитків і ставить листи в чергу однією
+    транзакцією: після коміту кожен квиток або вже має завдання ticket_paid,
+    або не існує взагалі.
+    """
+    with transaction.atomic():
+        reserved = add_seats(event, len(guests))
+        # блок номерів одним інкрементом лічильника події
+        numbers = allocate_ticket_numbers(event.pk, len(guests))
+
+        if reserved > event.max_tickets:
+            logger.warning(
+                f"⚠️ Масова видача перевищує ліміт події: {reserved} > {event.max_tickets}"
+            )
+
+        orders = [
+            TicketOrder(
+                name=guest.name,
+                email=guest.email,
+                phone=guest.phone,
+                payment_status="success",
+                amount=event.price,
+                device_type="manual",
+                event=event,
+                event_name=event.title,
+                ticket_number=number,
+                email_status="queued" if send_email else "not_sent",
+            )
+            for guest, number in zip(guests, numbers)
+        ]
+
+        if connection.features.can_return_rows_from_bulk_insert:
+            orders = TicketOrder.objects.bulk_create(orders)
+        else:
+            for order in orders:
+                order.save()
+
+        if send_email:
+            # воркер візьме PDF з кешу, а якщо рендер нижче не встиг чи впав — згенерує сам
+            for order in orders:
+                enqueue("ticket_paid", {"order_id": order.id})
+        return orders
+
+
+def _render_to_cache(order: TicketOrder) -> None:
+    """Виконується в дочірньому процесі: рендерить PDF у кеш квитків"""
+    get_ticket_pdf_bytes(order)
+
+
+def issue_free_tickets(
+    guests: List[Guest],
+    event: Optional[Event] = None,
+    workers: Optional[int] = None,
+    send_email: bool = True,
+) -> IssuanceReport:
+    """
+    Масова видача безкоштовних квитків: замовлення, номери й завдання на листи —
+    однією транзакцією, PDF — паралельно в пулі процесів, листи надсилає run_outbox_worker.
+    """
+    started = time.perf_counter()
+    report = IssuanceReport()
+
+    event = event or Event.objects.filter(is_active=True).first()
+    if event is None:
+        raise ValueError("Подію не знайдено.")
+
+    orders = _create_orders(event, guests, send_email)
+    logger.info(f"🎟️ Створено {len(orders)} безкоштовних квитків для події {event.pk}")
+
+    # Дочірні процеси не повинні ділити зʼєднання з БД батьківського
+    connections.close_all()
+
+    render_started = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+        futures = {executor.submit(_render_to_cache, order): order for order in orders}
+        for future in as_completed(futures):
+            order = futures[future]
+            try:
+                future.result()
+            except Exception as e:
+                report.failures[order.id] = str(e)
+                logger.error(f"❌ Не вдалося згенерувати PDF для квитка #{order.id}: {e}")
+    report.render_seconds = time.perf_counter() - render_started
+
+    report.issued = [order.id for order in orders if order.id not in report.failures]
+
+    report.total_seconds = time.perf_counter() - started
+    return report
@@ -0,0 +1,54 @@
+import logging
+from typing import Optional
+
+from django.db import connection, transaction
+from django.db.models import F
+
+from payments.models import Event, TicketOrder
+
+logger = logging.getLogger(__name__)
+
+
+def allocate_ticket_numbers(event_id: int, count: int = 1) -> range:
+    """
+    Видає count послідовних номерів квитків події одним атомарним інкрементом
+    лічильника Event.last_ticket_number. Рядок події блокується лише до кінця
+    поточної транзакції, тож номери не повторюються і не пропускаються.
+    Якщо події немає — Event.DoesNotExist.
+    """
+    if count <= 0:
+        return range(0)
+
+    if connection.vendor == "postgresql":
+        # UPDATE ... RETURNING — один запит до БД
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"UPDATE {Event._meta.db_table} SET last_ticket_number = last_ticket_number + %s "
+                f"WHERE id = %s RETURNING last_ticket_number",
+                [count, event_id],
+            )
+            row = cursor.fetchone()
+        last = row[0] if row else None
+    else:
+        with transaction.atomic():
+            Event.objects.filter(pk=event_id).update(last_ticket_number=F("last_ticket_number") + count)
+            last = Event.objects.filter(pk=event_id).values_list("last_ticket_number", flat=True).first()
+
+    if last is None:
+        raise Event.DoesNotExist(f"Подію #{event_id} не знайдено — номери квитків не видано")
+
+    return range(last - count + 1, last + 1)
+
+
+def assign_ticket_number(order: TicketOrder) -> Optional[int]:
+    """
+    Присвоює номер проданому квитку (якщо ще немає); зберігає замовлення викликач.
+    Викликається в тій самій транзакції, що зберігає оплату, тому скасована
+    транзакція не лишає дірок у нумерації.
+    """
+    if order.ticket_number or not order.event_id:
+        return order.ticket_number
+
+    order.ticket_number = allocate_ticket_numbers(order.event_id)[0]
+    logger.debug("Замовленню #%s присвоєно квиток №%s", order.id, order.ticket_number)
+    return order.ticket_number
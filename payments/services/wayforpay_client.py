@@ -1,8 +1,10 @@
+import asyncio
 import hashlib
 import json
 from dataclasses import dataclass
-from typing import Any, Dict, Optional
+from typing import Any, AsyncIterator, Dict, Iterable, Optional, Tuple, Union
 
+import httpx
 import requests
 
 
@@ -18,33 +20,115 @@ class WayForPayRegularApiError(RuntimeError):
     pass
 
 
+def _status_payload(config: WayForPayConfig, order_reference: str) -> Dict[str, Any]:
+    return {
+        "requestType": "STATUS",
+        "merchantAccount": config.merchant_account,
+        "merchantPassword": config.merchant_password,
+        "orderReference": order_reference,
+    }
+
+
+def _parse_response(status_code: int, json_loader) -> Dict[str, Any]:
+    try:
+        data = json_loader()
+    except ValueError as e:
+        raise WayForPayRegularApiError(f"WayForPay returned non-JSON (HTTP {status_code})") from e
+
+    if status_code >= 400:
+        raise WayForPayRegularApiError(f"WayForPay HTTP {status_code}: {data}")
+
+    return data
+
+
 class WayForPayRegularClient:
     def __init__(self, config: WayForPayConfig):
         self.config = config
 
     def status(self, order_reference: str) -> Dict[str, Any]:
-        payload = {
-            "requestType": "STATUS",
-            "merchantAccount": self.config.merchant_account,
-            "merchantPassword": self.config.merchant_password,
-            "orderReference": order_reference,
-        }
-
         try:
             resp = requests.post(
                 self.config.base_url,
-                json=payload,
+                json=_status_payload(self.config, order_reference),
                 timeout=self.config.timeout_seconds,
             )
         except requests.RequestException as e:
             raise WayForPayRegularApiError(f"WayForPay request failed: {e}") from e
 
-        try:
-            data = resp.json()
-        except ValueError as e:
-            raise WayForPayRegularApiError(f"WayForPay returned non-JSON (HTTP {resp.status_code})") from e
+        return _parse_response(resp.status_code, resp.json)
+
 
-        if resp.status_code >= 400:
-            raise WayForPayRegularApiError(f"WayForPay HTTP {resp.status_code}: {data}")
+class AsyncWayForPayRegularClient:
+    """
+    Асинхронний клієнт regularApi: один httpx.AsyncClient з keep-alive пулом
+    на concurrency зʼєднань і семафор, що обмежує кількість запитів у польоті.
 
-        return data
+        async with AsyncWayForPayRegularClient(config, concurrency=8) as client:
+            async for order_reference, result in client.status_many(refs):
+                ...
+    """
+
+    def __init__(self, config: WayForPayConfig, concurrency: int = 8, transport=None):
+        self.config = config
+        self.concurrency = max(1, concurrency)
+        self._transport = transport
+        self._client: Optional[httpx.AsyncClient] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    async def __aenter__(self) -> "AsyncWayForPayRegularClient":
+        self._client = httpx.AsyncClient(
+            timeout=self.config.timeout_seconds,
+            limits=httpx.Limits(
+                max_connections=self.concurrency,
+                max_keepalive_connections=self.concurrency,
+            ),
+            transport=self._transport,
+        )
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.aclose()
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def status(self, order_reference: str) -> Dict[str, Any]:
+        if self._client is None:
+            raise RuntimeError("AsyncWayForPayRegularClient must be used as 'async with' context manager")
+
+        async with self._semaphore:
+            try:
+                resp = await self._client.post(
+                    self.config.base_url,
+                    json=_status_payload(self.config, order_reference),
+                )
+            except httpx.HTTPError as e:
+                # у помилок зʼєднання/читання httpx str(e) часто порожній
+                raise WayForPayRegularApiError(f"WayForPay request failed: {type(e).__name__}: {e}") from e
+
+        return _parse_response(resp.status_code, resp.json)
+
+    async def status_many(
+        self, order_references: Iterable[str]
+    ) -> AsyncIterator[Tuple[str, Union[Dict[str, Any], WayForPayRegularApiError]]]:
+        """
+        STATUS для кожного orderReference; результати віддаються в порядку готовності.
+        Помилка окремого запиту повертається як результат і не зупиняє решту.
+        """
+
+        async def one(order_reference: str):
+            try:
+                return order_reference, await self.status(order_reference)
+            except WayForPayRegularApiError as e:
+                return order_reference, e
+
+        tasks = [asyncio.ensure_future(one(ref)) for ref in order_references]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            for task in tasks:
+                task.cancel()
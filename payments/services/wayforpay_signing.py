@@ -0,0 +1,107 @@
+import hashlib
+import hmac
+import time
+from functools import lru_cache
+from typing import Any, Dict, Iterable, Mapping, Optional
+
+from django.conf import settings
+
+# Поля callback-а WayForPay, що входять у merchantSignature
+CALLBACK_FIELDS = (
+    "merchantAccount",
+    "orderReference",
+    "amount",
+    "currency",
+    "authCode",
+    "cardPan",
+    "transactionStatus",
+    "reasonCode",
+)
+
+_SEPARATOR = ";"
+# значення за замовчуванням для data.get(field, "") по кожному з CALLBACK_FIELDS
+_MISSING = ("",) * len(CALLBACK_FIELDS)
+
+
+_MD5_BLOCK_SIZE = 64
+
+
+@lru_cache(maxsize=8)
+def _keyed_pads(secret_key: str):
+    """
+    Стани MD5 з уже поглинутими key^ipad і key^opad (RFC 2104). Підпис — дві
+    копії станів і два update замість побудови hmac-обʼєкта на кожен виклик.
+    """
+    key = secret_key.encode("utf-8")
+    if len(key) > _MD5_BLOCK_SIZE:
+        key = hashlib.md5(key).digest()
+    key = key.ljust(_MD5_BLOCK_SIZE, b"\0")
+    inner = hashlib.md5(bytes(b ^ 0x36 for b in key))
+    outer = hashlib.md5(bytes(b ^ 0x5C for b in key))
+    return inner, outer
+
+
+def _secret(secret_key: Optional[str]) -> str:
+    return settings.WAYFORPAY_SECRET_KEY if secret_key is None else secret_key
+
+
+def sign_fields(fields: Iterable[Any], secret_key: Optional[str] = None) -> str:
+    """HMAC-MD5 від "поле1;поле2;..." на заздалегідь ключованих станах MD5"""
+    inner, outer = _keyed_pads(_secret(secret_key))
+    inner = inner.copy()
+    inner.update(_SEPARATOR.join(map(str, fields)).encode("utf-8"))
+    outer = outer.copy()
+    outer.update(inner.digest())
+    return outer.hexdigest()
+
+
+def _purchase_fields(params: Mapping[str, Any]):
+    yield params["merchantAccount"]
+    yield params["merchantDomainName"]
+    yield params["orderReference"]
+    yield params["orderDate"]
+    yield params["amount"]
+    yield params["currency"]
+    yield from params["productName[]"]
+    yield from params["productCount[]"]
+    yield from params["productPrice[]"]
+
+
+def purchase_signature(params: Mapping[str, Any], secret_key: Optional[str] = None) -> str:
+    """merchantSignature для форми оплати (Purchase)"""
+    return sign_fields(_purchase_fields(params), secret_key)
+
+
+def callback_signature(data: Mapping[str, Any], secret_key: Optional[str] = None) -> str:
+    """Очікуваний merchantSignature callback-а"""
+    return sign_fields(map(data.get, CALLBACK_FIELDS, _MISSING), secret_key)
+
+
+def signatures_match(expected: str, received: Any) -> bool:
+    """Порівняння підписів за сталий час"""
+    if not isinstance(received, str):
+        return False
+    return hmac.compare_digest(expected.encode("ascii"), received.encode("utf-8"))
+
+
+def verify_callback_signature(data: Mapping[str, Any], secret_key: Optional[str] = None) -> bool:
+    return signatures_match(callback_signature(data, secret_key), data.get("merchantSignature"))
+
+
+def accept_response(order_reference: str, secret_key: Optional[str] = None, ts: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Тіло відповіді "accept" на callback. Підпис рахується так само,
+    як і раніше в views: orderReference;accept;секрет.
+    """
+    secret = _secret(secret_key)
+    status = "accept"
+    return {
+        "orderReference": order_reference,
+        "status": status,
+        "time": int(time.time()) if ts is None else ts,
+        "signature": sign_fields((order_reference, status, secret), secret),
+    }
+
+
+def clear_signing_cache() -> None:
+    _keyed_pads.cache_clear()
@@ -0,0 +1,99 @@
+import json
+import logging
+from datetime import timedelta
+from typing import Any, Dict, Optional
+
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from payments.models import WebhookInbox
+
+logger = logging.getLogger(__name__)
+
+# Запис у статусі processing довше за це вважаємо покинутим (процес упав)
+STALE_PROCESSING = timedelta(minutes=5)
+
+
+def webhook_key(source: str, data: Dict[str, Any]) -> Dict[str, str]:
+    return {
+        "source": source,
+        "order_reference": str(data.get("orderReference") or ""),
+        "transaction_status": str(data.get("transactionStatus") or ""),
+        "processing_date": str(data.get("processingDate") or ""),
+    }
+
+
+def claim_webhook(source: str, data: Dict[str, Any]) -> Optional[WebhookInbox]:
+    """
+    Реєструє callback у вхідній таблиці. Повертає запис, якщо цей запит має
+    його обробити, або None для повтору, який уже оброблено чи обробляється.
+    Повтор запису, обробка якого впала, забирається на повторну обробку.
+    """
+    key = webhook_key(source, data)
+    try:
+        with transaction.atomic():
+            return WebhookInbox.objects.create(payload=data, **key)
+    except IntegrityError:
+        pass
+
+    now = timezone.now()
+    reclaimable = Q(status="failed") | Q(status="processing", updated_at__lt=now - STALE_PROCESSING)
+    claimed = WebhookInbox.objects.filter(reclaimable, **key).update(
+        status="processing",
+        attempts=F("attempts") + 1,
+        updated_at=now,
+    )
+    if claimed:
+        return WebhookInbox.objects.get(**key)
+
+    WebhookInbox.objects.filter(**key).update(duplicates=F("duplicates") + 1)
+    return None
+
+
+def mark_webhook_processed(entry: Optional[WebhookInbox]) -> None:
+    if entry is None:
+        return
+    now = timezone.now()
+    WebhookInbox.objects.filter(pk=entry.pk).update(
+        status="processed",
+        last_error="",
+        processed_at=now,
+        updated_at=now,
+    )
+
+
+def mark_webhook_failed(entry: Optional[WebhookInbox], error: str) -> None:
+    if entry is None:
+        return
+    WebhookInbox.objects.filter(pk=entry.pk).update(
+        status="failed",
+        last_error=error[:5000],
+        updated_at=timezone.now(),
+    )
+
+
+def replay_webhook(entry: WebhookInbox):
+    """
+    Повторно проганяє збережений payload через той самий view, що й WayForPay
+    (перевірка підпису, оновлення замовлення). Повертає HttpResponse view.
+    """
+    from django.test import RequestFactory
+
+    from payments import views
+
+    handlers = {
+        "ticket": views.wayforpay_callback,
+        "subscription": views.wayforpay_subscription_callback,
+    }
+
+    # failed-запис view забере сам через claim_webhook
+    WebhookInbox.objects.filter(pk=entry.pk).update(status="failed", updated_at=timezone.now())
+    request = RequestFactory().post(
+        "/webhook-replay/",
+        data=json.dumps(entry.payload, ensure_ascii=False),
+        content_type="application/json",
+    )
+    response = handlers[entry.source](request)
+    logger.info(f"🔁 Повторна обробка callback #{entry.pk} ({entry}): HTTP {response.status_code}")
+    return response
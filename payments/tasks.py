@@ -0,0 +1,469 @@
+"""
+Обробники фонових завдань (outbox). Виконуються командою run_outbox_worker;
+звірку оплат з KeyCRM пачками виконує reconcile_keycrm_payments.
+"""
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives
+from django.db.models import F
+from django.utils import timezone
+from requests import HTTPError
+from requests.exceptions import ConnectTimeout
+
+from .keycrm_api import KeyCRMAPI
+from .models import EmailCampaign, EmailCampaignRecipient, OutboxJob, SubscriptionOrder, TicketOrder
+from .services.outbox import (
+    complete_job,
+    enqueue,
+    fail_job_attempt,
+    register_handler,
+    reschedule_job,
+    retry_delay,
+    touch_job,
+)
+from .services.keycrm_http import NON_IDEMPOTENT_RETRY_STATUSES, KeyCRMRateLimited, retry_after_seconds
+from .services.keycrm_transactions import (
+    find_matching_transaction,
+    mark_transaction_attached,
+    sync_external_transactions,
+)
+from .ticket_utils import send_ticket_email_with_pdf
+
+logger = logging.getLogger(__name__)
+
+# Моделі, для яких створюються ліди KeyCRM (payload["model"] завдання keycrm_lead)
+KEYCRM_LEAD_MODELS = {
+    "ticket": TicketOrder,
+    "subscription": SubscriptionOrder,
+}
+
+
+class KeyCRMLeadUncertain(RuntimeError):
+    """POST /pipelines/cards міг виконатись (5xx, обрив після відправки) — повтор створив би дубль"""
+
+
+def _lead_not_sent(error, status_code):
+    """Помилка, після якої KeyCRM точно не створив картку: запит не відправлено або 429/503"""
+    if status_code is not None:
+        return status_code in NON_IDEMPOTENT_RETRY_STATUSES
+    return isinstance(error, (KeyCRMRateLimited, ConnectTimeout))
+
+
+def enqueue_keycrm_lead(model, order, lead_data):
+    """
+    Ставить у чергу створення ліда KeyCRM для замовлення. Форма повертає
+    відповідь одразу, а keycrm_lead_id/keycrm_payment_id/keycrm_contact_id
+    заповнює create_keycrm_leads.
+    """
+    if not (settings.KEYCRM_API_TOKEN and lead_data.get("pipeline_id") and lead_data.get("source_id")):
+        return None
+    return enqueue("keycrm_lead", {"model": model, "order_id": order.id, "lead": lead_data})
+
+
+def keycrm_lead_pending(model, order_id):
+    """Чи лід замовлення ще в черзі (створення не завершене і не провалене)"""
+    return OutboxJob.objects.filter(
+        kind="keycrm_lead",
+        status__in=["pending", "running"],
+        payload__model=model,
+        payload__order_id=order_id,
+    ).exists()
+
+
+def enqueue_ticket_paid_jobs(order, callback_data):
+    """
+    Ставить у чергу доставку квитка та оновлення оплати в KeyCRM.
+    Викликається з callback всередині транзакції, що позначає замовлення оплаченим.
+    """
+    if order.email_status != "sent":
+        order.email_status = "queued"
+        order.save(update_fields=["email_status"])
+        enqueue("ticket_paid", {"order_id": order.id})
+    else:
+        logger.info("ℹ️ Email вже було відправлено для замовлення #%s", order.id)
+
+    # Лід міг ще не створитися — звірка дочекається payment_id
+    has_payment = order.keycrm_payment_id or keycrm_lead_pending("ticket", order.id)
+    if has_payment and settings.KEYCRM_API_TOKEN:
+        enqueue("ticket_keycrm_payment", {
+            "order_id": order.id,
+            "amount": callback_data.get("amount"),
+            "authCode": callback_data.get("authCode", ""),
+            "processingDate": callback_data.get("processingDate"),
+        })
+    else:
+        if not order.keycrm_payment_id:
+            logger.warning("⚠️ KeyCRM payment_id відсутній для замовлення #%s", order.id)
+        if not settings.KEYCRM_API_TOKEN:
+            logger.warning("⚠️ KEYCRM_API_TOKEN не налаштований")
+
+
+def _mark_ticket_email_failed(job):
+    TicketOrder.objects.filter(id=job.payload.get("order_id")).update(email_status="failed")
+
+
+@register_handler("ticket_paid", on_failed=_mark_ticket_email_failed)
+def deliver_ticket(job):
+    """PDF + email для оплаченого квитка (resend=True — надіслати повторно)"""
+    order = TicketOrder.objects.get(id=job.payload["order_id"])
+
+    if order.email_status == "sent" and not job.payload.get("resend"):
+        logger.info("ℹ️ Email вже було відправлено для замовлення #%s", order.id)
+        return
+
+    # PDF береться з кешу, якщо вже згенерований (масова видача, повторна відправка)
+    send_ticket_email_with_pdf(order)
+    order.email_status = "sent"
+    order.save(update_fields=["email_status"])
+    logger.info("📧 Email відправлено для замовлення #%s", order.id)
+
+
+def _mark_keycrm_payment_paid(keycrm, order, callback_auth_code):
+    """Запасний варіант: оновлення статусу платежу вручну"""
+    payment_description = f"Замовлення #{order.wayforpay_order_reference}. Клієнт: {order.name}, {order.phone}, {order.email}. AuthCode: {callback_auth_code}"
+
+    manual_update = keycrm.update_lead_payment_status(
+        lead_id=order.keycrm_lead_id,
+        payment_id=order.keycrm_payment_id,
+        status="paid",
+        description=payment_description
+    )
+    if not manual_update:
+        raise RuntimeError(f"Не вдалося оновити статус платежу {order.keycrm_payment_id} вручну")
+
+    logger.info("✅ Статус платежу %s оновлено вручну на 'paid'", order.keycrm_payment_id)
+
+
+def reconcile_ticket_payments(jobs, keycrm=None):
+    """
+    Звірка оплат квитків з KeyCRM для пачки завдань 'ticket_keycrm_payment'.
+
+    KeyCRM потрібен час, щоб отримати транзакцію від WayForPay, тому замість
+    очікування в callback завдання повторюється за розкладом. Перед пачкою
+    локальна копія зовнішніх транзакцій доганяє KeyCRM (зазвичай одна сторінка),
+    а пошук для кожного замовлення — індексний запит до неї. Якщо до дедлайну
+    (KEYCRM_RECONCILE_DEADLINE_SECONDS від оплати) транзакцію не знайдено —
+    оновлюємо статус платежу вручну.
+    """
+    if not jobs:
+        return {"attached": 0, "manual": 0, "deferred": 0, "failed": 0}
+
+    keycrm = keycrm or KeyCRMAPI()
+    deadline = timedelta(seconds=getattr(settings, "KEYCRM_RECONCILE_DEADLINE_SECONDS", 600))
+    interval = timedelta(seconds=getattr(settings, "KEYCRM_RECONCILE_INTERVAL_SECONDS", 60))
+    now = timezone.now()
+
+    orders = TicketOrder.objects.in_bulk([job.payload.get("order_id") for job in jobs])
+    sync_stats = sync_external_transactions(keycrm, max_pages=getattr(settings, "KEYCRM_TRANSACTIONS_SYNC_PAGES", 3))
+    logger.info("🔄 Звірка %s оплат з KeyCRM, синхронізовано %s транзакцій", len(jobs), sync_stats["stored"])
+
+    stats = {"attached": 0, "manual": 0, "deferred": 0, "failed": 0}
+
+    for job in jobs:
+        order = orders.get(job.payload.get("order_id"))
+        if order is None:
+            fail_job_attempt(job, TicketOrder.DoesNotExist(f"Order {job.payload.get('order_id')} not found"))
+            stats["failed"] += 1
+            continue
+
+        callback_amount = float(job.payload.get('amount') or 0)
+        callback_auth_code = job.payload.get('authCode') or ''
+
+        if not order.keycrm_payment_id:
+            if now < job.created_at + deadline and keycrm_lead_pending("ticket", order.id):
+                reschedule_job(job, interval, reason="Лід KeyCRM ще не створено")
+                stats["deferred"] += 1
+            else:
+                fail_job_attempt(job, RuntimeError(f"Немає KeyCRM payment_id для замовлення #{order.id}"))
+                stats["failed"] += 1
+            continue
+
+        try:
+            matching_transaction = find_matching_transaction(order, callback_amount, callback_auth_code)
+            if matching_transaction and keycrm.attach_external_transaction_by_id(
+                payment_id=order.keycrm_payment_id,
+                transaction_id=matching_transaction.keycrm_id
+            ):
+                mark_transaction_attached(matching_transaction, order.keycrm_payment_id)
+                logger.info(
+                    "🎉 Транзакцію %s прив'язано до платежу %s", matching_transaction.keycrm_id, order.keycrm_payment_id)
+                complete_job(job)
+                stats["attached"] += 1
+                continue
+
+            if now < job.created_at + deadline:
+                reschedule_job(job, interval, reason="Зовнішню транзакцію ще не знайдено")
+                stats["deferred"] += 1
+                continue
+
+            logger.warning("⚠️ Зовнішню транзакцію для замовлення #%s не знайдено до дедлайну", order.id)
+            _mark_keycrm_payment_paid(keycrm, order, callback_auth_code)
+            complete_job(job)
+            stats["manual"] += 1
+
+        except Exception as e:
+            fail_job_attempt(job, e)
+            stats["failed"] += 1
+
+    return stats
+
+
+def _lead_payload(job, order):
+    """Лід із черги; якщо замовлення вже оплачене — платіж одразу як 'paid'"""
+    lead = dict(job.payload.get("lead") or {})
+    if order.payment_status == "success" and lead.get("payments"):
+        lead["payments"] = [dict(payment, status="paid") for payment in lead["payments"]]
+    return lead
+
+
+def _save_lead_ids(model, order, lead):
+    """Записує ID з відповіді KeyCRM лише в ці поля — не перетирає паралельний callback"""
+    lead_response = lead.get("response") or {}
+    payments = lead_response.get("payments") or []
+    fields = {"keycrm_lead_id": lead["id"]}
+    if lead_response.get("contact_id"):
+        fields["keycrm_contact_id"] = lead_response["contact_id"]
+    if payments:
+        fields["keycrm_payment_id"] = payments[0].get("id")
+    else:
+        logger.warning("⚠️ Платежі не знайдено у відповіді KeyCRM для %s #%s", model, order.id)
+    KEYCRM_LEAD_MODELS[model].objects.filter(pk=order.pk).update(updated_at=timezone.now(), **fields)
+    return fields
+
+
+def _mark_paid_during_creation(keycrm, model, order, payload, fields):
+    """
+    Підписка, оплачена поки лід створювався, отримала платіж 'not_paid',
+    а callback не зміг його оновити (ще не було payment_id) — оновлюємо тут.
+    Для квитків це робить звірка reconcile_ticket_payments.
+    """
+    if model != "subscription" or not fields.get("keycrm_payment_id"):
+        return
+    if all(payment.get("status") == "paid" for payment in payload.get("payments") or []):
+        return
+    if not SubscriptionOrder.objects.filter(pk=order.pk, payment_status="success").exists():
+        return
+    keycrm.update_lead_payment_status(
+        lead_id=fields["keycrm_lead_id"],
+        payment_id=fields["keycrm_payment_id"],
+        status="paid",
+        description=f"Підписка #{order.id} оплачена під час створення ліда",
+    )
+
+
+def create_keycrm_leads(jobs, keycrm=None, concurrency=4):
+    """
+    Створення лідів KeyCRM для пачки завдань 'keycrm_lead'.
+
+    Запити до KeyCRM виконуються паралельно (не більше concurrency одночасно),
+    робота з БД — у поточному потоці. 429 відкладає завдання на Retry-After
+    (або експоненційну затримку) без зарахування спроби; 503 і помилки, після
+    яких запит точно не дійшов (ліміт, connect timeout), повторюються з backoff;
+    інші 4xx — остаточна помилка. Після решти 5xx, read timeout чи обриву
+    KeyCRM міг уже створити картку, тож завдання не повторюється, а чекає
+    ручної перевірки (stats["review"]).
+    """
+    stats = {"created": 0, "skipped": 0, "throttled": 0, "retried": 0, "failed": 0, "review": 0}
+    if not jobs:
+        return stats
+
+    keycrm = keycrm or KeyCRMAPI()
+
+    orders = {}
+    for model, model_class in KEYCRM_LEAD_MODELS.items():
+        ids = [job.payload.get("order_id") for job in jobs if job.payload.get("model") == model]
+        if ids:
+            for pk, order in model_class.objects.in_bulk(ids).items():
+                orders[(model, pk)] = order
+
+    todo = []
+    for job in jobs:
+        model = job.payload.get("model")
+        order = orders.get((model, job.payload.get("order_id")))
+        if order is None:
+            job.attempts = job.max_attempts
+            fail_job_attempt(job, LookupError(f"{model} #{job.payload.get('order_id')} not found"))
+            stats["failed"] += 1
+        elif order.keycrm_lead_id:
+            # лід уже створено (повтор після збою воркера)
+            complete_job(job)
+            stats["skipped"] += 1
+        else:
+            todo.append((job, model, order, _lead_payload(job, order)))
+
+    def create(item):
+        try:
+            return keycrm.create_pipeline_card(item[3], raise_errors=True), None
+        except Exception as e:
+            return None, e
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        results = list(pool.map(create, todo))
+
+    for (job, model, order, payload), (lead, error) in zip(todo, results):
+        response = getattr(error, "response", None)
+        status_code = getattr(response, "status_code", None)
+
+        if error is None and lead and lead.get("id"):
+            fields = _save_lead_ids(model, order, lead)
+            _mark_paid_during_creation(keycrm, model, order, payload, fields)
+            complete_job(job)
+            stats["created"] += 1
+            logger.info("✅ Лід %s створено для %s #%s", fields["keycrm_lead_id"], model, order.id)
+        elif status_code == 429:
+            delay = max(timedelta(seconds=retry_after_seconds(response) or 0), retry_delay(job.attempts))
+            reschedule_job(job, delay, reason="KeyCRM 429 Too Many Requests")
+            stats["throttled"] += 1
+        elif isinstance(error, HTTPError) and status_code is not None and status_code < 500:
+            # помилка даних — повтор не допоможе
+            job.attempts = job.max_attempts
+            fail_job_attempt(job, error)
+            stats["failed"] += 1
+        elif error is not None and _lead_not_sent(error, status_code):
+            fail_job_attempt(job, error)
+            stats["retried" if job.status == "pending" else "failed"] += 1
+        else:
+            uncertain = KeyCRMLeadUncertain(
+                f"KeyCRM міг уже створити лід для {model} #{order.id} "
+                f"({error or f'відповідь без id: {lead}'}) — перевірте картку в KeyCRM, "
+                f"перш ніж повторювати завдання"
+            )
+            uncertain.__cause__ = error
+            job.attempts = job.max_attempts
+            fail_job_attempt(job, uncertain)
+            stats["review"] += 1
+            logger.error("🔎 Лід для %s #%s потребує ручної перевірки: %s", model, order.id, error or lead)
+
+    return stats
+
+
+def _load_campaign_recipients(campaign):
+    """Стрімить email активних підписників курсором і зберігає як отримувачів"""
+    batch_size = 1000
+    emails = (
+        SubscriptionOrder.objects.filter(payment_status="success")
+        .exclude(email__isnull=True)
+        .exclude(email="")
+        .values_list("email", flat=True)
+        .distinct()
+        .iterator(chunk_size=batch_size)
+    )
+
+    batch = []
+    for email in emails:
+        batch.append(EmailCampaignRecipient(campaign=campaign, email=email))
+        if len(batch) >= batch_size:
+            EmailCampaignRecipient.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    if batch:
+        EmailCampaignRecipient.objects.bulk_create(batch, ignore_conflicts=True)
+
+    campaign.total = campaign.recipients.count()
+    campaign.recipients_loaded = True
+    campaign.save(update_fields=["total", "recipients_loaded"])
+    logger.info("📬 Розсилка #%s: завантажено %s отримувачів", campaign.id, campaign.total)
+
+
+def _mark_campaign_failed(job):
+    EmailCampaign.objects.filter(id=job.payload.get("campaign_id")).update(
+        status="failed", finished_at=timezone.now()
+    )
+
+
+def _send_campaign_chunk(campaign, emails):
+    """Один лист розсилки: отримувачі пачки в BCC"""
+    email = EmailMultiAlternatives(
+        subject=campaign.subject,
+        body=campaign.text_body,
+        from_email=settings.DEFAULT_FROM_EMAIL,
+        to=[settings.DEFAULT_FROM_EMAIL],
+        bcc=emails,
+    )
+    if campaign.html_body:
+        email.attach_alternative(campaign.html_body, "text/html")
+    email.send(fail_silently=False)
+
+
+@register_handler("email_campaign", on_failed=_mark_campaign_failed)
+def run_email_campaign(job):
+    """
+    Надсилає розсилку BCC-пачками по EMAIL_CAMPAIGN_BATCH_SIZE отримувачів,
+    не частіше за EMAIL_CAMPAIGN_BATCHES_PER_SECOND пачок на секунду.
+    Пачку з помилкою SMTP повторюємо EMAIL_CAMPAIGN_BATCH_ATTEMPTS разів,
+    лише потім її отримувачі стають failed.
+    Стан кожного отримувача зберігається, тож після падіння воркера
+    розсилка продовжується з тих, кому ще не надіслано.
+    """
+    campaign = EmailCampaign.objects.get(id=job.payload["campaign_id"])
+    if campaign.status == "done":
+        return
+
+    if campaign.status != "running":
+        campaign.status = "running"
+        campaign.started_at = campaign.started_at or timezone.now()
+        campaign.save(update_fields=["status", "started_at"])
+
+    if not campaign.recipients_loaded:
+        _load_campaign_recipients(campaign)
+
+    chunk_size = getattr(settings, "EMAIL_CAMPAIGN_BATCH_SIZE", 100)
+    rate = float(getattr(settings, "EMAIL_CAMPAIGN_BATCHES_PER_SECOND", 1))
+    min_interval = 1.0 / rate if rate > 0 else 0.0
+    attempts = max(1, int(getattr(settings, "EMAIL_CAMPAIGN_BATCH_ATTEMPTS", 3)))
+    retry_delay_seconds = float(getattr(settings, "EMAIL_CAMPAIGN_RETRY_DELAY_SECONDS", 5))
+    last_sent_at = 0.0
+
+    while True:
+        chunk = list(
+            campaign.recipients.filter(status="pending")
+            .order_by("id")
+            .values_list("id", "email")[:chunk_size]
+        )
+        if not chunk:
+            break
+
+        ids = [recipient_id for recipient_id, _ in chunk]
+        emails = [email for _, email in chunk]
+        error = None
+        for attempt in range(1, attempts + 1):
+            if error is not None:
+                # одна помилка SMTP не повинна позначати всю пачку як failed
+                time.sleep(retry_delay_seconds * 2 ** (attempt - 2))
+                touch_job(job)
+
+            wait = min_interval - (time.monotonic() - last_sent_at)
+            if wait > 0:
+                time.sleep(wait)
+            try:
+                _send_campaign_chunk(campaign, emails)
+            except Exception as exc:
+                error = exc
+                logger.warning(
+                    "⚠️ Розсилка #%s: пачка з %s листів не надіслана (спроба %s/%s): %s",
+                    campaign.id, len(ids), attempt, attempts, exc,
+                )
+            else:
+                error = None
+                break
+            finally:
+                last_sent_at = time.monotonic()
+
+        if error is not None:
+            EmailCampaignRecipient.objects.filter(id__in=ids).update(status="failed", error=str(error))
+            EmailCampaign.objects.filter(id=campaign.id).update(failed=F("failed") + len(ids))
+            logger.error("❌ Розсилка #%s: пачка з %s листів не надіслана: %s", campaign.id, len(ids), error)
+        else:
+            EmailCampaignRecipient.objects.filter(id__in=ids).update(status="sent", sent_at=timezone.now())
+            EmailCampaign.objects.filter(id=campaign.id).update(sent=F("sent") + len(ids))
+
+        touch_job(job)
+
+    campaign.refresh_from_db(fields=["sent", "failed"])
+    campaign.status = "done"
+    campaign.finished_at = timezone.now()
+    campaign.save(update_fields=["status", "finished_at"])
+    logger.info("✅ Розсилка #%s завершена: sent=%s failed=%s", campaign.id, campaign.sent, campaign.failed)
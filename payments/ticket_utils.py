@@ -1,8 +1,11 @@
+import hashlib
 import io
+import json
+import threading
 import uuid
+from dataclasses import dataclass
 import qrcode
 from django.core.mail import EmailMultiAlternatives
-from django.template.loader import render_to_string
 from reportlab.lib.pagesizes import A4
 from reportlab.lib.utils import ImageReader
 import logging
@@ -14,6 +17,8 @@ from django.conf import settings
 import os
 from PIL import Image
 from .models import BotAccessToken
+from .services.email_templates import TICKET_HTML
+from .services.file_cache import ContentAddressedFileCache
 
 logger = logging.getLogger(__name__)
 
@@ -28,9 +33,20 @@ pdfmetrics.registerFont(TTFont('DejaVuSans-Bold', bold_font_path))
 FONT_NORMAL = 'DejaVuSans'
 FONT_BOLD = 'DejaVuSans-Bold'
 
+# Шаблон квитка
+TICKET_TEMPLATE_PATH = os.path.join(settings.BASE_DIR, "static", "images", "grand_opening_party_ticket.png")
+
+
+def generate_ticket_qr(order, mode=None):
+    """
+    Генерує QR-код для сторінки перевірки квитка.
+    mode='raster' — PIL-зображення, mode='vector' — матриця модулів
+    (list[list[bool]], включно з рамкою) для малювання вектором у PDF.
+    """
+    mode = mode or getattr(settings, 'TICKET_QR_MODE', 'raster')
+    if mode not in ('raster', 'vector'):
+        raise ValueError(f"Unknown ticket QR mode: {mode}")
 
-def generate_ticket_qr(order):
-    """Генерує QR-код для сторінки перевірки квитка"""
     # Генеруємо URL на сторінку verify_ticket з унікальним order_reference
     verification_path = reverse('verify_ticket', args=[order.id])
     verification_url = f"{settings.SITE_URL}{verification_path}"
@@ -43,97 +59,312 @@ def generate_ticket_qr(order):
     )
     qr.add_data(verification_url)  # тут саме URL
     qr.make(fit=True)
-    img = qr.make_image(fill_color="black", back_color="white")
-    return img
 
+    if mode == 'vector':
+        return qr.get_matrix()
 
-def generate_ticket_pdf(order, qr_img):
-    """Генерує PDF з QR-кодом на готовому шаблоні"""
+    img = qr.make_image(fill_color="black", back_color="white")
+    return img
 
-    # Шлях до шаблону
-    template_path = 'static/images/grand_opening_party_ticket.png'
 
-    if not os.path.exists(template_path):
+def draw_qr(c, qr_img, x, y, size):
+    """
+    Малює QR у квадрат (x, y, size) на canvas.
+    Матрицю модулів малює прямокутниками (суміжні темні модулі рядка
+    об'єднуються в один), PIL-зображення — як растр.
+    """
+    if not isinstance(qr_img, list):
+        c.drawImage(ImageReader(qr_img.convert('L')), x, y, width=size, height=size)
+        return
+
+    modules = len(qr_img)
+    module_size = size / modules
+
+    c.saveState()
+    c.setFillColorRGB(1, 1, 1)
+    c.rect(x, y, size, size, stroke=0, fill=1)
+    c.setFillColorRGB(0, 0, 0)
+
+    path = c.beginPath()
+    for row_index, row in enumerate(qr_img):
+        # PDF рахує Y знизу
+        row_y = y + size - (row_index + 1) * module_size
+        col = 0
+        while col < modules:
+            if not row[col]:
+                col += 1
+                continue
+            run_start = col
+            while col < modules and row[col]:
+                col += 1
+            path.rect(x + run_start * module_size, row_y, (col - run_start) * module_size, module_size)
+    c.drawPath(path, stroke=0, fill=1)
+    c.restoreState()
+
+
+@dataclass(frozen=True)
+class TicketTemplate:
+    """Декодований і сплющений на білий фон шаблон квитка (кешується на процес)"""
+    path: str
+    mtime: float
+    size: int
+    width: int
+    height: int
+    image: Image.Image
+    reader: ImageReader
+
+
+_template_cache = {}
+_page_template_cache = {}
+_template_cache_lock = threading.Lock()
+
+
+def _flatten_template(path):
+    """Відкриває шаблон і накладає прозорість на білий фон (RGB)"""
+    with Image.open(path) as template_img:
+        template_img.load()
+        if template_img.mode in ('RGBA', 'LA') or (template_img.mode == 'P' and 'transparency' in template_img.info):
+            if template_img.mode != 'RGBA':
+                template_img = template_img.convert('RGBA')
+            white_bg = Image.new('RGB', template_img.size, 'white')
+            white_bg.paste(template_img, (0, 0), template_img)
+            return white_bg
+        return template_img.convert('RGB')
+
+
+def get_ticket_template(template_path=TICKET_TEMPLATE_PATH):
+    """
+    Повертає закешований шаблон квитка.
+    Кеш інвалідовується, якщо змінився mtime або розмір файлу.
+    """
+    try:
+        stat = os.stat(template_path)
+    except FileNotFoundError:
         logger.error(f"Template not found: {template_path}")
         raise FileNotFoundError(f"Ticket template not found at {template_path}")
 
-    # Відкриваємо шаблон
-    template_img = Image.open(template_path)
-    template_width, template_height = template_img.size
-
-    # Створюємо білий фон якщо шаблон має прозорість
-    if template_img.mode in ('RGBA', 'LA') or (template_img.mode == 'P' and 'transparency' in template_img.info):
-        white_bg = Image.new('RGB', (template_width, template_height), 'white')
-        if template_img.mode != 'RGBA':
-            template_img = template_img.convert('RGBA')
-        white_bg.paste(template_img, (0, 0), template_img)
-        template_img = white_bg
-    else:
-        template_img = template_img.convert('RGB')
+    cached = _template_cache.get(template_path)
+    if cached and cached.mtime == stat.st_mtime and cached.size == stat.st_size:
+        return cached
+
+    with _template_cache_lock:
+        cached = _template_cache.get(template_path)
+        if cached and cached.mtime == stat.st_mtime and cached.size == stat.st_size:
+            return cached
+
+        image = _flatten_template(template_path)
+        template = TicketTemplate(
+            path=template_path,
+            mtime=stat.st_mtime,
+            size=stat.st_size,
+            width=image.width,
+            height=image.height,
+            image=image,
+            reader=ImageReader(image),
+        )
+        _template_cache[template_path] = template
+        logger.info(f"🖼️ Шаблон квитка завантажено в кеш: {template_path} ({image.width}x{image.height})")
+        return template
+
 
-    # Конвертуємо QR в PIL Image
-    qr_pil = qr_img.convert('RGBA')
+def clear_ticket_template_cache():
+    """Скидає кеш шаблонів (для бенчмарків і після заміни файлу)"""
+    with _template_cache_lock:
+        _template_cache.clear()
+        _page_template_cache.clear()
 
-    # Розмір QR-коду
-    qr_size = int(template_height * 0.15)
-    qr_pil = qr_pil.resize((qr_size, qr_size), Image.Resampling.LANCZOS)
 
-    # Позиція QR-коду (центр QR)
-    qr_center_x = int(template_width * 0.82)
-    qr_center_y = int(template_height * 0.20)
+def _fit_template_on_page(template, page_width, page_height, margin=50):
+    """Розміщення шаблону по центру A4 з відступами зі збереженням пропорцій"""
+    pdf_width = page_width - 2 * margin
+    pdf_height = page_height - 2 * margin
+    aspect_ratio = template.width / template.height
+
+    if pdf_width / aspect_ratio <= pdf_height:
+        # Підганяємо по ширині
+        final_width = pdf_width
+        final_height = pdf_width / aspect_ratio
+    else:
+        # Підганяємо по висоті
+        final_height = pdf_height
+        final_width = pdf_height * aspect_ratio
 
-    # Розраховуємо верхній лівий кут
-    qr_x = qr_center_x - (qr_size // 2)
-    qr_y = qr_center_y - (qr_size // 2)
+    x = (page_width - final_width) / 2
+    y = (page_height - final_height) / 2
+    return x, y, final_width, final_height
+
+
+def _qr_box_on_page(template, x, y, final_width, final_height):
+    """
+    Координати QR-коду в PDF. Позиція та розмір задані відносно шаблону:
+    центр QR (82% ширини, 20% висоти від верху), розмір 15% висоти.
+    """
+    scale = final_width / template.width
+    qr_size = int(template.height * 0.15)
+    qr_x = int(template.width * 0.82) - (qr_size // 2)
+    qr_y = int(template.height * 0.20) - (qr_size // 2)
+
+    # PDF рахує Y знизу, зображення — зверху
+    pdf_x = x + qr_x * scale
+    pdf_y = y + final_height - (qr_y + qr_size) * scale
+    return pdf_x, pdf_y, qr_size * scale
+
+
+@dataclass(frozen=True)
+class TicketPageTemplate:
+    """
+    Підготовлений для події шаблон сторінки: постер, стиснутий у JPEG
+    під розмір A4 (ReportLab вбудовує його без перекодування).
+    """
+    key: str
+    jpeg_path: str
+    x: float
+    y: float
+    width: float
+    height: float
+    template: TicketTemplate
+
+
+def _event_template_path(event):
+    """Шаблон події, якщо завантажено, інакше — стандартний"""
+    if event is not None and getattr(event, 'ticket_template', None):
+        return event.ticket_template.path
+    return TICKET_TEMPLATE_PATH
+
+
+def get_ticket_page_template(event=None):
+    """Повертає (і кешує на процес) шаблон сторінки для події"""
+    template = get_ticket_template(_event_template_path(event))
+    dpi = int(getattr(settings, 'TICKET_PDF_DPI', 150))
+    quality = int(getattr(settings, 'TICKET_PDF_JPEG_QUALITY', 85))
+
+    key_source = f"{template.path}:{template.mtime}:{template.size}:{dpi}:{quality}"
+    key = hashlib.sha1(key_source.encode('utf-8')).hexdigest()[:16]
+    cache_key = getattr(event, 'pk', None)
+
+    cached = _page_template_cache.get(cache_key)
+    if cached and cached.key == key and os.path.exists(cached.jpeg_path):
+        return cached
+
+    with _template_cache_lock:
+        cached = _page_template_cache.get(cache_key)
+        if cached and cached.key == key and os.path.exists(cached.jpeg_path):
+            return cached
+
+        page_width, page_height = A4
+        x, y, final_width, final_height = _fit_template_on_page(template, page_width, page_height)
+
+        # Зменшуємо постер до потрібної роздільної здатності друку
+        image = template.image
+        target_width = int(final_width / 72 * dpi)
+        if image.width > target_width:
+            target_height = int(image.height * target_width / image.width)
+            image = image.resize((target_width, target_height), Image.Resampling.LANCZOS)
+
+        cache_dir = os.path.join(settings.TICKET_CACHE_DIR, 'templates')
+        os.makedirs(cache_dir, exist_ok=True)
+        jpeg_path = os.path.join(cache_dir, f"ticket_template_{key}.jpg")
+        if not os.path.exists(jpeg_path):
+            tmp_path = f"{jpeg_path}.{os.getpid()}.tmp"
+            image.save(tmp_path, format='JPEG', quality=quality, optimize=True)
+            os.replace(tmp_path, jpeg_path)
+
+        page_template = TicketPageTemplate(
+            key=key,
+            jpeg_path=jpeg_path,
+            x=x,
+            y=y,
+            width=final_width,
+            height=final_height,
+            template=template,
+        )
+        _page_template_cache[cache_key] = page_template
+        logger.info(f"🖼️ Підготовлено шаблон сторінки квитка для події {cache_key}: {jpeg_path}")
+        return page_template
+
+
+def _ticket_caption(order):
+    """Текст квитка, що друкується під постером"""
+    event = order.event
+    parts = [event.title if event else order.event_name]
+    if event and event.date:
+        parts.append(event.date.strftime('%d.%m.%Y'))
+    if event and event.time:
+        parts.append(event.time)
+    if event and event.location:
+        parts.append(event.location)
+    return " · ".join(parts)
+
+
+def draw_ticket_page(c, order, qr_img, page_template):
+    """
+    Малює одну сторінку квитка на canvas. Постер реєструється як form XObject
+    один раз на документ, тож кілька квитків в одному PDF його не дублюють.
+    """
+    form_name = f"ticket_template_{page_template.key}"
+    if not c.hasForm(form_name):
+        c.beginForm(form_name)
+        c.drawImage(
+            page_template.jpeg_path,
+            page_template.x,
+            page_template.y,
+            width=page_template.width,
+            height=page_template.height,
+        )
+        c.endForm()
+    c.doForm(form_name)
+
+    qr_x, qr_y, qr_size = _qr_box_on_page(
+        page_template.template,
+        page_template.x,
+        page_template.y,
+        page_template.width,
+        page_template.height,
+    )
+    draw_qr(c, qr_img, qr_x, qr_y, qr_size)
 
-    # Накладаємо QR на шаблон
-    # Перевіряємо чи template має alpha канал
-    if template_img.mode != 'RGBA':
-        template_img = template_img.convert('RGBA')
+    # Текст квитка — вектором під постером
+    text_y = page_template.y - 18
+    c.setFont(FONT_BOLD, 11)
+    ticket_label = f"Квиток №{order.ticket_number}" if order.ticket_number else "Квиток"
+    c.drawString(page_template.x, text_y, f"{ticket_label} · Замовлення #{order.id}")
+    c.setFont(FONT_NORMAL, 9)
+    c.drawString(page_template.x, text_y - 14, _ticket_caption(order))
+    if order.name:
+        c.drawRightString(page_template.x + page_template.width, text_y, order.name)
 
-    template_img.paste(qr_pil, (qr_x, qr_y), qr_pil)
 
-    # Конвертуємо в RGB для PDF (без прозорості)
-    if template_img.mode == 'RGBA':
-        white_bg = Image.new('RGB', template_img.size, 'white')
-        white_bg.paste(template_img, (0, 0), template_img)
-        template_img = white_bg
-    else:
-        template_img = template_img.convert('RGB')
+def _generate_ticket_pdf_compact(order, qr_img):
+    """Компактний PDF: JPEG-постер події як XObject + QR і текст поверх"""
+    page_template = get_ticket_page_template(order.event)
 
-    # Створюємо PDF
     pdf_buffer = io.BytesIO()
     c = canvas.Canvas(pdf_buffer, pagesize=A4)
-    width, height = A4
+    draw_ticket_page(c, order, qr_img, page_template)
+    c.showPage()
+    c.save()
+    pdf_buffer.seek(0)
 
-    # Зберігаємо комбіноване зображення в буфер
-    img_buffer = io.BytesIO()
-    template_img.save(img_buffer, format='PNG')
-    img_buffer.seek(0)
-    img_reader = ImageReader(img_buffer)
+    return pdf_buffer
 
-    # Вставляємо зображення по центру A4 з відступами
-    margin = 50
-    pdf_width = width - 2 * margin
-    pdf_height = height - 2 * margin
 
-    # Зберігаємо пропорції
-    aspect_ratio = template_width / template_height
+def _generate_ticket_pdf_raster(order, qr_img):
+    """PDF з повнорозмірним постером (PNG без втрат) і QR поверх"""
+    template = get_ticket_template(_event_template_path(order.event))
 
-    if pdf_width / aspect_ratio <= pdf_height:
-        # Підганяємо по ширині
-        final_width = pdf_width
-        final_height = pdf_width / aspect_ratio
-    else:
-        # Підганяємо по висоті
-        final_height = pdf_height
-        final_width = pdf_height * aspect_ratio
+    # Створюємо PDF
+    pdf_buffer = io.BytesIO()
+    c = canvas.Canvas(pdf_buffer, pagesize=A4)
+    width, height = A4
+
+    x, y, final_width, final_height = _fit_template_on_page(template, width, height)
 
-    x = (width - final_width) / 2
-    y = (height - final_height) / 2
+    # Шаблон вже сплющений на білий фон — малюємо закешований ImageReader
+    c.drawImage(template.reader, x, y, width=final_width, height=final_height)
 
-    # Вставляємо зображення в PDF
-    c.drawImage(img_reader, x, y, width=final_width, height=final_height)
+    # QR малюємо окремим шаром поверх шаблону
+    qr_x, qr_y, qr_size = _qr_box_on_page(template, x, y, final_width, final_height)
+    draw_qr(c, qr_img, qr_x, qr_y, qr_size)
 
     c.showPage()
     c.save()
@@ -142,28 +373,104 @@ def generate_ticket_pdf(order, qr_img):
     return pdf_buffer
 
 
-def send_ticket_email_with_pdf(order, funnel_tag="night-29-11"):
-    """Відправка email з PDF і QR + посилання на Telegram-бота"""
-    # === 1. Генеруємо QR для перевірки ===
-    qr_img = generate_ticket_qr(order)
+TICKET_PDF_RENDERERS = {
+    'compact': _generate_ticket_pdf_compact,
+    'raster': _generate_ticket_pdf_raster,
+}
 
-    # === 2. Генеруємо PDF з QR ===
-    pdf_buffer = generate_ticket_pdf(order, qr_img)
 
-    # === 3. Формуємо посилання на бот ===
-    if order.keycrm_lead_id:
-        # --- Генеруємо або отримуємо токен ---
-        token_obj, _ = BotAccessToken.objects.get_or_create(
-            order=order,
-            funnel_tag=funnel_tag,
-            defaults={"token": uuid.uuid4().hex[:12]}
+def generate_ticket_pdf(order, qr_img, mode=None):
+    """
+    Генерує PDF з QR-кодом на готовому шаблоні.
+    mode: 'compact' або 'raster' (за замовчуванням settings.TICKET_PDF_MODE)
+    """
+    mode = mode or getattr(settings, 'TICKET_PDF_MODE', 'raster')
+    try:
+        renderer = TICKET_PDF_RENDERERS[mode]
+    except KeyError:
+        raise ValueError(f"Unknown ticket PDF mode: {mode}")
+    return renderer(order, qr_img)
+
+
+def render_ticket_pdf_bytes(order):
+    """QR + PDF квитка одним викликом (без кешу)"""
+    return generate_ticket_pdf(order, generate_ticket_qr(order)).getvalue()
+
+
+_ticket_pdf_cache = None
+
+
+def get_ticket_pdf_cache():
+    global _ticket_pdf_cache
+    if _ticket_pdf_cache is None:
+        _ticket_pdf_cache = ContentAddressedFileCache(
+            directory=os.path.join(settings.TICKET_CACHE_DIR, 'pdf'),
+            max_bytes=getattr(settings, 'TICKET_PDF_CACHE_MAX_BYTES', 200 * 1024 * 1024),
+            suffix='.pdf',
         )
-        bot_url = f"https://t.me/Pasue_club_bot?start={token_obj.token}"
-    else:
-        bot_url = "https://t.me/Pasue_club_bot"
+    return _ticket_pdf_cache
+
+
+def ticket_pdf_cache_key(order):
+    """
+    Ключ кешу PDF: хеш усього, від чого залежить результат —
+    замовлення, SITE_URL (у QR), файл шаблону, режими рендерингу і текст квитка.
+    """
+    event = order.event
+    template_path = _event_template_path(event)
+    try:
+        stat = os.stat(template_path)
+        template_version = f"{stat.st_mtime}:{stat.st_size}"
+    except FileNotFoundError:
+        template_version = ""
+
+    source = json.dumps([
+        order.id,
+        settings.SITE_URL,
+        template_path,
+        template_version,
+        getattr(settings, 'TICKET_PDF_MODE', 'raster'),
+        getattr(settings, 'TICKET_QR_MODE', 'raster'),
+        getattr(settings, 'TICKET_PDF_DPI', 150),
+        getattr(settings, 'TICKET_PDF_JPEG_QUALITY', 85),
+        order.ticket_number,
+        order.name,
+        order.event_name,
+        _ticket_caption(order),
+    ], ensure_ascii=False, default=str)
+    return hashlib.sha256(source.encode('utf-8')).hexdigest()
+
+
+def get_ticket_pdf_bytes(order):
+    """PDF квитка з кешу; рендерить і зберігає, якщо його ще немає"""
+    return get_ticket_pdf_cache().get_or_set(
+        ticket_pdf_cache_key(order),
+        lambda: render_ticket_pdf_bytes(order),
+    )
+
+
+def send_ticket_email_with_pdf(order, funnel_tag="night-29-11", pdf_bytes=None):
+    """
+    Відправка email з PDF і QR + посилання на Telegram-бота.
+    pdf_bytes — вже згенерований PDF; інакше береться з кешу.
+    """
+    # === 1-2. QR і PDF (з кешу, якщо квиток вже рендерився) ===
+    if pdf_bytes is None:
+        pdf_bytes = get_ticket_pdf_bytes(order)
+
+    # === 3. Формуємо посилання на бот ===
+    # Токен привʼязаний до замовлення, а не до ліда: лід KeyCRM створює воркер
+    # create_keycrm_leads, і бот отримує lead_id через get_order_by_token вже
+    # після переходу за посиланням.
+    token_obj, _ = BotAccessToken.objects.get_or_create(
+        order=order,
+        funnel_tag=funnel_tag,
+        defaults={"token": uuid.uuid4().hex[:12]}
+    )
+    bot_url = f"https://t.me/Pasue_club_bot?start={token_obj.token}"
 
     # === 4. Формуємо HTML контент листа ===
-    html_content = render_to_string('emails/ticket.html', {
+    html_content = TICKET_HTML.render({
         'order': order,
         'bot_url': bot_url
     })
@@ -180,7 +487,7 @@ def send_ticket_email_with_pdf(order, funnel_tag="night-29-11"):
     )
 
     email.attach_alternative(html_content, "text/html")
-    email.attach(f'ticket_{order.id}.pdf', pdf_buffer.read(), 'application/pdf')
+    email.attach(f'ticket_{order.id}.pdf', pdf_bytes, 'application/pdf')
     email.send(fail_silently=False)
 
     logger.info(f"📩 Email з PDF, QR і посиланням на бота відправлено для замовлення #{order.id}")
\ No newline at end of file
@@ -32,6 +32,9 @@ urlpatterns = [
     path("api/internal/subscription-orders/<path:order_reference>/",
          views.subscription_order_by_reference, name="subscription_order_by_reference"),
     path("api/internal/active-users-email/", views.send_email_to_active_users, name="send_email_to_active_users"),
+    path("api/internal/email-campaigns/<int:campaign_id>/", views.email_campaign_status, name="email_campaign_status"),
+    path("api/internal/mail-stats/", views.mail_stats_api, name="mail_stats"),
+    path("api/internal/keycrm-stats/", views.keycrm_stats_api, name="keycrm_stats"),
     path("strava/callback/", views.strava_callback, name="strava_callback"),
     path("strava/exchange/", views.strava_exchange, name="strava_exchange"),
     path("strava/refresh/", views.strava_refresh, name="strava_refresh"),
@@ -8,18 +8,28 @@ from django.template.loader import render_to_string
 from django.views.decorators.http import require_http_methods, require_POST
 from django.conf import settings
 from django.views.decorators.csrf import csrf_exempt
-import hmac
 import time
-import hashlib
 import json
 from urllib.parse import urlencode
 from .keycrm_api import KeyCRMAPI
 from .forms import TicketOrderForm, SubscriptionOrderForm
 import logging
 from django.shortcuts import render
-from .models import TicketOrder, SubscriptionOrder, Event, Subscription
+from .models import TicketOrder, SubscriptionOrder, Event, Subscription, EmailCampaign, normalize_email, phone_key
 from .ticket_utils import send_ticket_email_with_pdf
+from .tasks import enqueue_keycrm_lead, enqueue_ticket_paid_jobs, keycrm_lead_pending
+from .services.mailer import mail_stats
+from .services.keycrm_http import keycrm_http_stats
+from .services.outbox import enqueue
+from .services.inventory import add_seats, on_payment_status_change, release_hold, reserve_seat
+from .services.ticket_numbers import allocate_ticket_numbers, assign_ticket_number
+from .services.webhook_inbox import claim_webhook, mark_webhook_failed, mark_webhook_processed
+from .services.wayforpay_signing import accept_response, callback_signature, purchase_signature, signatures_match
+from .services.payment_logging import log_callback, log_payload, should_sample
+from .services.subscription_sync import mark_sync_due
+from .services.email_templates import SUBSCRIPTION_CONFIRMATION_HTML, SUBSCRIPTION_CONFIRMATION_TXT
 from django.db import transaction
+from django.db.models import Q
 from django.utils import timezone
 from datetime import timedelta
 from .models import BotAccessToken, SubscriptionBotAccessToken
@@ -65,15 +75,19 @@ def subscription(request):
     return render(request, template_name)
 
 
+def wayforpay_accept_response(order_reference):
+    """Підписана відповідь "accept" на callback WayForPay"""
+    return JsonResponse(accept_response(order_reference))
+
+
 def generate_wayforpay_params(order, product_name=None):
     merchant_account = settings.WAYFORPAY_MERCHANT_ACCOUNT
     merchant_domain = settings.WAYFORPAY_DOMAIN.rstrip('/')
-    secret_key = settings.WAYFORPAY_SECRET_KEY
 
     # Унікальний orderReference
     order_reference = f"ORDER_{order.id}_{int(time.time())}"
     order.wayforpay_order_reference = order_reference
-    order.save()
+    order.save(update_fields=["wayforpay_order_reference", "updated_at"])
 
     # --- Дані для платежу ---
     amount = float(order.amount)
@@ -96,25 +110,7 @@ def generate_wayforpay_params(order, product_name=None):
     }
 
     # --- Формуємо підпис ---
-    signature_string = ";".join([
-        params["merchantAccount"],
-        params["merchantDomainName"],
-        params["orderReference"],
-        params["orderDate"],
-        params["amount"],
-        params["currency"],
-        *params["productName[]"],
-        *params["productCount[]"],
-        *params["productPrice[]"],
-    ])
-
-    merchant_signature = hmac.new(
-        secret_key.encode('utf-8'),
-        signature_string.encode('utf-8'),
-        hashlib.md5
-    ).hexdigest()
-
-    params["merchantSignature"] = merchant_signature
+    params["merchantSignature"] = purchase_signature(params)
 
     return params
 
@@ -170,73 +166,46 @@ def submit_ticket_form(request):
             device_type = "mobile" if "mobi" in ua_string else "desktop"
 
             # === Перевірка ліміту квитків ===
-            with transaction.atomic():
-                # Отримуємо активну подію з блокуванням запису
-                event = Event.objects.select_for_update().filter(is_active=True).first()
-                if not event:
-                    return JsonResponse({"success": False, "error": "Подію не знайдено."}, status=400)
-
-                # --- Перевірка промокоду ---
-                promo_code_value = form.cleaned_data.get("promo_code", "").strip().upper()
-
-                if promo_code_value == settings.PROMO_CODE:
-                    discount_percent = settings.PROMO_DISCOUNT
-                    logger.info(f"🎟️ Промокод {promo_code_value} застосовано — {discount_percent}% знижка")
-                elif promo_code_value:
-                    discount_percent = 0
-                    logger.warning(f"❌ Промокод {promo_code_value} недійсний")
-                else:
-                    discount_percent = 0
-
-                # --- Розрахунок фінальної суми з урахуванням промокоду ---
-                base_price = event.price
-                final_amount = (base_price * (Decimal(1) - Decimal(discount_percent) / Decimal(100))).quantize(
-                    Decimal("0.01"))
-
-                # ⏳ Задаємо ліміт часу для броні (наприклад, 10 хв)
-                expiration_time = timezone.now() - timedelta(minutes=10)
-
-                # оновлюємо старі броні
-                expired_count = TicketOrder.objects.filter(
-                    payment_status="pending",
-                    created_at__lt=expiration_time
-                ).update(payment_status="expired")
-
-                if expired_count:
-                    logger.info(f"🕓 Автоматично оновлено {expired_count} старих броней у статус 'expired'")
-
-                # 🔥 Рахуємо тільки актуальні квитки (успішні + pending не старші 10 хв)
-                active_orders = TicketOrder.objects.filter(
-                    event=event,
-                    payment_status__in=["success", "pending"],
-                ).exclude(
-                    payment_status="pending",
-                    created_at__lt=expiration_time
-                ).count()
-
-                if active_orders >= event.max_tickets:
-                    return JsonResponse({"success": False, "redirect_url": "/sold-out/"})
-
-                # Створюємо замовлення
-                order = TicketOrder.objects.create(
-                    name=name,
-                    email=email,
-                    phone=phone,
-                    payment_status="pending",
-                    amount=final_amount,
-                    device_type=device_type,
-                    event=event,
-                    ticket_number=active_orders + 1
-                )
+            event = Event.objects.filter(is_active=True).first()
+            if not event:
+                return JsonResponse({"success": False, "error": "Подію не знайдено."}, status=400)
+
+            # --- Перевірка промокоду ---
+            promo_code_value = form.cleaned_data.get("promo_code", "").strip().upper()
+
+            if promo_code_value == settings.PROMO_CODE:
+                discount_percent = settings.PROMO_DISCOUNT
+                logger.info(f"🎟️ Промокод {promo_code_value} застосовано — {discount_percent}% знижка")
+            elif promo_code_value:
+                discount_percent = 0
+                logger.warning(f"❌ Промокод {promo_code_value} недійсний")
+            else:
+                discount_percent = 0
 
-                logger.info(f"📝 Створено замовлення #{order.id} (квиток №{order.ticket_number})")
+            # --- Розрахунок фінальної суми з урахуванням промокоду ---
+            base_price = event.price
+            final_amount = (base_price * (Decimal(1) - Decimal(discount_percent) / Decimal(100))).quantize(
+                Decimal("0.01"))
 
-            # Створюємо лід в KeyCRM з платежем в масиві
-            if settings.KEYCRM_API_TOKEN and settings.KEYCRM_PIPELINE_ID and settings.KEYCRM_SOURCE_ID:
-                try:
-                    keycrm = KeyCRMAPI()
+            # Бронюємо місце (лічильник події або TTL-сховище, без блокування і COUNT)
+            hold = reserve_seat(event)
+            if hold is None:
+                return JsonResponse({"success": False, "redirect_url": "/sold-out/"})
 
-                    lead_data = {
+            # Створюємо замовлення; лід у KeyCRM створює воркер create_keycrm_leads
+            try:
+                with transaction.atomic():
+                    order = TicketOrder.objects.create(
+                        name=name,
+                        email=email,
+                        phone=phone,
+                        payment_status="pending",
+                        amount=final_amount,
+                        device_type=device_type,
+                        event=event,
+                        reservation_id=hold.hold_id
+                    )
+                    enqueue_keycrm_lead("ticket", order, {
                         "title": f"Замовлення #{order.id}",
                         "pipeline_id": settings.KEYCRM_PIPELINE_ID,
                         "source_id": settings.KEYCRM_SOURCE_ID,
@@ -272,38 +241,12 @@ def submit_ticket_form(request):
                             {"uuid": "device_type", "value": device_type},
                             {"uuid": "order_id", "value": str(order.id)}
                         ]
-                    }
-
-                    logger.info(f"🔄 Відправка даних в KeyCRM для замовлення #{order.id}")
-                    lead = keycrm.create_pipeline_card(lead_data)
-
-                    if lead and lead.get('id'):
-                        order.keycrm_lead_id = lead['id']
-                        
-                        # Беремо contact_id з відповіді
-                        lead_response = lead.get('response', {})
-                        if lead_response.get('contact_id'):
-                            order.keycrm_contact_id = lead_response['contact_id']
-                        
-                        # Беремо платежі з відповіді при створенні ліда
-                        payments = lead_response.get('payments', [])
-                        
-                        logger.info(f"🔍 В відповіді при створенні ліда знайдено {len(payments)} платежів")
-                        
-                        if payments and len(payments) > 0:
-                            order.keycrm_payment_id = payments[0].get('id')
-                            logger.info(f"💾 Збережено payment_id з відповіді: {order.keycrm_payment_id}")
-                        else:
-                            logger.warning(f"⚠️ Платежі не знайдено в відповіді при створенні ліда")
-                        
-                        order.save()
-                        logger.info(f"✅ Лід {lead['id']} створено для замовлення {order.id}")
-                    else:
-                        logger.warning(f"⚠️ Не вдалося створити лід в KeyCRM для замовлення {order.id}")
-                        logger.warning(f"Відповідь KeyCRM: {lead}")
-
-                except Exception as e:
-                    logger.error(f"❌ Помилка при створенні ліда в KeyCRM: {str(e)}")
+                    })
+            except Exception:
+                release_hold(event.pk, hold)
+                raise
+
+            logger.info(f"📝 Створено замовлення #{order.id} (зайнято місць: {hold.seat})")
 
             # Додаємо інформацію про квиток у назву продукту
             # order_description = f"{event.title} — Квиток №{order.ticket_number} із {event.max_tickets}"
@@ -325,270 +268,101 @@ def submit_ticket_form(request):
 
 @csrf_exempt
 @require_http_methods(["POST"])
+@log_callback("ticket")
 def wayforpay_callback(request):
     """Webhook від WayForPay"""
+    inbox_entry = None
+    event = request.callback_event
     try:
         data = json.loads(request.body.decode("utf-8"))
-        logger.info("=== CALLBACK DATA ===")
-        logger.info(json.dumps(data, indent=2, ensure_ascii=False))
-        logger.info("=== END CALLBACK DATA ===")
+        log_payload(logger, "wayforpay_callback", data)
 
         order_reference = data.get("orderReference")
         transaction_status = data.get("transactionStatus")
         merchant_signature = data.get("merchantSignature")
+        event.update(order_reference=order_reference, transaction_status=transaction_status)
 
         if not order_reference:
+            event.update(outcome="missing_reference")
             return HttpResponse("Missing orderReference", status=400)
 
+        # Формуємо підпис для перевірки
+        expected_signature = callback_signature(data)
+        logger.debug("Callback signature: expected=%s received=%s", expected_signature, merchant_signature)
+
+        if not signatures_match(expected_signature, merchant_signature):
+            event.update(outcome="invalid_signature")
+            return HttpResponse("Invalid signature", status=403)
+
+        # Повтор того самого callback — підтверджуємо, не чіпаючи замовлення
+        inbox_entry = claim_webhook("ticket", data)
+        if inbox_entry is None:
+            event.update(outcome="duplicate")
+            return wayforpay_accept_response(order_reference)
+
         try:
             order = TicketOrder.objects.get(wayforpay_order_reference=order_reference)
-            logger.info(
-                f"Знайдено замовлення #{order.id}, KeyCRM lead id: {order.keycrm_lead_id}, payment id: {order.keycrm_payment_id}")
         except TicketOrder.DoesNotExist:
-            logger.info(f"Order not found: {order_reference}")
+            event.update(outcome="order_not_found")
+            mark_webhook_failed(inbox_entry, "Order not found")
             return HttpResponse("Order not found", status=404)
 
+        event.update(order_id=order.id)
+        logger.debug(
+            "Замовлення #%s: KeyCRM lead id=%s, payment id=%s", order.id, order.keycrm_lead_id, order.keycrm_payment_id
+        )
+
         # Перевірка на повторний callback
         if order.callback_processed and order.payment_status == "success":
-            logger.info(f"ℹ️ Callback вже оброблено для замовлення #{order.id}")
-            status = "accept"
-            ts = int(time.time())
-            sig_source = f"{order_reference};{status};{settings.WAYFORPAY_SECRET_KEY}"
-            response_signature = hmac.new(
-                settings.WAYFORPAY_SECRET_KEY.encode("utf-8"),
-                sig_source.encode("utf-8"),
-                hashlib.md5
-            ).hexdigest()
-            return JsonResponse({
-                "orderReference": order_reference,
-                "status": status,
-                "time": ts,
-                "signature": response_signature
-            })
-
-        # Формуємо підпис для перевірки
-        signature_fields = [
-            data.get("merchantAccount", ""),
-            data.get("orderReference", ""),
-            str(data.get("amount", "")),
-            data.get("currency", ""),
-            str(data.get("authCode", "")),
-            data.get("cardPan", ""),
-            str(data.get("transactionStatus", "")),
-            str(data.get("reasonCode", "")),
-        ]
-        signature_string = ";".join(signature_fields)
-        expected_signature = hmac.new(
-            settings.WAYFORPAY_SECRET_KEY.encode("utf-8"),
-            signature_string.encode("utf-8"),
-            hashlib.md5
-        ).hexdigest()
-
-        logger.info("=== CALLBACK SIGNATURE DEBUG ===")
-        logger.info(f"Expected signature: {expected_signature}")
-        logger.info(f"Received signature: {merchant_signature}")
-
-        if expected_signature != merchant_signature:
-            logger.error("=== SIGNATURE MISMATCH ===")
-            return HttpResponse("Invalid signature", status=403)
-
-        logger.info("=== SIGNATURE VALID ===")
+            event.update(outcome="already_processed")
+            mark_webhook_processed(inbox_entry)
+            return wayforpay_accept_response(order_reference)
 
         # Оновлюємо статус замовлення
-        if transaction_status == "Approved":
-            order.payment_status = "success"
-            order.callback_processed = True
-            order.name = data.get("clientFirstName", order.name)
-            order.email = data.get("clientEmail", order.email)
-            order.phone = data.get("clientPhone", order.phone)
-            order.save()
-
-            logger.info(f"✅ Замовлення #{order.id} позначено як оплачене")
-
-            # Відправка email
-            if order.email_status != "sent":
-                try:
-                    send_ticket_email_with_pdf(order)
-                    order.email_status = "sent"
-                    order.save(update_fields=["email_status"])
-                    logger.info(f"📧 Email відправлено для замовлення #{order.id}")
-                except Exception as e:
-                    logger.error(f"❌ Помилка відправки email для замовлення #{order.id}: {e}")
+        with transaction.atomic():
+            # expire_reservations може прострочити бронь між читанням вище і save() —
+            # попередній статус (і дельта місць) лише із заблокованого рядка
+            order = TicketOrder.objects.select_for_update().get(pk=order.pk)
+            previous_status = order.payment_status
+
+            if order.callback_processed and previous_status == "success":
+                outcome = "already_processed"
+            elif transaction_status == "Approved":
+                # PDF, email і KeyCRM виконує воркер run_outbox_worker
+                order.payment_status = "success"
+                order.callback_processed = True
+                order.name = data.get("clientFirstName", order.name)
+                order.email = data.get("clientEmail", order.email)
+                order.phone = data.get("clientPhone", order.phone)
+                assign_ticket_number(order)
+                # лише змінені поля — не перетираємо ID KeyCRM, які пише воркер лідів
+                order.save(update_fields=[
+                    "payment_status", "callback_processed", "name", "email", "phone", "ticket_number", "updated_at"
+                ])
+                on_payment_status_change(order, previous_status, order.payment_status)
+                enqueue_ticket_paid_jobs(order, data)
+                outcome = "paid"
             else:
-                logger.info(f"ℹ️ Email вже було відправлено для замовлення #{order.id}")
-
-            # === KeyCRM оновлення (ПРАВИЛЬНИЙ ФЛОУ згідно з документацією) ===
-            if order.keycrm_lead_id and order.keycrm_payment_id and settings.KEYCRM_API_TOKEN:
-                try:
-                    keycrm = KeyCRMAPI()
-
-                    logger.info(f"📋 Дані з WayForPay callback:")
-                    logger.info(f"   - orderReference: {data.get('orderReference')}")
-                    logger.info(f"   - authCode: {data.get('authCode')}")
-                    logger.info(f"   - amount: {data.get('amount')}")
-                    logger.info(f"   - processingDate: {data.get('processingDate')}")
-                    logger.info(f"   - order.id: {order.id}")
-
-                    transaction_attached = False
-
-                    # СТРАТЕГІЯ: Пошук у списку зовнішніх транзакцій з retry
-                    # Причина: KeyCRM потрібен час, щоб отримати транзакцію від WayForPay
-                    logger.info(f"🔄 Пошук транзакції в списку зовнішніх транзакцій")
-
-                    # Спробуємо знайти транзакцію кілька разів з затримкою
-                    max_attempts = 3
-                    wait_seconds = [2, 5, 10]  # Затримки між спробами
-
-                    callback_amount = float(data.get('amount', 0))
-                    callback_auth_code = data.get('authCode', '')
-                    callback_processing_date = data.get('processingDate', 0)
-
-                    for attempt in range(max_attempts):
-                        if transaction_attached:
-                            break
-
-                        if attempt > 0:
-                            wait_time = wait_seconds[attempt - 1]
-                            logger.info(f"⏳ Зачекаємо {wait_time} секунд перед спробою #{attempt + 1}")
-                            import time as time_module
-                            time_module.sleep(wait_time)
-
-                        logger.info(f"🔍 Спроба #{attempt + 1}: Шукаємо транзакцію")
-
-                        # Отримуємо останні транзакції (без фільтра, щоб побачити всі)
-                        transactions_result = keycrm.get_external_transactions(limit=100)
-
-                        if transactions_result:
-                            transaction_list = transactions_result.get('data', transactions_result) if isinstance(
-                                transactions_result, dict) else transactions_result
-
-                            if isinstance(transaction_list, list) and len(transaction_list) > 0:
-                                logger.info(f"📦 Отримано {len(transaction_list)} транзакцій для аналізу")
-
-                                # Шукаємо транзакцію за точною відповідністю
-                                matching_transaction = None
-
-                                for trans in transaction_list:
-                                    trans_id = trans.get('id')
-                                    trans_desc = trans.get('description', '')
-                                    trans_amount = float(trans.get('amount', 0))
-                                    trans_uuid = trans.get('uuid', '')
-                                    trans_created = trans.get('created_at', '')
-
-                                    # Критерії для точної відповідності:
-                                    # 1. Сума збігається
-                                    # 2. AuthCode або orderReference згадується в description або uuid
-                                    matches_amount = abs(trans_amount - callback_amount) < 0.01
-                                    matches_auth_code = callback_auth_code and callback_auth_code in trans_desc
-                                    matches_order_ref = order.wayforpay_order_reference in trans_desc or order.wayforpay_order_reference in trans_uuid
-                                    matches_order_id = f"#{order.id}" in trans_desc or f"#{order.id} " in trans_desc
-
-                                    logger.info(f"   🔍 Перевірка транзакції ID: {trans_id}")
-                                    logger.info(f"      - Description: {trans_desc[:100]}")
-                                    logger.info(f"      - Amount: {trans_amount} (потрібно: {callback_amount})")
-                                    logger.info(f"      - UUID: {trans_uuid}")
-                                    logger.info(
-                                        f"      - Matches: amount={matches_amount}, auth={matches_auth_code}, order_ref={matches_order_ref}, order_id={matches_order_id}")
-
-                                    # Якщо знайшли точну відповідність
-                                    if matches_amount and (matches_auth_code or matches_order_ref):
-                                        matching_transaction = trans
-                                        logger.info(f"✅ ЗНАЙДЕНО ВІДПОВІДНУ ТРАНЗАКЦІЮ!")
-                                        break
-
-                                    # Якщо є лише по order.id - це може бути менш надійно
-                                    elif matches_amount and matches_order_id and not matching_transaction:
-                                        matching_transaction = trans
-                                        logger.info(f"⚠️ Знайдено можливу відповідність по order.id (менш надійно)")
-
-                                if matching_transaction:
-                                    transaction_id = matching_transaction.get('id')
-                                    logger.info(f"🎯 Використовуємо транзакцію ID: {transaction_id}")
-
-                                    # Прив'язуємо транзакцію
-                                    attach_result = keycrm.attach_external_transaction_by_id(
-                                        payment_id=order.keycrm_payment_id,
-                                        transaction_id=transaction_id
-                                    )
-
-                                    if attach_result:
-                                        logger.info(
-                                            f"✅ Транзакцію {transaction_id} успішно прив'язано до платежу {order.keycrm_payment_id}")
-                                        transaction_attached = True
-                                        break
-                                    else:
-                                        logger.warning(f"⚠️ Не вдалося прив'язати транзакцію {transaction_id}")
-                                else:
-                                    logger.warning(f"⚠️ Відповідну транзакцію не знайдено в спробі #{attempt + 1}")
-
-                    # Якщо після всіх спроб транзакцію не знайдено - оновлюємо статус вручну
-                    if not transaction_attached:
-                        logger.warning(f"⚠️ Зовнішню транзакцію не знайдено після {max_attempts} спроб")
-                        logger.info(f"🔄 Оновлення статусу платежу вручну")
-
-                        payment_description = f"Замовлення #{order.wayforpay_order_reference}. Клієнт: {order.name}, {order.phone}, {order.email}. AuthCode: {callback_auth_code}"
-
-                        manual_update = keycrm.update_lead_payment_status(
-                            lead_id=order.keycrm_lead_id,
-                            payment_id=order.keycrm_payment_id,
-                            status="paid",
-                            description=payment_description
-                        )
-
-                        if manual_update:
-                            logger.info(f"✅ Статус платежу {order.keycrm_payment_id} оновлено вручну на 'paid'")
-                        else:
-                            logger.error(f"❌ Не вдалося оновити статус платежу вручну")
-                    else:
-                        logger.info(f"🎉 Транзакцію успішно прив'язано! Статус платежу автоматично оновлений в KeyCRM")
-
-                except Exception as e:
-                    logger.error(f"❌ Помилка при роботі з KeyCRM: {e}")
-                    import traceback
-                    logger.error(f"Traceback: {traceback.format_exc()}")
-
-            else:
-                if not order.keycrm_payment_id:
-                    logger.warning(f"⚠️ KeyCRM payment_id відсутній для замовлення #{order.id}")
-                if not settings.KEYCRM_API_TOKEN:
-                    logger.warning(f"⚠️ KEYCRM_API_TOKEN не налаштований")
-
-        elif transaction_status == "Declined":
-            order.payment_status = "failed"
-            order.callback_processed = True
-            order.save()
-            logger.info(f"❌ Оплата відхилена для замовлення #{order.id}")
-
+                order.payment_status = "failed"
+                order.callback_processed = True
+                order.save(update_fields=["payment_status", "callback_processed", "updated_at"])
+                on_payment_status_change(order, previous_status, order.payment_status)
+                outcome = "declined" if transaction_status == "Declined" else "unknown_status"
+
+        if outcome == "paid":
+            event.update(outcome=outcome, ticket_number=order.ticket_number)
         else:
-            order.payment_status = "failed"
-            order.callback_processed = True
-            order.save()
-            logger.info(f"⚠️ Невідомий статус транзакції: {transaction_status}")
+            event.update(outcome=outcome)
 
         # Підтвердження для WayForPay
-        status = "accept"
-        ts = int(time.time())
-        sig_source = f"{order_reference};{status};{settings.WAYFORPAY_SECRET_KEY}"
-
-        response_signature = hmac.new(
-            settings.WAYFORPAY_SECRET_KEY.encode("utf-8"),
-            sig_source.encode("utf-8"),
-            hashlib.md5
-        ).hexdigest()
-
-        response_data = {
-            "orderReference": order_reference,
-            "status": status,
-            "time": ts,
-            "signature": response_signature,
-        }
-
+        response_data = accept_response(order_reference)
+        mark_webhook_processed(inbox_entry)
         return JsonResponse(response_data, status=200)
 
     except Exception as e:
-        logger.error(f"❌ Callback error: {str(e)}")
-        import traceback
-        logger.error(f"Traceback: {traceback.format_exc()}")
+        mark_webhook_failed(inbox_entry, str(e))
+        event.update(outcome="error")
+        logger.exception("❌ Callback error: %s", e)
         return HttpResponse(f"Error: {str(e)}", status=400)
 
 
@@ -772,75 +546,54 @@ def find_subscription_by_callback(order_reference, client_email, client_phone):
             subscription = SubscriptionOrder.objects.get(
                 wayforpay_order_reference=order_reference
             )
-            logger.info(f"✅ Знайдено підписку #{subscription.id} за order_reference")
+            logger.debug("Знайдено підписку #%s за order_reference", subscription.id)
             return subscription
         except SubscriptionOrder.DoesNotExist:
-            logger.info(f"⚠️ Підписку за order_reference '{order_reference}' не знайдено")
+            logger.debug("Підписку за order_reference %r не знайдено", order_reference)
+
+    email_key = normalize_email(client_email)
+    client_phone_key = phone_key(client_phone)
+    pending = SubscriptionOrder.objects.filter(
+        payment_status='pending',
+        callback_processed=False
+    ).order_by('-created_at')
 
     # 2. ✅ ГОЛОВНЕ: Пошук за email + phone (найнадійніший для кнопки)
-    if client_email and client_phone:
-        # Нормалізуємо телефон (видаляємо всі символи крім цифр)
-        phone_digits = ''.join(filter(str.isdigit, client_phone))
-
-        # Шукаємо за email та останніми 9 цифрами телефону
-        subscriptions = SubscriptionOrder.objects.filter(
-            email=client_email,
-            payment_status='pending',
-            callback_processed=False
-        ).order_by('-created_at')
-
-        for sub in subscriptions:
-            sub_phone_digits = ''.join(filter(str.isdigit, sub.phone))
-            # Порівнюємо останні 9 цифр (без коду країни)
-            if phone_digits[-9:] == sub_phone_digits[-9:]:
-                logger.info(f"✅ Знайдено підписку #{sub.id} за email+phone")
-                sub.wayforpay_order_reference = order_reference
-                sub.save()
-                return sub
+    if email_key and client_phone_key:
+        # Порівнюємо email і останні 9 цифр телефону (без коду країни) — індексні колонки
+        sub = pending.filter(email_normalized=email_key, phone_key=client_phone_key).first()
+        if sub:
+            logger.debug("Знайдено підписку #%s за email+phone", sub.id)
+            sub.wayforpay_order_reference = order_reference
+            sub.save(update_fields=["wayforpay_order_reference", "updated_at"])
+            return sub
 
     # 3. Пошук за часом створення (якщо email не збігся, але час недавній)
-    from django.utils import timezone
-    from datetime import timedelta
-
-    if client_email or client_phone:
-        time_threshold = timezone.now() - timedelta(minutes=5)  # Збільшено до 15 хв
-
-        recent_subscriptions = SubscriptionOrder.objects.filter(
-            payment_status='pending',
-            callback_processed=False,
-            created_at__gte=time_threshold
-        ).order_by('-created_at')
-
-        logger.info(f"🔍 Знайдено {recent_subscriptions.count()} недавніх підписок")
-
-        for sub in recent_subscriptions:
-            # Порівнюємо email (case-insensitive)
-            email_match = client_email and sub.email.lower() == client_email.lower()
-
-            # Порівнюємо телефони (останні 9 цифр)
-            phone_match = False
-            if client_phone:
-                client_phone_digits = ''.join(filter(str.isdigit, client_phone))
-                sub_phone_digits = ''.join(filter(str.isdigit, sub.phone))
-                phone_match = client_phone_digits[-9:] == sub_phone_digits[-9:]
-
-            if email_match or phone_match:
-                logger.info(f"✅ Знайдено підписку #{sub.id} за часом створення (email={email_match}, phone={phone_match})")
-                sub.wayforpay_order_reference = order_reference
-                sub.save()
-                return sub
+    recent = pending.filter(created_at__gte=timezone.now() - timedelta(minutes=5))
+
+    if email_key or client_phone_key:
+        contact_match = Q()
+        if email_key:
+            contact_match |= Q(email_normalized=email_key)
+        if client_phone_key:
+            contact_match |= Q(phone_key=client_phone_key)
+
+        sub = recent.filter(contact_match).first()
+        if sub:
+            email_match = bool(email_key) and sub.email_normalized == email_key
+            phone_match = bool(client_phone_key) and sub.phone_key == client_phone_key
+            logger.debug("Знайдено підписку #%s за часом створення (email=%s, phone=%s)", sub.id, email_match, phone_match)
+            sub.wayforpay_order_reference = order_reference
+            sub.save(update_fields=["wayforpay_order_reference", "updated_at"])
+            return sub
 
     # 4. Останній варіант: якщо є лише 1 незавершена підписка за останні 15 хв
-    recent_single = SubscriptionOrder.objects.filter(
-        payment_status='pending',
-        callback_processed=False,
-        created_at__gte=timezone.now() - timedelta(minutes=5)
-    ).order_by('-created_at').first()
+    recent_single = recent.first()
 
     if recent_single:
-        logger.warning(f"⚠️ Використано резервний варіант: підписка #{recent_single.id}")
+        logger.warning("⚠️ Використано резервний варіант: підписка #%s", recent_single.id)
         recent_single.wayforpay_order_reference = order_reference
-        recent_single.save()
+        recent_single.save(update_fields=["wayforpay_order_reference", "updated_at"])
         return recent_single
 
     return None
@@ -851,15 +604,23 @@ def update_keycrm_payment(subscription, wfp_data):
     Оновлює платіж у KeyCRM після успішної транзакції WayForPay.
     Працює з автоматичним пошуком транзакції та ручним апдейтом, якщо не знайдено.
     """
+    if not subscription.keycrm_payment_id and keycrm_lead_pending("subscription", subscription.id):
+        logger.info("ℹ️ Лід підписки #%s ще в черзі — платіж буде створено одразу як 'paid'", subscription.id)
+        return
+
     if not (subscription.keycrm_lead_id and subscription.keycrm_payment_id and settings.KEYCRM_API_TOKEN):
-        logger.warning(f"⚠️ Відсутні дані для KeyCRM: lead_id={subscription.keycrm_lead_id}, payment_id={subscription.keycrm_payment_id}")
+        logger.warning(
+            "⚠️ Відсутні дані для KeyCRM: lead_id=%s, payment_id=%s",
+            subscription.keycrm_lead_id, subscription.keycrm_payment_id,
+        )
         return
 
-    keycrm = KeyCRMAPI()
+    # Виклик у запиті WayForPay: без повторів і з коротким очікуванням ліміту
+    keycrm = KeyCRMAPI(max_retries=0, max_wait=getattr(settings, "KEYCRM_CALLBACK_MAX_WAIT", 2))
     callback_auth_code = wfp_data.get("authCode", "")
     order_reference = wfp_data.get("orderReference", "")
 
-    logger.warning(f"⚠️Оновлюємо транзакцію вручну.")
+    logger.debug("Оновлюємо платіж підписки #%s у KeyCRM вручну", subscription.id)
     extra_parts = []
     if subscription.wfp_email and subscription.wfp_email != subscription.email:
         extra_parts.append(f"email={subscription.wfp_email}")
@@ -881,20 +642,21 @@ def update_keycrm_payment(subscription, wfp_data):
         description=payment_description
     )
     if manual_update:
-        logger.info(f"✅ Статус платежу {subscription.keycrm_payment_id} оновлено вручну на 'paid'")
+        logger.info("✅ Статус платежу %s оновлено вручну на 'paid'", subscription.keycrm_payment_id)
     else:
-        logger.error(f"❌ Не вдалось оновити статус платежу вручну")
+        logger.error("❌ Не вдалось оновити статус платежу %s вручну", subscription.keycrm_payment_id)
 
 
 @csrf_exempt
 @require_http_methods(["POST"])
+@log_callback("subscription")
 def wayforpay_subscription_callback(request):
     """Webhook від WayForPay для підписок"""
+    inbox_entry = None
+    event = request.callback_event
     try:
         data = json.loads(request.body.decode("utf-8"))
-        logger.info("=== CALLBACK DATA ===")
-        logger.info(json.dumps(data, indent=2, ensure_ascii=False))
-        logger.info("=== END CALLBACK DATA ===")
+        log_payload(logger, "wayforpay_subscription_callback", data)
 
         order_reference = data.get("orderReference")
         transaction_status = data.get("transactionStatus")
@@ -915,80 +677,62 @@ def wayforpay_subscription_callback(request):
             ""
         ).strip()
 
-        logger.info(f"🔍 Пошук підписки:")
-        logger.info(f"   - orderReference: {order_reference}")
-        logger.info(f"   - email: {client_email}")
-        logger.info(f"   - phone: {client_phone}")
+        event.update(order_reference=order_reference, transaction_status=transaction_status)
+        logger.debug("Пошук підписки: orderReference=%s email=%s phone=%s", order_reference, client_email, client_phone)
 
         if not order_reference:
-            logger.error("❌ Відсутній orderReference у callback")
+            event.update(outcome="missing_reference")
             return HttpResponse("Missing orderReference", status=400)
 
+        # --- Перевірка підпису WayForPay ---
+        expected_signature = callback_signature(data)
+        logger.debug("Callback signature: expected=%s received=%s", expected_signature, merchant_signature)
+
+        if not signatures_match(expected_signature, merchant_signature):
+            event.update(outcome="invalid_signature")
+            return HttpResponse("Invalid signature", status=403)
+
+        # Повтор того самого callback — підтверджуємо, не чіпаючи підписку
+        inbox_entry = claim_webhook("subscription", data)
+        if inbox_entry is None:
+            event.update(outcome="duplicate")
+            return wayforpay_accept_response(order_reference)
+
         # --- КРИТИЧНО: Знаходимо підписку за різними критеріями ---
         subscription = find_subscription_by_callback(order_reference, client_email, client_phone)
 
         if not subscription:
-            logger.error(f"❌ Підписку не знайдено! order_reference={order_reference}, email={client_email}, phone={client_phone}")
-            
-            # Додаткова діагностика
-            logger.info("📊 Статистика незавершених підписок:")
-            pending_subs = SubscriptionOrder.objects.filter(
-                payment_status='pending',
-                callback_processed=False
-            ).order_by('-created_at')[:5]
-            
-            for sub in pending_subs:
-                logger.info(f"   - ID: {sub.id}, Email: {sub.email}, Phone: {sub.phone}, Created: {sub.created_at}")
-            
+            event.update(outcome="subscription_not_found")
+            logger.error(
+                "❌ Підписку не знайдено! order_reference=%s, email=%s, phone=%s",
+                order_reference, client_email, client_phone,
+            )
+
+            # Додаткова діагностика — лише для вибірки запитів
+            if should_sample():
+                pending_subs = SubscriptionOrder.objects.filter(
+                    payment_status='pending',
+                    callback_processed=False
+                ).order_by('-created_at')[:5]
+                for sub in pending_subs:
+                    logger.info(
+                        "📊 Незавершена підписка: ID=%s, Email=%s, Phone=%s, Created=%s",
+                        sub.id, sub.email, sub.phone, sub.created_at,
+                    )
+
+            mark_webhook_failed(inbox_entry, "Subscription not found")
             return HttpResponse("Subscription not found", status=404)
 
-        logger.info(f"✅ Знайдено підписку #{subscription.id}")
+        event.update(order_id=subscription.id)
+        # стан регулярки у WayForPay змінився — STATUS запитаємо на найближчому запуску синхронізації
+        mark_sync_due(order_reference)
 
         # --- Перевірка на повторний callback ---
         if subscription.callback_processed and subscription.payment_status == "success":
-            logger.info(f"ℹ️ Callback вже оброблено для підписки #{subscription.id}")
-            status = "accept"
-            ts = int(time.time())
-            sig_source = f"{order_reference};{status};{settings.WAYFORPAY_SECRET_KEY}"
-            response_signature = hmac.new(
-                settings.WAYFORPAY_SECRET_KEY.encode("utf-8"),
-                sig_source.encode("utf-8"),
-                hashlib.md5
-            ).hexdigest()
-            return JsonResponse({
-                "orderReference": order_reference,
-                "status": status,
-                "time": ts,
-                "signature": response_signature
-            })
+            event.update(outcome="already_processed")
+            mark_webhook_processed(inbox_entry)
+            return wayforpay_accept_response(order_reference)
 
-        # --- Перевірка підпису WayForPay ---
-        signature_fields = [
-            data.get("merchantAccount", ""),
-            data.get("orderReference", ""),
-            str(data.get("amount", "")),
-            data.get("currency", ""),
-            str(data.get("authCode", "")),
-            data.get("cardPan", ""),
-            str(data.get("transactionStatus", "")),
-            str(data.get("reasonCode", "")),
-        ]
-        signature_string = ";".join(signature_fields)
-        expected_signature = hmac.new(
-            settings.WAYFORPAY_SECRET_KEY.encode("utf-8"),
-            signature_string.encode("utf-8"),
-            hashlib.md5
-        ).hexdigest()
-
-        logger.info(f"🔐 Перевірка підпису:")
-        logger.info(f"   Expected: {expected_signature}")
-        logger.info(f"   Received: {merchant_signature}")
-        
-        if expected_signature != merchant_signature:
-            logger.error("❌ Підпис не збігається!")
-            return HttpResponse("Invalid signature", status=403)
-        
-        logger.info("✅ Підпис валідний")
 
         # --- Оновлюємо статус підписки ---
         if transaction_status == "Approved":
@@ -1003,33 +747,33 @@ def wayforpay_subscription_callback(request):
                     subscription.name = client_name
                     subscription.wfp_name = client_name
                 else:
-                    logger.info("ℹ️ WayForPay повернув placeholder clientName, залишаємо імʼя з форми.")
+                    logger.debug("WayForPay повернув placeholder clientName, залишаємо імʼя з форми")
 
             # ❗️Важливо: email НЕ оновлюємо, лишаємо той, що з форми
             if client_email and client_email != subscription.email.lower():
-                logger.info(
-                    f"ℹ️ Email з WayForPay ({client_email}) "
-                    f"відрізняється від email форми ({subscription.email}). "
-                    f"Лист буде відправлено на email з форми."
+                event.update(email_mismatch=True)
+                logger.debug(
+                    "Email з WayForPay (%s) відрізняється від email форми (%s), лист піде на email з форми",
+                    client_email, subscription.email,
                 )
             if client_email:
                 subscription.wfp_email = client_email
 
             # ❗️ Телефон також НЕ оновлюємо — залишаємо з форми
             if client_phone:
-                form_phone_digits = ''.join(filter(str.isdigit, subscription.phone))
-                callback_phone_digits = ''.join(filter(str.isdigit, client_phone))
-
-                if form_phone_digits[-9:] != callback_phone_digits[-9:]:
-                    logger.info(
-                        f"ℹ️ Телефон з WayForPay ({client_phone}) "
-                        f"не збігається з телефоном з форми ({subscription.phone}). "
-                        f"Залишаємо телефон із форми."
+                if subscription.phone_key != phone_key(client_phone):
+                    event.update(phone_mismatch=True)
+                    logger.debug(
+                        "Телефон з WayForPay (%s) не збігається з телефоном з форми (%s), залишаємо телефон із форми",
+                        client_phone, subscription.phone,
                     )
                 subscription.wfp_phone = client_phone
-            
-            subscription.save()
-            logger.info(f"✅ Підписка #{subscription.id} позначена як оплачена")
+
+            subscription.save(update_fields=[
+                "payment_status", "callback_processed", "wayforpay_order_reference",
+                "name", "wfp_name", "wfp_email", "wfp_phone", "updated_at",
+            ])
+            event.update(outcome="paid")
 
             # Відправка email з підтвердженням
             send_subscription_confirmation_email(subscription)
@@ -1041,38 +785,24 @@ def wayforpay_subscription_callback(request):
             subscription.payment_status = "failed"
             subscription.callback_processed = True
             subscription.wayforpay_order_reference = order_reference
-            subscription.save()
-            logger.info(f"❌ Оплата підписки відхилена #{subscription.id}")
+            subscription.save(update_fields=["payment_status", "callback_processed", "wayforpay_order_reference", "updated_at"])
+            event.update(outcome="declined")
         else:
             subscription.payment_status = "failed"
             subscription.callback_processed = True
             subscription.wayforpay_order_reference = order_reference
-            subscription.save()
-            logger.info(f"⚠️ Невідомий статус транзакції: {transaction_status}")
+            subscription.save(update_fields=["payment_status", "callback_processed", "wayforpay_order_reference", "updated_at"])
+            event.update(outcome="unknown_status")
 
         # --- Відправляємо підтвердження WayForPay ---
-        status = "accept"
-        ts = int(time.time())
-        sig_source = f"{order_reference};{status};{settings.WAYFORPAY_SECRET_KEY}"
-        response_signature = hmac.new(
-            settings.WAYFORPAY_SECRET_KEY.encode("utf-8"),
-            sig_source.encode("utf-8"),
-            hashlib.md5
-        ).hexdigest()
-
-        response_data = {
-            "orderReference": order_reference,
-            "status": status,
-            "time": ts,
-            "signature": response_signature,
-        }
-        logger.info(f"✅ Відправка підтвердження WayForPay: {response_data}")
+        response_data = accept_response(order_reference)
+        mark_webhook_processed(inbox_entry)
         return JsonResponse(response_data, status=200)
 
     except Exception as e:
-        logger.error(f"❌ Callback error: {str(e)}")
-        import traceback
-        logger.error(f"Traceback: {traceback.format_exc()}")
+        mark_webhook_failed(inbox_entry, str(e))
+        event.update(outcome="error")
+        logger.exception("❌ Callback error: %s", e)
         return HttpResponse(f"Error: {str(e)}", status=400)
 
 
@@ -1095,92 +825,60 @@ def submit_subscription_form(request):
             ua_string = request.META.get("HTTP_USER_AGENT", "").lower()
             device_type = "mobile" if "mobi" in ua_string else "desktop"
 
-            subscription = SubscriptionOrder.objects.create(
-                name=name,
-                email=email,
-                phone=phone,
-                payment_status="pending",
-                device_type=device_type,
-                utm_source=utm_source,
-                utm_medium=utm_medium,
-                utm_campaign=utm_campaign,
-                utm_term=utm_term,
-                utm_content=utm_content
-            )
+            # Лід у KeyCRM створює воркер create_keycrm_leads
+            with transaction.atomic():
+                subscription = SubscriptionOrder.objects.create(
+                    name=name,
+                    email=email,
+                    phone=phone,
+                    payment_status="pending",
+                    device_type=device_type,
+                    utm_source=utm_source,
+                    utm_medium=utm_medium,
+                    utm_campaign=utm_campaign,
+                    utm_term=utm_term,
+                    utm_content=utm_content
+                )
+                enqueue_keycrm_lead("subscription", subscription, {
+                    "title": f"Підписка #{subscription.id}",
+                    "pipeline_id": settings.KEYCRM_SUBSCRIPTION_PIPELINE_ID,
+                    "source_id": settings.KEYCRM_SOURCE_ID,
+                    "manager_comment": "Лендінг: Місячна підписка PASUE City",
+                    "contact": {
+                        "full_name": name,
+                        "email": email,
+                        "phone": phone
+                    },
+                    "utm_source": utm_source,
+                    "utm_medium": utm_medium,
+                    "utm_campaign": utm_campaign,
+                    "utm_term": utm_term,
+                    "utm_content": utm_content,
+                    "products": [
+                        {
+                            "sku": f"subscription-{subscription.id}",
+                            "price": 350.00,
+                            "quantity": 1,
+                            "unit_type": "шт",
+                            "name": "Місячна підписка PASUE City"
+                        }
+                    ],
+                    "payments": [
+                        {
+                            "payment_method": "WayForPay",
+                            "amount": 350.00,
+                            "description": "Очікування оплати",
+                            "status": "not_paid"
+                        }
+                    ],
+                    "custom_fields": [
+                        {"uuid": "device_type", "value": device_type},
+                        {"uuid": "subscription_id", "value": str(subscription.id)}
+                    ]
+                })
 
             logger.info(f"🎫 Створено замовлення підписки #{subscription.id}")
 
-            if settings.KEYCRM_API_TOKEN and settings.KEYCRM_SUBSCRIPTION_PIPELINE_ID and settings.KEYCRM_SOURCE_ID:
-                try:
-                    keycrm = KeyCRMAPI()
-
-                    lead_data = {
-                        "title": f"Підписка #{subscription.id}",
-                        "pipeline_id": settings.KEYCRM_SUBSCRIPTION_PIPELINE_ID,
-                        "source_id": settings.KEYCRM_SOURCE_ID,
-                        "manager_comment": "Лендінг: Місячна підписка PASUE City",
-                        "contact": {
-                            "full_name": name,
-                            "email": email,
-                            "phone": phone
-                        },
-                        "utm_source": utm_source,
-                        "utm_medium": utm_medium,
-                        "utm_campaign": utm_campaign,
-                        "utm_term": utm_term,
-                        "utm_content": utm_content,
-                        "products": [
-                            {
-                                "sku": f"subscription-{subscription.id}",
-                                "price": 350.00,
-                                "quantity": 1,
-                                "unit_type": "шт",
-                                "name": "Місячна підписка PASUE City"
-                            }
-                        ],
-                        "payments": [
-                            {
-                                "payment_method": "WayForPay",
-                                "amount": 350.00,
-                                "description": "Очікування оплати",
-                                "status": "not_paid"
-                            }
-                        ],
-                        "custom_fields": [
-                            {"uuid": "device_type", "value": device_type},
-                            {"uuid": "subscription_id", "value": str(subscription.id)}
-                        ]
-                    }
-
-                    logger.info(f"📤 Відправка даних в KeyCRM для підписки #{subscription.id}")
-                    lead = keycrm.create_pipeline_card(lead_data)
-
-                    if lead and lead.get('id'):
-                        subscription.keycrm_lead_id = lead['id']
-
-                        lead_response = lead.get('response', {})
-                        if lead_response.get('contact_id'):
-                            subscription.keycrm_contact_id = lead_response['contact_id']
-
-                        payments = lead_response.get('payments', [])
-
-                        logger.info(f"🔍 В відповіді при створенні ліда знайдено {len(payments)} платежів")
-
-                        if payments and len(payments) > 0:
-                            subscription.keycrm_payment_id = payments[0].get('id')
-                            logger.info(f"💾 Збережено payment_id з відповіді: {subscription.keycrm_payment_id}")
-                        else:
-                            logger.warning(f"⚠️ Платежі не знайдено в відповіді при створенні ліда")
-
-                        subscription.save()
-                        logger.info(f"✅ Ліда {lead['id']} створено для підписки {subscription.id}")
-                    else:
-                        logger.warning(f"⚠️ Не вдалось створити ліда у KeyCRM для підписки {subscription.id}")
-                        logger.warning(f"Відповідь KeyCRM: {lead}")
-
-                except Exception as e:
-                    logger.error(f"❌ Помилка при створенні ліда у KeyCRM: {str(e)}")
-
             return JsonResponse({"success": True, "subscription_id": subscription.id})
         else:
             return JsonResponse({
@@ -1203,14 +901,12 @@ def send_subscription_confirmation_email(subscription):
     bot_url = f"https://t.me/Pasue_club_bot?start=subscribe_{token_obj.token}"
 
     # TXT
-    text_content = render_to_string(
-        "emails/subscription_confirmation.txt",
+    text_content = SUBSCRIPTION_CONFIRMATION_TXT.render(
         {"subscription": subscription, "bot_url": bot_url}
     ).strip()
 
     # HTML
-    html_content = render_to_string(
-        "emails/subscription_confirmation.html",
+    html_content = SUBSCRIPTION_CONFIRMATION_HTML.render(
         {"subscription": subscription, "bot_url": bot_url}
     )
 
@@ -1335,7 +1031,7 @@ def get_order_by_token(request):
 def generate_free_ticket(request):
     """
     Створює безкоштовний квиток (без WayForPay), надсилає лист з QR
-    і створює ліда в KeyCRM.
+    і ставить у чергу створення ліда в KeyCRM.
     """
     name = request.GET.get("name", "Тест Користувач")
     email = request.GET.get("email", "test@example.com")
@@ -1348,24 +1044,15 @@ def generate_free_ticket(request):
     utm_term = request.GET.get("utm_term", "")
     utm_content = request.GET.get("utm_content", "")
 
-    with transaction.atomic():
-        event = Event.objects.filter(is_active=True).first()
-        if not event:
-            return JsonResponse({"success": False, "error": "Подію не знайдено."}, status=400)
-
-        expiration_time = timezone.now() - timedelta(minutes=10)
-        expired_count = TicketOrder.objects.filter(
-            payment_status="pending",
-            created_at__lt=expiration_time
-        ).update(payment_status="expired")
+    event = Event.objects.filter(is_active=True).first()
+    if not event:
+        return JsonResponse({"success": False, "error": "Подію не знайдено."}, status=400)
 
-        active_orders = TicketOrder.objects.filter(
-            event=event,
-            payment_status__in=["success", "pending"],
-        ).exclude(
-            payment_status="pending",
-            created_at__lt=expiration_time
-        ).count()
+    # Лічильники події заблоковані до коміту; лід KeyCRM створює воркер create_keycrm_leads
+    with transaction.atomic():
+        # безкоштовний квиток видається навіть понад ліміт
+        add_seats(event)
+        ticket_number = allocate_ticket_numbers(event.pk)[0]
 
         # 💡 якщо хочеш повністю free — зроби amount = Decimal("0.00")
         amount = event.price  # або Decimal("0.00") для 100% безкоштовного подарунка
@@ -1378,68 +1065,41 @@ def generate_free_ticket(request):
             amount=amount,
             device_type="manual",
             event=event,
-            ticket_number=active_orders + 1
+            ticket_number=ticket_number
         )
 
-        logger.info(f"🎟️ Безкоштовний квиток створено #{order.id} для {name}")
-
-        # --- Створюємо ліда в KeyCRM ---
-        if settings.KEYCRM_API_TOKEN and settings.KEYCRM_PIPELINE_ID and settings.KEYCRM_SOURCE_ID:
-            try:
-                keycrm = KeyCRMAPI()
-
-                product_name = f"Безкоштовний квиток на {event.title}"
-
-                lead_data = {
-                    "title": f"Безкоштовний квиток #{order.id}",
-                    "pipeline_id": settings.KEYCRM_PIPELINE_ID,
-                    "source_id": settings.KEYCRM_SOURCE_ID,
-                    "manager_comment": "Безкоштовний / подарунковий квиток (створено вручну)",
-                    "contact": {
-                        "full_name": name,
-                        "email": email,
-                        "phone": phone
-                    },
-                    "utm_source": utm_source,
-                    "utm_medium": utm_medium,
-                    "utm_campaign": utm_campaign,
-                    "utm_term": utm_term,
-                    "utm_content": utm_content,
-                    "products": [
-                        {
-                            "sku": f"free-ticket-{order.id}",
-                            "price": float(order.amount),  # може бути 0.0
-                            "quantity": 1,
-                            "unit_type": "шт",
-                            "name": product_name,
-                        }
-                    ],
-                    "custom_fields": [
-                        {"uuid": "device_type", "value": order.device_type},
-                        {"uuid": "order_id", "value": str(order.id)},
-                        {"uuid": "ticket_type", "value": "free"},
-                    ]
+        lead_job = enqueue_keycrm_lead("ticket", order, {
+            "title": f"Безкоштовний квиток #{order.id}",
+            "pipeline_id": settings.KEYCRM_PIPELINE_ID,
+            "source_id": settings.KEYCRM_SOURCE_ID,
+            "manager_comment": "Безкоштовний / подарунковий квиток (створено вручну)",
+            "contact": {
+                "full_name": name,
+                "email": email,
+                "phone": phone
+            },
+            "utm_source": utm_source,
+            "utm_medium": utm_medium,
+            "utm_campaign": utm_campaign,
+            "utm_term": utm_term,
+            "utm_content": utm_content,
+            "products": [
+                {
+                    "sku": f"free-ticket-{order.id}",
+                    "price": float(order.amount),  # може бути 0.0
+                    "quantity": 1,
+                    "unit_type": "шт",
+                    "name": f"Безкоштовний квиток на {event.title}",
                 }
+            ],
+            "custom_fields": [
+                {"uuid": "device_type", "value": order.device_type},
+                {"uuid": "order_id", "value": str(order.id)},
+                {"uuid": "ticket_type", "value": "free"},
+            ]
+        })
 
-                logger.info(f"📤 Відправка даних в KeyCRM для безкоштовного квитка #{order.id}")
-                lead = keycrm.create_pipeline_card(lead_data)
-
-                if lead and lead.get("id"):
-                    order.keycrm_lead_id = lead["id"]
-
-                    lead_response = lead.get("response", {})
-
-                    if lead_response.get("contact_id"):
-                        order.keycrm_contact_id = lead_response["contact_id"]
-
-                    order.save()
-                    logger.info(f"✅ Ліда {lead['id']} створено для безкоштовного замовлення {order.id}")
-                else:
-                    logger.warning(f"⚠️ Не вдалось створити ліда в KeyCRM для безкоштовного замовлення {order.id}")
-                    logger.warning(f"Відповідь KeyCRM: {lead}")
-
-            except Exception as e:
-                logger.error(f"❌ Помилка при створенні ліда в KeyCRM для безкоштовного квитка: {str(e)}")
+        logger.info(f"🎟️ Безкоштовний квиток створено #{order.id} для {name}")
 
     # --- Надсилання квитка на пошту ---
     try:
@@ -1452,9 +1112,10 @@ def generate_free_ticket(request):
 
     return JsonResponse({
         "success": True,
-        "message": f"Безкоштовний квиток #{order.id} створено, відправлено на {email} і додано в KeyCRM",
+        "message": f"Безкоштовний квиток #{order.id} створено, відправлено на {email}, лід KeyCRM у черзі",
         "order_id": order.id,
-        "keycrm_lead_id": getattr(order, "keycrm_lead_id", None),
+        "keycrm_lead_id": order.keycrm_lead_id,
+        "keycrm_lead_pending": lead_job is not None,
     })
 
 
@@ -1523,47 +1184,80 @@ def send_email_to_active_users(request):
         )
 
     if test_email:
-        emails = [test_email]
-    else:
-        emails = list(
-            SubscriptionOrder.objects.filter(payment_status="success")
-            .exclude(email__isnull=True)
-            .exclude(email="")
-            .values_list("email", flat=True)
-            .distinct()
-        )
-
-    if not emails:
-        return JsonResponse({"sent": 0, "failed": 0, "total": 0})
-
-    chunk_size = 100
-    sent = 0
-    failed = 0
-
-    for offset in range(0, len(emails), chunk_size):
-        chunk = emails[offset:offset + chunk_size]
         try:
             email = EmailMultiAlternatives(
                 subject=subject,
                 body=text_body,
                 from_email=settings.DEFAULT_FROM_EMAIL,
-                to=chunk if test_email else [settings.DEFAULT_FROM_EMAIL],
-                bcc=None if test_email else chunk,
+                to=[test_email],
             )
             if html_body:
                 email.attach_alternative(html_body, "text/html")
             email.send(fail_silently=False)
-            sent += len(chunk)
         except Exception as exc:
-            failed += len(chunk)
-            logger.error(f"Bulk email send failed for chunk starting at {offset}: {exc}")
+            logger.error(f"Test email send failed for {test_email}: {exc}")
+            return JsonResponse({"sent": 0, "failed": 1, "total": 1})
+        return JsonResponse({"sent": 1, "failed": 0, "total": 1})
+
+    # Розсилку активним підписникам виконує воркер (run_outbox_worker)
+    with transaction.atomic():
+        campaign = EmailCampaign.objects.create(
+            subject=subject,
+            template=template_base,
+            text_body=text_body,
+            html_body=html_body,
+        )
+        enqueue("email_campaign", {"campaign_id": campaign.id})
+
+    logger.info(f"📬 Створено розсилку #{campaign.id}: {subject}")
 
     return JsonResponse(
-        {"sent": sent, "failed": failed, "total": len(emails)},
+        _campaign_progress(campaign),
+        status=202,
         json_dumps_params={"ensure_ascii": False},
     )
 
 
+def _campaign_progress(campaign):
+    return {
+        "campaign_id": campaign.id,
+        "status": campaign.status,
+        "total": campaign.total,
+        "sent": campaign.sent,
+        "failed": campaign.failed,
+        "pending": max(campaign.total - campaign.sent - campaign.failed, 0) if campaign.recipients_loaded else None,
+        "created_at": campaign.created_at,
+        "started_at": campaign.started_at,
+        "finished_at": campaign.finished_at,
+    }
+
+
+@require_GET
+@require_internal_api_key
+def email_campaign_status(request, campaign_id):
+    """Прогрес масової розсилки"""
+    try:
+        campaign = EmailCampaign.objects.get(id=campaign_id)
+    except EmailCampaign.DoesNotExist:
+        return JsonResponse({"detail": "Not found"}, status=404)
+
+    return JsonResponse(_campaign_progress(campaign), json_dumps_params={"ensure_ascii": False})
+
+
+@require_GET
+@require_internal_api_key
+def mail_stats_api(request):
+    """Статистика SMTP-пулу поточного воркера"""
+    return JsonResponse({"pid": os.getpid(), "stats": mail_stats()})
+
+
+@require_GET
+@require_internal_api_key
+def keycrm_stats_api(request):
+    """Запити до KeyCRM, ліміт, повтори і перевикористання зʼєднань поточного воркера"""
+    return JsonResponse({"pid": os.getpid(), "stats": keycrm_http_stats()})
+
+
 @require_GET
 @require_internal_api_key
 def subscription_order_by_reference(request, order_reference: str):